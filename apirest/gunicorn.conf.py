@@ -0,0 +1,18 @@
+"""
+Gunicorn configuration, picked by SERVER_PROFILE:
+
+- wsgi (default): sync workers. A worker is busy for the whole request,
+  including reading a slow client's body and writing its response.
+- asgi: uvicorn workers. Reading and writing happen on each worker's event
+  loop, and only the view itself takes a thread.
+
+The number of workers comes from WEB_CONCURRENCY (set by Heroku), as usual.
+"""
+
+import os
+
+if os.environ.get('SERVER_PROFILE', 'wsgi') == 'asgi':
+    wsgi_app = 'apirest.asgi:application'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+else:
+    wsgi_app = 'apirest.wsgi:application'
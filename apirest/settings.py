@@ -14,6 +14,8 @@ from pathlib import Path
 from datetime import timedelta
 import os
 import environ
+from django.core.exceptions import ImproperlyConfigured
+import dj_database_url
 import django_on_heroku
 
 env = environ.Env()
@@ -67,11 +69,25 @@ REST_FRAMEWORK = {
         # 'rest_framework.authentication.BasicAuthentication',
         # 'rest_framework.authentication.SessionAuthentication',
         # 'rest_framework.authentication.TokenAuthentication',
-        'knox.auth.TokenAuthentication',
+        'mangareview.authentication.CachedTokenAuthentication',
+    ],
+    # orjson-backed JSON (see mangareview/renderers.py).
+    'DEFAULT_RENDERER_CLASSES': [
+        'mangareview.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'mangareview.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
     ],
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.AllowAny",
     ],
+    # List endpoints use keyset pagination: 20 rows per page by default,
+    # clients may ask for up to 100 with ?page_size=.
+    'DEFAULT_PAGINATION_CLASS': 'mangareview.pagination.KeysetPagination',
+    'PAGE_SIZE': 20,
     # 'DEFAULT_SCHEMA_CLASS': 'rest_framework.schemas.coreapi.AutoSchema',
 }
 
@@ -80,11 +96,14 @@ REST_KNOX = {'TOKEN_TTL': timedelta(hours=4)}
 
 
 MIDDLEWARE = [
+    'mangareview.metrics.MetricsMiddleware',
+    'mangareview.compression.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'mangareview.routers.ReplicaMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -113,14 +132,155 @@ WSGI_APPLICATION = 'apirest.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
+# Connections are kept open across requests for CONN_MAX_AGE seconds (which
+# django_on_heroku also applies to DATABASE_URL) and, with DB_HEALTH_CHECKS,
+# checked at the start of each request, so that a connection the database
+# dropped is replaced instead of failing the request. With DB_POOL, the
+# threads of each process share a pool of at most DB_POOL_SIZE connections
+# instead, replaced after CONN_MAX_AGE seconds. By default a process gets
+# its share of the DB_MAX_CONNECTIONS the database allows across the
+# WEB_CONCURRENCY processes. A thread waits up to DB_POOL_TIMEOUT seconds
+# for a free connection before failing.
+CONN_MAX_AGE = env.int('CONN_MAX_AGE', default=600)
+DB_HEALTH_CHECKS = env.bool('DB_HEALTH_CHECKS', default=True)
+DB_POOL = env.bool('DB_POOL', default=False)
+DB_MAX_CONNECTIONS = env.int('DB_MAX_CONNECTIONS', default=20)
+WEB_CONCURRENCY = env.int('WEB_CONCURRENCY', default=1)
+DB_POOL_SIZE = env.int('DB_POOL_SIZE', default=max(DB_MAX_CONNECTIONS // WEB_CONCURRENCY, 1))
+DB_POOL_TIMEOUT = env.float('DB_POOL_TIMEOUT', default=10)
+
+# Read replicas: comma-separated URLs of copies of the default database,
+# e.g. Heroku followers or, to try it locally, sqlite:////path/to/copy.sqlite3.
+# GET, HEAD and OPTIONS requests then read from them (see
+# mangareview/routers.py), except for users who wrote in the last
+# REPLICA_PIN_SECONDS seconds, so they see their own writes. Those pins live
+# in the default cache, so it should be shared between processes. Replicas
+# more than REPLICA_MAX_LAG seconds behind (checked every
+# REPLICA_LAG_CHECK_INTERVAL seconds, on Postgres only) are skipped, and
+# REPLICA_READS=false sends every read back to the primary.
+DATABASE_REPLICA_URLS = env.list('DATABASE_REPLICA_URLS', default=[])
+REPLICA_READS = env.bool('REPLICA_READS', default=True)
+REPLICA_PIN_SECONDS = env.int('REPLICA_PIN_SECONDS', default=5)
+REPLICA_MAX_LAG = env.float('REPLICA_MAX_LAG', default=5)
+REPLICA_LAG_CHECK_INTERVAL = env.float('REPLICA_LAG_CHECK_INTERVAL', default=5)
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': CONN_MAX_AGE,
     }
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+
+# The 'responses' cache holds the rendered bodies of the public read
+# endpoints (see mangareview/cache.py). The default in-memory LRU lives in
+# each worker process; set RESPONSE_CACHE_DIR to a directory shared by all
+# workers so they also share the bodies.
+RESPONSE_CACHE_DIR = env('RESPONSE_CACHE_DIR', default=None)
+
+# The 'default' cache holds what the processes must agree on: revoked tokens
+# and replica pins. It lives in each process unless REDIS_URL points at a
+# Redis server (needs the redis package).
+REDIS_URL = env('REDIS_URL', default=None)
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+    } if REDIS_URL else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'responses': {
+        'BACKEND': ('mangareview.cache.FileResponseCache' if RESPONSE_CACHE_DIR
+                    else 'mangareview.cache.LRUResponseCache'),
+        'LOCATION': RESPONSE_CACHE_DIR or 'responses',
+        'TIMEOUT': env.int('RESPONSE_CACHE_TIMEOUT', default=300),
+        'OPTIONS': {
+            'MAX_ENTRIES': env.int('RESPONSE_CACHE_MAX_ENTRIES', default=1000),
+        },
+    },
+}
+
+# The generation counters a write bumps to drop cached responses (and that
+# the list ETags are built from) must be the same in every worker: they go
+# to the default cache with REDIS_URL, else next to the bodies. Without
+# either shared store, workers would serve each other's stale bodies and
+# 304s, so more than one is refused.
+RESPONSE_GENERATIONS_CACHE = 'default' if REDIS_URL else 'responses'
+if WEB_CONCURRENCY > 1 and not (REDIS_URL or RESPONSE_CACHE_DIR):
+    raise ImproperlyConfigured(
+        "WEB_CONCURRENCY > 1 needs REDIS_URL or RESPONSE_CACHE_DIR, "
+        "so that the workers share response cache invalidations.")
+
+
+# Server profile
+# 'wsgi' (sync gunicorn workers) or 'asgi' (uvicorn workers under gunicorn,
+# with async handlers for the busiest endpoints). Read by both Django and
+# apirest/gunicorn.conf.py.
+SERVER_PROFILE = env('SERVER_PROFILE', default='wsgi')
+
+
+# Rating jobs
+# Off by default: every review and like write updates the series rating in
+# its own transaction. With RATING_ASYNC, writes queue a "recompute series X"
+# job instead (a row per series, so bursts coalesce) and RATING_WORKERS
+# threads per process run the queue RATING_JOB_DELAY seconds after a write.
+# A series is never left stale for more than RATING_MAX_STALENESS seconds:
+# past that, the next write recomputes it itself (see mangareview/jobs.py).
+RATING_ASYNC = env.bool('RATING_ASYNC', default=False)
+RATING_WORKERS = env.int('RATING_WORKERS', default=1)
+RATING_JOB_DELAY = env.float('RATING_JOB_DELAY', default=0.5)
+RATING_MAX_STALENESS = env.float('RATING_MAX_STALENESS', default=10)
+
+
+# Token authentication cache
+# Validated knox tokens are remembered per process for AUTH_CACHE_TTL
+# seconds (at most AUTH_CACHE_MAX_ENTRIES of them), so most requests skip
+# the token queries. Logouts are marked in the default cache, so they take
+# effect at once in every process sharing it (see mangareview/authentication.py).
+AUTH_CACHE_TTL = env.float('AUTH_CACHE_TTL', default=10)
+AUTH_CACHE_MAX_ENTRIES = env.int('AUTH_CACHE_MAX_ENTRIES', default=10000)
+
+
+# Leaderboards
+# /leaderboards/ boards hold the top LEADERBOARD_SIZE series, updated by the
+# writes; at most half of them are served. Trending counts the reviews and
+# likes of the last LEADERBOARD_TRENDING_HOURS hours, and is recomputed every
+# LEADERBOARD_TRENDING_REFRESH seconds as its window slides.
+LEADERBOARD_SIZE = env.int('LEADERBOARD_SIZE', default=100)
+LEADERBOARD_TRENDING_HOURS = env.int('LEADERBOARD_TRENDING_HOURS', default=24)
+LEADERBOARD_TRENDING_REFRESH = env.int('LEADERBOARD_TRENDING_REFRESH', default=300)
+
+
+# Recommendations
+# /series/<id>/similar/ and /users/<id>/recommended/ serve what
+# `manage.py build_recommendations` last computed: RECOMMENDATIONS_SIZE
+# series per series and per user.
+RECOMMENDATIONS_SIZE = env.int('RECOMMENDATIONS_SIZE', default=20)
+
+
+# JSON and compression
+# JSON is rendered and parsed with orjson when it is installed, unless
+# JSON_FAST is off. Response bodies of at least COMPRESSION_MIN_SIZE bytes
+# are compressed with brotli (if installed and accepted) or gzip.
+JSON_FAST = env.bool('JSON_FAST', default=True)
+COMPRESSION_MIN_SIZE = env.int('COMPRESSION_MIN_SIZE', default=1024)
+COMPRESSION_BROTLI_QUALITY = env.int('COMPRESSION_BROTLI_QUALITY', default=4)
+
+
+# Metrics
+# Share of the requests (0 to 1) whose timings, query counts and sizes are
+# recorded per URL pattern and exposed at /metrics/ (see
+# mangareview/metrics.py). 0 turns the middleware off. Scrapers authenticate
+# with METRICS_TOKEN as a bearer token; admins can use their knox token.
+METRICS_SAMPLE_RATE = env.float('METRICS_SAMPLE_RATE', default=0)
+METRICS_TOKEN = env('METRICS_TOKEN', default='')
+
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -169,3 +329,26 @@ STATIC_URL = '/static/'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 django_on_heroku.settings(locals())
+
+# After django_on_heroku, which replaces DATABASES['default'] from
+# DATABASE_URL. Tests run replicas on the primary's test database.
+REPLICA_DATABASES = []
+for index, url in enumerate(DATABASE_REPLICA_URLS, 1):
+    alias = f"replica{index}"
+    DATABASES[alias] = dj_database_url.parse(
+        url, conn_max_age=CONN_MAX_AGE, ssl_require=url.startswith('postgres'))
+    DATABASES[alias]['TEST'] = {'MIRROR': 'default'}
+    REPLICA_DATABASES.append(alias)
+if REPLICA_DATABASES:
+    DATABASE_ROUTERS = ['mangareview.routers.ReplicaRouter']
+
+# Pooled connections go back to the pool after each request.
+POOLED_ENGINES = {
+    'django.db.backends.sqlite3': 'mangareview.backends.sqlite3',
+    'django.db.backends.postgresql': 'mangareview.backends.postgresql',
+    'django.db.backends.postgresql_psycopg2': 'mangareview.backends.postgresql',
+}
+if DB_POOL:
+    for database in DATABASES.values():
+        database['ENGINE'] = POOLED_ENGINES.get(database['ENGINE'], database['ENGINE'])
+        database['CONN_MAX_AGE'] = 0
@@ -0,0 +1,61 @@
+'''
+Stand-alone benchmarks, run from the repository root, e.g.
+
+    python -m benchmarks.search --series 100000
+
+Each one migrates a throwaway SQLite database and talks to it in-process,
+so no server or network is needed. Results are printed as JSON.
+'''
+import math
+import os
+import statistics
+import tempfile
+import time
+
+
+def setup_django(database=None):
+    '''
+    Configures Django against a fresh SQLite file (or `database`) and migrates it.
+    Returns the path of the database.
+    '''
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'apirest.settings')
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+
+    if database is None:
+        handle, database = tempfile.mkstemp(prefix='mangareview-bench-', suffix='.sqlite3')
+        os.close(handle)
+
+    import django
+    from django.conf import settings
+    settings.DATABASES['default'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': database,
+    }
+    django.setup()
+
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0)
+    return database
+
+
+def percentile(samples, fraction):
+    '''
+    Nearest-rank percentile of sorted `samples`.
+    '''
+    return samples[max(math.ceil(len(samples) * fraction) - 1, 0)]
+
+
+def timed(function, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return {
+        'p50_ms': round(statistics.median(samples), 3),
+        'p95_ms': round(percentile(samples, 0.95), 3),
+        'p99_ms': round(percentile(samples, 0.99), 3),
+        'max_ms': round(samples[-1], 3),
+        'per_s': round(len(samples) * 1000 / sum(samples), 1),
+    }
@@ -0,0 +1,194 @@
+'''
+The API's hot paths, driven through the real URLconf: series and review
+lists, review creation, likes and unlikes, and rating recomputes, against
+a synthetic catalog of series x reviews x likes.
+
+    python -m benchmarks.api --series 1000 --reviews 20 --likes 5 > before.json
+    python -m benchmarks.api --series 1000 --reviews 20 --likes 5 --baseline before.json
+
+Requests go through the test client with a knox token, so authentication,
+middlewares and rendering are measured too. The response cache is off
+unless --response-cache is given, so list timings are the database path.
+Every scenario reports latency percentiles, throughput and the queries it
+runs per call; with --baseline, the p50 change against an earlier run.
+'''
+import argparse
+import json
+import os
+import random
+import subprocess
+import time
+
+from benchmarks import setup_django, timed
+
+
+def seed(series_count, reviews_per_series, likes_per_review, batch_size=5000):
+    '''
+    `series_count` series, each reviewed by `reviews_per_series` users, each
+    review liked by `likes_per_review` of them. Returns the users.
+    '''
+    from django.contrib.auth.models import User
+    from mangareview.models import Series, Review
+
+    rng = random.Random(42)
+    User.objects.bulk_create([
+        User(username=f"user{i}") for i in range(max(reviews_per_series, likes_per_review))
+    ], batch_size=batch_size)
+    users = list(User.objects.order_by('pk'))
+    Series.objects.bulk_create([
+        Series(title=f"Series {i}", author=f"Author {i % 97}",
+               genre=[rng.choice(["action", "drama", "romance", "seinen"])],
+               year=rng.randint(1960, 2022), chapters=rng.randint(1, 400))
+        for i in range(series_count)
+    ], batch_size=batch_size)
+    series_pks = list(Series.objects.order_by('pk').values_list('pk', flat=True))
+
+    per_chunk = max(1, batch_size // max(reviews_per_series, 1))
+    for start in range(0, series_count, per_chunk):
+        chunk = series_pks[start:start + per_chunk]
+        Review.objects.bulk_create([
+            Review(reviewer=user, series_id=series_pk, content="Review " * 20,
+                   rating=rng.randint(0, 10), likes_count=likes_per_review)
+            for series_pk in chunk for user in users[:reviews_per_series]
+        ])
+        Like = Review.likes.through
+        Like.objects.bulk_create([
+            Like(review_id=review_pk, user=user)
+            for review_pk in Review.objects.filter(series_id__in=chunk).values_list('pk', flat=True)
+            for user in users[:likes_per_review]
+        ], batch_size=batch_size)
+        Series.rebuild_ratings(chunk)
+    return users
+
+
+def measured(function, repeat):
+    '''
+    timed(), plus the queries each call runs.
+    '''
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    counts = []
+
+    def counted():
+        with CaptureQueriesContext(connection) as queries:
+            function()
+        counts.append(len(queries))
+
+    result = timed(counted, repeat)
+    result['queries'] = round(sum(counts) / len(counts), 1)
+    result['max_queries'] = max(counts)
+    return result
+
+
+def expect(response, status):
+    if response.status_code != status:
+        raise RuntimeError(f"{response.status_code}: {response.content[:200]!r}")
+
+
+def commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--series', type=int, default=1000)
+    parser.add_argument('--reviews', type=int, default=20, help="Reviews per series.")
+    parser.add_argument('--likes', type=int, default=5, help="Likes per review.")
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--response-cache', action='store_true')
+    parser.add_argument('--baseline', help="JSON output of an earlier run to compare with.")
+    args = parser.parse_args()
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'apirest.settings')
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+    from django.conf import settings
+    if not args.response_cache:
+        settings.CACHES['responses'] = {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}
+    setup_django()
+
+    from django.contrib.auth.models import User
+    from knox.models import AuthToken
+    from rest_framework.test import APIClient
+    from mangareview.models import Series, Review
+    from mangareview.pagination import SeriesPagination
+
+    started = time.perf_counter()
+    seed(args.series, args.reviews, args.likes)
+    seed_seconds = time.perf_counter() - started
+
+    rng = random.Random(7)
+    series_pks = list(Series.objects.values_list('pk', flat=True))
+    review_pks = list(Review.objects.values_list('pk', 'series_id'))
+
+    def client_for(user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Token {AuthToken.objects.create(user)[1]}")
+        return client
+
+    anonymous = APIClient()
+    liker = client_for(User.objects.create(username="liker"))
+    writers = iter([
+        client_for(user) for user in User.objects.bulk_create(
+            [User(username=f"writer{i}") for i in range(args.repeat)])
+    ])
+
+    def list_series():
+        ordering = rng.choice(SeriesPagination.orderings + ('-rating',))
+        expect(anonymous.get(f"/series/?ordering={ordering}"), 200)
+
+    def list_reviews():
+        expect(anonymous.get(f"/series/{rng.choice(series_pks)}/reviews/"), 200)
+
+    def create_review():
+        response = next(writers).post(
+            f"/series/{rng.choice(series_pks)}/reviews/",
+            {"content": "Review " * 20, "rating": rng.randint(0, 10)}, format="json")
+        expect(response, 201)
+
+    to_like, liked = iter(rng.sample(review_pks, args.repeat)), []
+
+    def like():
+        review_pk, series_pk = next(to_like)
+        expect(liker.put(f"/series/{series_pk}/reviews/{review_pk}/like/"), 200)
+        liked.append((review_pk, series_pk))
+
+    def unlike():
+        review_pk, series_pk = liked.pop()
+        expect(liker.put(f"/series/{series_pk}/reviews/{review_pk}/unlike/"), 200)
+
+    def recompute():
+        Series.rebuild_ratings([rng.choice(series_pks)])
+
+    scenarios = {
+        'list_series': list_series,
+        'list_reviews': list_reviews,
+        'create_review': create_review,
+        'like': like,
+        'unlike': unlike,
+        'recompute_rating': recompute,
+    }
+    results = {
+        'commit': commit(),
+        'scale': {'series': args.series, 'reviews_per_series': args.reviews,
+                  'likes_per_review': args.likes},
+        'response_cache': args.response_cache,
+        'seed_seconds': round(seed_seconds, 1),
+        'scenarios': {name: measured(function, args.repeat) for name, function in scenarios.items()},
+    }
+
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            before = json.load(baseline)['scenarios']
+        for name, result in results['scenarios'].items():
+            if name in before:
+                result['p50_change'] = f"{result['p50_ms'] / before[name]['p50_ms'] - 1:+.1%}"
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+'''
+Database connection handling under gunicorn, one gthread worker with
+--threads threads: a new connection per request (CONN_MAX_AGE=0),
+persistent connections checked at each request (CONN_MAX_AGE, the
+default), and a pool of --threads connections (DB_POOL).
+
+    python -m benchmarks.connections --threads 8 --clients 16 --requests 4000
+    python -m benchmarks.connections --database-url postgres://localhost/mangareview
+
+By default the server runs on a SQLite database in WAL mode (so readers
+don't block each other), seeded like benchmarks.api. With --database-url
+it runs against that database instead, e.g. a local Postgres, where a
+connection costs a network round trip and authentication. That database
+must be migrated and seeded already. --clients keep-alive clients send GET
+/series/<id>/ with the response cache off. The output gives latency,
+throughput and, for the pool, its counters read from /metrics/.
+'''
+import argparse
+import http.client
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+from benchmarks import percentile, setup_django
+from benchmarks.server_load import free_port
+
+MODES = {
+    'connect': {'CONN_MAX_AGE': '0', 'DB_POOL': 'false'},
+    'persistent': {'CONN_MAX_AGE': '600', 'DB_POOL': 'false'},
+    'pool': {'CONN_MAX_AGE': '600', 'DB_POOL': 'true'},
+}
+METRICS_TOKEN = 'benchmark'
+
+
+def start_server(mode, threads, database, database_url, port):
+    env = dict(
+        os.environ, **MODES[mode], BENCH_DATABASE=database or '',
+        BENCH_DATABASE_URL=database_url or '', DB_POOL_SIZE=str(threads),
+        DJANGO_SETTINGS_MODULE='benchmarks.server_settings', RESPONSE_CACHE_TIMEOUT='0',
+        METRICS_TOKEN=METRICS_TOKEN, SECRET_KEY=os.environ.get('SECRET_KEY', 'benchmark'),
+    )
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'apirest/gunicorn.conf.py',
+         '--bind', f"127.0.0.1:{port}", '--workers', '1', '--threads', str(threads),
+         '--log-level', 'warning'],
+        env=env,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            get(http.client.HTTPConnection('127.0.0.1', port, timeout=5), '/series/?page_size=1')
+            return server
+        except OSError:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError(f"{mode} server did not start")
+
+
+def get(connection, path, headers=None):
+    connection.request('GET', path, headers=dict(headers or {}, Accept='application/json'))
+    response = connection.getresponse()
+    return response.status, response.read()
+
+
+def load(port, paths, clients, requests):
+    latencies, statuses = [], {}
+    lock = threading.Lock()
+    remaining = iter(range(requests))
+
+    def client(seed):
+        rng = random.Random(seed)
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        while True:
+            with lock:
+                if next(remaining, None) is None:
+                    return
+            started = time.perf_counter()
+            status, _ = get(connection, rng.choice(paths))
+            elapsed = (time.perf_counter() - started) * 1000
+            with lock:
+                latencies.append(elapsed)
+                statuses[status] = statuses.get(status, 0) + 1
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = time.perf_counter() - started
+    latencies.sort()
+    return {
+        'rps': round(len(latencies) / duration, 1),
+        'p50_ms': round(statistics.median(latencies), 2),
+        'p95_ms': round(percentile(latencies, 0.95), 2),
+        'p99_ms': round(percentile(latencies, 0.99), 2),
+        'max_ms': round(latencies[-1], 2),
+        'statuses': {str(status): count for status, count in sorted(statuses.items())},
+    }
+
+
+def pool_counters(port):
+    status, body = get(http.client.HTTPConnection('127.0.0.1', port, timeout=5), '/metrics/',
+                       {'Authorization': f"Bearer {METRICS_TOKEN}"})
+    counters = {}
+    for line in body.decode().splitlines():
+        if line.startswith('mangareview_db_pool_'):
+            name, value = line.split(' ')
+            counters[name.split('{')[0][len('mangareview_db_pool_'):]] = float(value)
+    return counters
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=4000, help="Requests per mode.")
+    parser.add_argument('--series', type=int, default=1000)
+    parser.add_argument('--database-url', help="Migrated and seeded database to use instead.")
+    parser.add_argument('--modes', nargs='+', default=list(MODES), choices=list(MODES))
+    args = parser.parse_args()
+
+    database = None
+    if args.database_url:
+        pks = range(1, args.series + 1)
+    else:
+        database = setup_django()
+        from django.db import connection
+        from benchmarks.api import seed
+        from mangareview.models import Series
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode=WAL')
+        seed(args.series, 5, 2)
+        pks = list(Series.objects.values_list('pk', flat=True))
+    paths = [f"/series/{pk}/" for pk in pks]
+
+    results = {'threads': args.threads, 'clients': args.clients,
+               'requests': args.requests, 'modes': {}}
+    for mode in args.modes:
+        port = free_port()
+        server = start_server(mode, args.threads, database, args.database_url, port)
+        try:
+            result = results['modes'][mode] = load(port, paths, args.clients, args.requests)
+            if mode == 'pool':
+                result['pool'] = pool_counters(port)
+        finally:
+            server.terminate()
+            server.wait()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+'''
+Like and review membership checks: indexed EXISTS lookups against the
+Python scans they replaced, from 10 to 100k likers (and reviewers).
+
+    python -m benchmarks.membership --sizes 10 1000 100000
+'''
+import argparse
+import json
+
+from benchmarks import setup_django, timed
+
+
+def seed(size, users):
+    '''
+    A series reviewed by `size` users, one of whose reviews is liked by all of them.
+    '''
+    from mangareview.models import Series, Review
+    series = Series.objects.create(
+        title=f"Series {size}", author="Author", genre=["action"], year=2000)
+    Review.objects.bulk_create([
+        Review(reviewer=user, series=series, content="Review", rating=5) for user in users[:size]
+    ], batch_size=5000)
+    review = series.reviews.order_by('pk').first()
+    Like = Review.likes.through
+    Like.objects.bulk_create([Like(review=review, user=user) for user in users[:size]], batch_size=5000)
+    Review.objects.filter(pk=review.pk).update(likes_count=size)
+    series.update()
+    return series, review
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000, 10_000, 100_000])
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.contrib.auth.models import User
+    from rest_framework.test import APIClient
+    from mangareview.models import Review
+
+    User.objects.bulk_create(
+        [User(username=f"user{i}") for i in range(max(args.sizes))], batch_size=5000)
+    users = list(User.objects.order_by('pk'))
+    probe = User.objects.create(username="probe")
+    client = APIClient()
+    client.force_authenticate(probe)
+
+    results = {}
+    for size in args.sizes:
+        series, review = seed(size, users)
+        # The scans are linear: cap their total work to keep big sizes bearable.
+        scan_repeat = max(1, min(args.repeat, 20_000 // size))
+        url = f"/series/{series.pk}/reviews/{review.pk}/"
+        actions = iter(["like", "unlike"] * args.repeat)
+
+        results[size] = {
+            'like_check': {
+                'scan': timed(lambda: probe in review.likes.all(), scan_repeat),
+                'exists': timed(lambda: Review.likes.through.objects.filter(
+                    review=review, user=probe).exists(), args.repeat),
+            },
+            'review_check': {
+                'scan': timed(lambda: any(
+                    r.reviewer == probe for r in series.reviews.all()), max(1, scan_repeat // 10)),
+                'exists': timed(lambda: Review.objects.filter(
+                    reviewer=probe, series=series).exists(), args.repeat),
+            },
+            'like_endpoint': timed(lambda: client.put(url + next(actions) + "/"), args.repeat),
+        }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+'''
+The build_recommendations job on synthetic interactions: --users readers
+each interacting with a handful of --series, drawn with a long-tailed
+popularity as real catalogs are, --interactions in total.
+
+    python -m benchmarks.recommendations --interactions 1000000 --users 100000 --series 10000
+
+Times the matrix construction, the chunked item-item similarity and the
+per-user scoring. With --store, the users and series are created in a
+throwaway SQLite database and writing the results is timed too. Needs
+numpy and scipy.
+'''
+import argparse
+import json
+import time
+
+from benchmarks import setup_django
+
+
+def interactions(count, users, series, rng):
+    '''
+    (user ids, series ids, strengths) of `count` interactions, series
+    picked with Zipf-like popularity so a few are read by most users.
+    '''
+    import numpy as np
+    popularity = 1 / np.arange(1, series + 1) ** 0.8
+    return (
+        rng.integers(1, users + 1, count),
+        rng.choice(np.arange(1, series + 1), count, p=popularity / popularity.sum()),
+        1 + rng.integers(0, 11, count) / 10,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--interactions', type=int, default=1_000_000)
+    parser.add_argument('--users', type=int, default=100_000)
+    parser.add_argument('--series', type=int, default=10_000)
+    parser.add_argument('--size', type=int, default=20)
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--store', action='store_true', help="Also time writing the results.")
+    args = parser.parse_args()
+
+    setup_django()
+    import numpy as np
+    from mangareview import recommendations
+    from mangareview.models import SimilarSeries, Recommendation
+
+    results = {key: getattr(args, key) for key in ('interactions', 'users', 'series', 'size', 'chunk_size')}
+    rng = np.random.default_rng(42)
+    data = interactions(args.interactions, args.users, args.series, rng)
+
+    started = time.perf_counter()
+    user_ids, series_ids, matrix = recommendations.interaction_matrix(*data)
+    results['matrix_s'] = round(time.perf_counter() - started, 3)
+    results['pairs'] = matrix.nnz
+
+    started = time.perf_counter()
+    similar = recommendations.similar_series(matrix, args.size, args.chunk_size)
+    results['similar_s'] = round(time.perf_counter() - started, 3)
+
+    started = time.perf_counter()
+    recommended = recommendations.recommend(matrix, similar, args.size, args.chunk_size)
+    results['recommend_s'] = round(time.perf_counter() - started, 3)
+    results['recommendations'] = len(recommended[0])
+
+    if args.store:
+        from django.contrib.auth.models import User
+        from mangareview.models import Series
+        User.objects.bulk_create(
+            [User(pk=pk, username=f"user{pk}") for pk in user_ids.tolist()], batch_size=5000)
+        Series.objects.bulk_create(
+            [Series(pk=pk, title=f"Series {pk}", author="Author", genre=[], year=2000)
+             for pk in series_ids.tolist()], batch_size=5000)
+        coo = similar.tocoo()
+        started = time.perf_counter()
+        recommendations.store(SimilarSeries, 'series_id', series_ids, series_ids,
+                              coo.row, coo.col, coo.data)
+        recommendations.store(Recommendation, 'user_id', user_ids, series_ids, *recommended)
+        results['store_s'] = round(time.perf_counter() - started, 3)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
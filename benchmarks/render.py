@@ -0,0 +1,55 @@
+'''
+The render step of list responses: DRF's stdlib JSONRenderer against the
+orjson-backed FastJSONRenderer, and the compression of the result, on
+10k serialized series and reviews.
+
+    python -m benchmarks.render --rows 10000
+'''
+import argparse
+import json
+
+from benchmarks import setup_django, timed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10_000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.utils.text import compress_string
+    from rest_framework.renderers import JSONRenderer
+    from benchmarks.api import seed
+    from mangareview import compression
+    from mangareview.models import Series, Review
+    from mangareview.renderers import FastJSONRenderer
+    from mangareview.serializers import SeriesSerializer, ReviewSerializer
+
+    seed(args.rows, 1, 0)
+    results = {'rows': args.rows}
+    for name, serializer in (
+        ('series', lambda: SeriesSerializer(Series.objects.all(), many=True)),
+        ('reviews', lambda: ReviewSerializer(
+            ReviewSerializer.setup_eager_loading(Review.objects.all()), many=True)),
+    ):
+        data = serializer().data
+        body = JSONRenderer().render(data)
+        result = {
+            'bytes': len(body),
+            'serialize': timed(lambda: serializer().data, max(1, args.repeat // 4)),
+            'render_stdlib': timed(lambda: JSONRenderer().render(data), args.repeat),
+            'render_orjson': timed(lambda: FastJSONRenderer().render(data), args.repeat),
+            'gzip': timed(lambda: compress_string(body), args.repeat),
+            'gzip_bytes': len(compress_string(body)),
+        }
+        if compression.brotli is not None:
+            brotli = compression.brotli
+            result['brotli'] = timed(lambda: brotli.compress(body, quality=4), args.repeat)
+            result['brotli_bytes'] = len(brotli.compress(body, quality=4))
+        results[name] = result
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,216 @@
+'''
+Replays a JSONL request log against the app, one request per line:
+
+    {"method": "PUT", "path": "/series/3/reviews/12/like/", "user": "user7"}
+    {"method": "POST", "path": "/series/3/reviews/", "body": {"rating": 8, "content": "..."}, "user": "user2"}
+    {"path": "/series/?ordering=-rating"}
+
+    python -m benchmarks.replay traffic.jsonl --concurrency 8 --rate 200 --series 1000
+    python -m benchmarks.replay traffic.jsonl --url http://127.0.0.1:8000 --password secret
+
+By default requests go to the WSGI app in-process, against a throwaway
+SQLite database that --series/--reviews/--likes seed like benchmarks.api
+does (so recorded ids exist), or against --database. Users named in the
+log are created and given a knox token. With --url they go to a running
+server instead, logging the users in with --password.
+
+With --rate, requests are sent on schedule whatever the latency, and a
+request's latency counts from when it was due: a server falling behind
+shows up in the percentiles instead of slowing the replay down. Results
+are grouped per method and path, ids replaced by <id>; errors are server
+errors and failed requests, whose exceptions are counted under "failures".
+In-process, concurrent writes fail with SQLite's "database is locked" as
+they would on a SQLite deployment.
+'''
+import argparse
+import http.client
+import json
+import re
+import statistics
+import threading
+import time
+from collections import Counter, defaultdict
+from urllib.parse import urlsplit
+
+from benchmarks import percentile, setup_django
+
+
+def read_log(path, limit=None, loops=1):
+    with open(path) as log:
+        lines = [json.loads(line) for line in log if line.strip()]
+    lines = lines * loops
+    return lines[:limit] if limit else lines
+
+
+def endpoint(line):
+    path = re.sub(r'/\d+(?=/|$)', '/<id>', line['path'].split('?', 1)[0])
+    return f"{line.get('method', 'GET').upper()} {path}"
+
+
+class WSGITarget:
+    '''
+    Sends requests through Django's test client, one per thread.
+    '''
+
+    def __init__(self, users):
+        from django.contrib.auth.models import User
+        from knox.models import AuthToken
+        self.tokens = {}
+        for username in users:
+            user, _ = User.objects.get_or_create(username=username)
+            self.tokens[username] = AuthToken.objects.create(user)[1]
+        self.local = threading.local()
+
+    def send(self, method, path, body, user):
+        from rest_framework.test import APIClient
+        client = getattr(self.local, 'client', None)
+        if client is None:
+            client = self.local.client = APIClient()
+        headers = {'HTTP_AUTHORIZATION': f"Token {self.tokens[user]}"} if user else {}
+        response = client.generic(
+            method, path, json.dumps(body) if body is not None else '',
+            content_type='application/json', **headers)
+        return response.status_code
+
+
+class HTTPTarget:
+    '''
+    Sends requests to a running server over one keep-alive connection per thread.
+    '''
+
+    def __init__(self, url, users, password):
+        parts = urlsplit(url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.local = threading.local()
+        self.tokens = {}
+        for username in users:
+            status, body = self.request('POST', '/login/', {'username': username, 'password': password})
+            if status != 200:
+                raise RuntimeError(f"Could not log {username} in: {status} {body[:200]!r}")
+            self.tokens[username] = json.loads(body)['token']
+
+    def request(self, method, path, body, headers=None):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = self.local.connection = http.client.HTTPConnection(
+                self.host, self.port, timeout=30)
+        headers = dict(headers or {}, Accept='application/json')
+        payload = None
+        if body is not None:
+            payload = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+        try:
+            connection.request(method, path, payload, headers)
+            response = connection.getresponse()
+            return response.status, response.read()
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            self.local.connection = None
+            raise
+
+    def send(self, method, path, body, user):
+        headers = {'Authorization': f"Token {self.tokens[user]}"} if user else {}
+        return self.request(method, path, body, headers)[0]
+
+
+def replay(target, lines, concurrency, rate):
+    latencies = defaultdict(list)
+    statuses = defaultdict(Counter)
+    failures = defaultdict(Counter)
+    lock = threading.Lock()
+    queue = iter(enumerate(lines))
+    started = time.perf_counter()
+
+    def work():
+        while True:
+            with lock:
+                item = next(queue, None)
+            if item is None:
+                return
+            index, line = item
+            due = started + index / rate if rate else time.perf_counter()
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            try:
+                status = target.send(
+                    line.get('method', 'GET').upper(), line['path'], line.get('body'), line.get('user'))
+            except Exception as error:
+                status, failure = None, f"{type(error).__name__}: {error}"[:200]
+            elapsed = (time.perf_counter() - due) * 1000
+            with lock:
+                name = endpoint(line)
+                if status is None:
+                    failures[name][failure] += 1
+                else:
+                    statuses[name][status] += 1
+                    latencies[name].append(elapsed)
+
+    threads = [threading.Thread(target=work) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = time.perf_counter() - started
+
+    endpoints = {}
+    for name in sorted(set(latencies) | set(failures)):
+        samples = sorted(latencies[name])
+        endpoints[name] = {
+            'requests': len(samples) + sum(failures[name].values()),
+            'errors': sum(failures[name].values()) + sum(
+                count for status, count in statuses[name].items() if status >= 500),
+            'statuses': {str(status): count for status, count in sorted(statuses[name].items())},
+            'failures': dict(failures[name]),
+        }
+        if samples:
+            endpoints[name].update({
+                'p50_ms': round(statistics.median(samples), 2),
+                'p95_ms': round(percentile(samples, 0.95), 2),
+                'p99_ms': round(percentile(samples, 0.99), 2),
+                'max_ms': round(samples[-1], 2),
+            })
+    return {
+        'requests': len(lines),
+        'errors': sum(result['errors'] for result in endpoints.values()),
+        'seconds': round(duration, 2),
+        'rps': round(len(lines) / duration, 1),
+        'endpoints': endpoints,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('log', help="JSONL request log.")
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--rate', type=float, default=0,
+                        help="Requests per second, 0 to send them as fast as possible.")
+    parser.add_argument('--loops', type=int, default=1, help="Times the log is replayed.")
+    parser.add_argument('--limit', type=int, help="Replay only the first LIMIT requests.")
+    parser.add_argument('--url', help="Base URL of a running server, instead of the WSGI app.")
+    parser.add_argument('--password', help="Password of the log's users, with --url.")
+    parser.add_argument('--database', help="SQLite database to replay against in-process.")
+    parser.add_argument('--series', type=int, default=0, help="Series to seed in-process.")
+    parser.add_argument('--reviews', type=int, default=10, help="Reviews per seeded series.")
+    parser.add_argument('--likes', type=int, default=3, help="Likes per seeded review.")
+    args = parser.parse_args()
+
+    lines = read_log(args.log, args.limit, args.loops)
+    users = sorted({line['user'] for line in lines if line.get('user')})
+    if args.url:
+        target = HTTPTarget(args.url, users, args.password)
+    else:
+        setup_django(args.database)
+        if args.series:
+            from benchmarks.api import seed
+            seed(args.series, args.reviews, args.likes)
+        target = WSGITarget(users)
+
+    results = replay(target, lines, args.concurrency, args.rate)
+    results.update({'log': args.log, 'concurrency': args.concurrency, 'rate': args.rate,
+                    'target': args.url or 'wsgi'})
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+'''
+Series search latency: the FTS5 index behind /series/search/ against the
+icontains scan it replaces.
+
+    python -m benchmarks.search --series 100000
+'''
+import argparse
+import json
+import random
+import time
+
+from benchmarks import setup_django, timed
+
+SYLLABLES = "ka ki ku ke ko sa shi su se so ta chi tsu te to na ni nu ne no ha hi fu he ho ma mi mu me mo ra ri ru re ro".split()
+
+
+def vocabulary(size, rng):
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+def seed(count, words, batch_size=5000):
+    '''
+    Word frequencies follow a Zipf-like curve, like real text: a few words are
+    everywhere, most are rare.
+    '''
+    from mangareview.models import Series
+    rng = random.Random(42)
+    weights = [1 / (rank + 1) for rank in range(len(words))]
+
+    def text(k):
+        return " ".join(rng.choices(words, weights, k=k))
+
+    for start in range(0, count, batch_size):
+        Series.objects.bulk_create([
+            Series(
+                title=f"{text(2).title()} {i}",
+                author=f"Author {rng.randrange(count // 10 + 1)}",
+                genre=["action"],
+                year=rng.randrange(1960, 2022),
+                about=text(40),
+            )
+            for i in range(start, min(start + batch_size, count))
+        ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--series', type=int, default=100_000)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.db.models import Q
+    from mangareview.models import Series
+    from mangareview.search import search_series
+
+    rng = random.Random(7)
+    words = vocabulary(20_000, rng)
+    started = time.perf_counter()
+    seed(args.series, words)
+    seconds = time.perf_counter() - started
+
+    queries = [
+        words[0],                           # in most rows
+        f"{words[10]} {words[200]}",        # common AND uncommon
+        words[5000][:3],                    # prefix
+        words[15000],                       # rare
+        f"{words[3000]} {words[19000]}",    # rare AND rare
+    ]
+    results = {'series': args.series, 'seed_seconds': round(seconds, 1), 'queries': {}}
+    for query in queries:
+        words = query.split()
+        condition = Q()
+        for word in words:
+            condition &= Q(title__icontains=word) | Q(author__icontains=word) | Q(about__icontains=word)
+        results['queries'][query] = {
+            'fts': timed(lambda: search_series(query, 20), args.repeat),
+            'icontains': timed(
+                lambda: list(Series.objects.filter(condition).values_list('pk', flat=True)[:20]),
+                args.repeat),
+        }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
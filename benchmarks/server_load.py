@@ -0,0 +1,163 @@
+'''
+WSGI against ASGI under slow clients: gunicorn with sync workers and with
+uvicorn workers (apirest/gunicorn.conf.py), at the same worker count.
+
+    python -m benchmarks.server_load --workers 2 --slow-clients 8
+
+While the slow clients trickle their requests in, a few fast clients hammer
+GET /series/ and GET /series/<id>/reviews/; their throughput and latency
+show whether the slow ones hold the workers.
+'''
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmarks import setup_django
+
+
+def seed(series_count, reviews_per_series):
+    from django.contrib.auth.models import User
+    from mangareview.models import Series, Review
+    users = User.objects.bulk_create(
+        [User(username=f"user{i}") for i in range(reviews_per_series)])
+    series_list = Series.objects.bulk_create([
+        Series(title=f"Series {i}", author=f"Author {i}", genre=["action"], year=2000)
+        for i in range(series_count)
+    ])
+    series_list = list(Series.objects.all())
+    Review.objects.bulk_create([
+        Review(reviewer=user, series=series, content="Review " * 20, rating=i % 10)
+        for series in series_list for i, user in enumerate(User.objects.all())
+    ], batch_size=5000)
+    for series in series_list:
+        series.update()
+    return [series.pk for series in series_list]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(profile, workers, database, port):
+    env = dict(
+        os.environ, SERVER_PROFILE=profile, BENCH_DATABASE=database,
+        DJANGO_SETTINGS_MODULE='benchmarks.server_settings',
+        SECRET_KEY=os.environ.get('SECRET_KEY', 'benchmark'),
+    )
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'apirest/gunicorn.conf.py',
+         '--bind', f"127.0.0.1:{port}", '--workers', str(workers), '--log-level', 'warning'],
+        env=env,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return server
+        except OSError:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError(f"{profile} server did not start")
+
+
+async def request(port, path, trickle=0.0):
+    '''
+    GET `path`, sending the request `trickle` seconds per byte. Returns the status.
+    '''
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    try:
+        payload = (f"GET {path} HTTP/1.1\r\nHost: localhost\r\n"
+                   f"Accept: application/json\r\nConnection: close\r\n\r\n").encode()
+        if trickle:
+            for i in range(len(payload)):
+                writer.write(payload[i:i + 1])
+                await writer.drain()
+                await asyncio.sleep(trickle)
+        else:
+            writer.write(payload)
+        response = await reader.read()
+        return int(response.split(b" ", 2)[1])
+    finally:
+        writer.close()
+
+
+async def load(port, paths, duration, fast_clients, slow_clients, trickle):
+    latencies, errors = [], 0
+    stop = time.monotonic() + duration
+
+    async def fast(rng):
+        nonlocal errors
+        while time.monotonic() < stop:
+            started = time.perf_counter()
+            try:
+                status = await asyncio.wait_for(request(port, rng.choice(paths)), timeout=30)
+            except (OSError, asyncio.TimeoutError, IndexError, ValueError):
+                status = None
+            if status == 200:
+                latencies.append((time.perf_counter() - started) * 1000)
+            else:
+                errors += 1
+
+    async def slow(rng):
+        while time.monotonic() < stop:
+            try:
+                await request(port, rng.choice(paths), trickle)
+            except (OSError, IndexError, ValueError):
+                pass
+
+    await asyncio.gather(
+        *[fast(random.Random(i)) for i in range(fast_clients)],
+        *[slow(random.Random(-i)) for i in range(1, slow_clients + 1)],
+    )
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': round(len(latencies) / duration, 1),
+        'p50_ms': round(statistics.median(latencies), 2) if latencies else None,
+        'p95_ms': round(latencies[int(len(latencies) * 0.95)], 2) if latencies else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--fast-clients', type=int, default=4)
+    parser.add_argument('--slow-clients', type=int, default=8)
+    parser.add_argument('--trickle', type=float, default=0.02,
+                        help="Seconds per byte sent by the slow clients.")
+    parser.add_argument('--duration', type=float, default=15)
+    parser.add_argument('--series', type=int, default=200)
+    parser.add_argument('--reviews', type=int, default=20)
+    parser.add_argument('--profiles', nargs='+', default=['wsgi', 'asgi'])
+    args = parser.parse_args()
+
+    database = setup_django()
+    pks = seed(args.series, args.reviews)
+    paths = ['/series/'] + [f"/series/{pk}/reviews/" for pk in pks[:20]]
+
+    results = {'workers': args.workers, 'fast_clients': args.fast_clients,
+               'slow_clients': args.slow_clients, 'profiles': {}}
+    for profile in args.profiles:
+        port = free_port()
+        server = start_server(profile, args.workers, database, port)
+        try:
+            results['profiles'][profile] = asyncio.run(load(
+                port, paths, args.duration, args.fast_clients, args.slow_clients, args.trickle))
+        finally:
+            server.terminate()
+            server.wait()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
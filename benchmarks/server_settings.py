@@ -0,0 +1,23 @@
+'''
+Settings of the servers started by the load benchmarks: the project's,
+against the benchmark's SQLite file, or BENCH_DATABASE_URL if set, with the
+project's connection settings (CONN_MAX_AGE, DB_POOL).
+'''
+import os
+
+import dj_database_url
+
+from apirest.settings import *  # noqa: F401,F403
+
+if os.environ.get('BENCH_DATABASE_URL'):
+    _database = dj_database_url.parse(os.environ['BENCH_DATABASE_URL'])
+else:
+    _database = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ['BENCH_DATABASE'],
+    }
+_database['CONN_MAX_AGE'] = CONN_MAX_AGE
+if DB_POOL:
+    _database['ENGINE'] = POOLED_ENGINES[_database['ENGINE']]
+    _database['CONN_MAX_AGE'] = 0
+DATABASES = {'default': _database}
@@ -1,6 +1,17 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class MangareviewConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'mangareview'
+
+    def ready(self):
+        from .search import ensure_search_triggers
+        # Connects the receivers that drop cached tokens on logout.
+        from . import authentication  # noqa: F401
+        # The one dropping cached responses when a series comes or goes.
+        from . import cache  # noqa: F401
+        # And the one checking persistent database connections.
+        from . import dbpool  # noqa: F401
+        post_migrate.connect(ensure_search_triggers, sender=self)
@@ -0,0 +1,48 @@
+import functools
+
+from asgiref.sync import sync_to_async
+
+from .metrics import timing_render
+from .views import SeriesListApiView, SeriesDetailApiView, ReviewListApiView
+
+
+class AsyncApiViewMixin:
+    '''
+    Serves an APIView from a coroutine, for the ASGI profile (see
+    apirest/gunicorn.conf.py). The server then reads requests and writes
+    responses on its event loop, so a slow client no longer holds a thread.
+
+    Django 4.0 has no async ORM (and DRF no async dispatch), so the request
+    itself (authentication, queries, serialization and rendering) runs in
+    one sync_to_async() hop. Each request gets its own thread, so its
+    database connection is closed by the usual request_finished handler.
+    '''
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+
+        def handle(request, *args, **kwargs):
+            response = view(request, *args, **kwargs)
+            if hasattr(response, 'render') and not response.is_rendered:
+                with timing_render():
+                    response.render()
+            return response
+
+        @functools.wraps(view)
+        async def async_view(request, *args, **kwargs):
+            return await sync_to_async(handle)(request, *args, **kwargs)
+
+        return async_view
+
+
+class AsyncSeriesListApiView(AsyncApiViewMixin, SeriesListApiView):
+    pass
+
+
+class AsyncSeriesDetailApiView(AsyncApiViewMixin, SeriesDetailApiView):
+    pass
+
+
+class AsyncReviewListApiView(AsyncApiViewMixin, ReviewListApiView):
+    pass
@@ -0,0 +1,188 @@
+import binascii
+import copy
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.signals import request_finished
+from django.db import connection, transaction
+from django.db.models.signals import post_delete, post_save
+from django.utils import timezone
+from knox.auth import TokenAuthentication
+from knox.crypto import hash_token
+from knox.models import AuthToken
+from knox.settings import knox_settings
+
+# What a validated token resolves to, until `valid_until`.
+Entry = namedtuple('Entry', ['user', 'token_key', 'expiry', 'valid_until', 'cached_at'])
+
+_entries = OrderedDict()
+_lock = threading.Lock()
+
+# Digests of the tokens whose expiry is due a refresh.
+_refreshes = set()
+
+
+def _get(digest):
+    with _lock:
+        entry = _entries.get(digest)
+        if entry is not None:
+            _entries.move_to_end(digest)
+        return entry
+
+
+def _put(digest, entry):
+    with _lock:
+        _entries[digest] = entry
+        _entries.move_to_end(digest)
+        while len(_entries) > settings.AUTH_CACHE_MAX_ENTRIES:
+            _entries.popitem(last=False)
+
+
+def revoked_token_key(digest):
+    return f"auth-revoked:{digest}"
+
+
+def changed_user_key(user_pk):
+    return f"auth-user-changed:{user_pk}"
+
+
+def revoked(digest, entry):
+    '''
+    Whether the token was deleted, or its user saved, in any process since
+    the entry was cached. Marks are kept in the default cache for
+    AUTH_CACHE_TTL seconds, as long as any entry they can apply to.
+    '''
+    token_key, user_key = revoked_token_key(digest), changed_user_key(entry.user.pk)
+    marks = cache.get_many([token_key, user_key])
+    return token_key in marks or marks.get(user_key, 0) >= entry.cached_at
+
+
+def forget_token(digest):
+    with _lock:
+        _entries.pop(digest, None)
+        _refreshes.discard(digest)
+    # Once committed: until then, other processes can still read the token.
+    transaction.on_commit(lambda: cache.set(
+        revoked_token_key(digest), True, settings.AUTH_CACHE_TTL))
+
+
+def forget_user(user_pk):
+    with _lock:
+        for digest in [d for d, entry in _entries.items() if entry.user.pk == user_pk]:
+            del _entries[digest]
+    transaction.on_commit(lambda: cache.set(
+        changed_user_key(user_pk), time.time(), settings.AUTH_CACHE_TTL))
+
+
+def clear():
+    with _lock:
+        _entries.clear()
+        _refreshes.clear()
+
+
+def flush_refreshes():
+    '''
+    Writes the pending expiry refreshes in one UPDATE. Every token in the
+    batch was used since the last flush, so they all get a full TOKEN_TTL
+    from now, as knox would have given them on their last use (give or take
+    MIN_REFRESH_INTERVAL, which knox allows too).
+    '''
+    with _lock:
+        digests = list(_refreshes)
+        _refreshes.clear()
+    if digests:
+        AuthToken.objects.filter(digest__in=digests).update(
+            expiry=timezone.now() + knox_settings.TOKEN_TTL)
+    return len(digests)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    '''
+    knox's TokenAuthentication behind a bounded in-process cache of token
+    digest -> user, kept for AUTH_CACHE_TTL seconds (never past the token's
+    expiry). A hit costs a hash and a dict lookup instead of knox's queries
+    for the token, its user and the user's other tokens.
+
+    Deleting a token (logout, logoutall, knox's expired token cleanup) or
+    saving its user drops the entry of this process and leaves a mark in the
+    default cache, checked on every hit, so that the other processes sharing
+    that cache refuse the token at once too. With knox's AUTO_REFRESH,
+    expiry refreshes are queued and written in one UPDATE once the request
+    is over (see flush_after_request).
+    '''
+
+    def authenticate_credentials(self, token):
+        try:
+            digest = hash_token(token.decode())
+        except (binascii.Error, UnicodeDecodeError):
+            return super().authenticate_credentials(token)
+
+        now = timezone.now()
+        entry = _get(digest)
+        if entry is None or entry.valid_until <= now or revoked(digest, entry):
+            cached_at = time.time()
+            # knox validates the token, drops the expired ones and renews it.
+            user, auth_token = super().authenticate_credentials(token)
+            valid_until = now + timedelta(seconds=settings.AUTH_CACHE_TTL)
+            if auth_token.expiry is not None:
+                valid_until = min(valid_until, auth_token.expiry)
+            _put(digest, Entry(
+                user, auth_token.token_key, auth_token.expiry, valid_until, cached_at))
+            return user, auth_token
+
+        # Each request gets its own copies, the cached ones are shared.
+        auth_token = AuthToken(
+            digest=digest, token_key=entry.token_key,
+            user=copy.copy(entry.user), expiry=entry.expiry)
+        if knox_settings.AUTO_REFRESH and auth_token.expiry is not None:
+            self.renew_token(auth_token)
+        return self.validate_user(auth_token)
+
+    def renew_token(self, auth_token):
+        current_expiry = auth_token.expiry
+        new_expiry = timezone.now() + knox_settings.TOKEN_TTL
+        if (new_expiry - current_expiry).total_seconds() <= knox_settings.MIN_REFRESH_INTERVAL:
+            return
+        auth_token.expiry = new_expiry
+        with _lock:
+            _refreshes.add(auth_token.digest)
+            entry = _entries.get(auth_token.digest)
+            if entry is not None:
+                _entries[auth_token.digest] = entry._replace(expiry=new_expiry)
+
+
+def token_deleted(sender, instance, **kwargs):
+    forget_token(instance.digest)
+
+
+def user_changed(sender, instance, **kwargs):
+    # A deactivated user, or a new password, must not ride on a cached token.
+    forget_user(instance.pk)
+
+
+def flush_after_request(**kwargs):
+    '''
+    Writes the refreshes queued while serving the request once it is over,
+    so none waits on a later request (or is lost when the process stops).
+    Closes the connection again if this is what opened it, as Django has
+    already let go of the request's connections by then.
+    '''
+    if not _refreshes:
+        return
+    opened = connection.connection is None
+    try:
+        flush_refreshes()
+    finally:
+        if opened:
+            connection.close()
+
+
+post_delete.connect(token_deleted, sender=AuthToken)
+post_save.connect(user_changed, sender=get_user_model())
+post_delete.connect(user_changed, sender=get_user_model())
+request_finished.connect(flush_after_request)
@@ -0,0 +1,7 @@
+from django.db.backends.sqlite3 import base
+
+from mangareview.dbpool import PooledDatabaseWrapper
+
+
+class DatabaseWrapper(PooledDatabaseWrapper, base.DatabaseWrapper):
+    pass
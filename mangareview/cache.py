@@ -0,0 +1,182 @@
+import functools
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.http import HttpResponse
+
+from .metrics import timing_render
+from .models import Series
+from .routers import pinned_to_primary, read_from_replica
+
+RESPONSE_CACHE_ALIAS = 'responses'
+
+_stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+_stats_lock = threading.Lock()
+
+
+def record(event, count=1):
+    with _stats_lock:
+        _stats[event] += count
+
+
+def cache_stats():
+    '''
+    Hit/miss/eviction/invalidation counters of this process.
+    '''
+    with _stats_lock:
+        return dict(_stats)
+
+
+class LRUResponseCache(LocMemCache):
+    '''
+    Per-process LRU cache bounded by MAX_ENTRIES, counting its evictions.
+    '''
+
+    def _cull(self):
+        before = len(self._cache)
+        super()._cull()
+        record('evictions', before - len(self._cache))
+
+
+class FileResponseCache(FileBasedCache):
+    '''
+    File-based cache bounded by MAX_ENTRIES, counting its evictions. Workers
+    pointing at the same directory share entries and invalidations.
+    '''
+    _culling = False
+
+    def _cull(self):
+        self._culling = True
+        try:
+            super()._cull()
+        finally:
+            self._culling = False
+
+    def _delete(self, fname):
+        deleted = super()._delete(fname)
+        if deleted and self._culling:
+            record('evictions')
+        return deleted
+
+
+def _generation_key(scope, value):
+    return f"generation:{scope}:{value}"
+
+
+def _generation(cache, scope, value):
+    '''
+    Current generation of a scope. Cached bodies embed it in their key, so
+    bumping it makes every variant (page, filters...) unreachable at once.
+    Generations start from the clock, so one that was evicted never comes
+    back with a number that older bodies were stored under.
+    '''
+    key = _generation_key(scope, value)
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, time.time_ns(), timeout=None)
+        generation = cache.get(key)
+    return generation
+
+
+def generation(scope, value=None):
+    return _generation(caches[settings.RESPONSE_GENERATIONS_CACHE], scope, value)
+
+
+def response_key(request, scope, value, generation):
+    params = sorted(
+        (name, sorted(values)) for name, values in request.query_params.lists()
+    )
+    # Bodies hold absolute next/previous links, so scheme and host count.
+    origin = request.build_absolute_uri('/')
+    digest = hashlib.md5(f"{origin}{request.path}?{params}".encode('utf-8')).hexdigest()
+    return f"response:{scope}:{value}:{generation}:{digest}"
+
+
+def cache_response(scope, kwarg=None):
+    '''
+    Caches the rendered JSON body of a successful GET handler under `scope`
+    (optionally narrowed by one of the URL kwargs). The bodies of these
+    endpoints don't depend on who asks, so every request shares them.
+    With read replicas, users pinned to the primary skip the cached bodies,
+    which may come from a lagging replica, and bodies read from a replica
+    are only kept REPLICA_MAX_LAG seconds.
+    '''
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            if request.accepted_renderer.format != 'json':
+                return method(view, request, *args, **kwargs)
+
+            cache = caches[RESPONSE_CACHE_ALIAS]
+            value = kwargs.get(kwarg) if kwarg else None
+            key = response_key(request, scope, value, generation(scope, value))
+            body = None if pinned_to_primary(request._request) else cache.get(key)
+            if body is not None:
+                record('hits')
+                return json_response(body, 'HIT')
+
+            record('misses')
+            response = method(view, request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            with timing_render():
+                body = request.accepted_renderer.render(
+                    response.data, request.accepted_media_type, view.get_renderer_context())
+            cache.set(key, body, settings.REPLICA_MAX_LAG
+                      if read_from_replica(request._request) else DEFAULT_TIMEOUT)
+            return json_response(body, 'MISS')
+        return wrapper
+    return decorator
+
+
+def json_response(body, status):
+    response = HttpResponse(body, content_type='application/json')
+    response['X-Cache'] = status
+    return response
+
+
+def invalidate(scope, value=None):
+    '''
+    Bumps the generation of a scope in the RESPONSE_GENERATIONS_CACHE, which
+    every worker reads its generations from.
+    '''
+    cache = caches[settings.RESPONSE_GENERATIONS_CACHE]
+    key = _generation_key(scope, value)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), timeout=None)
+    record('invalidations')
+
+
+def invalidate_series(series_pk):
+    '''
+    Drops the cached responses a write to a series (or to one of its reviews
+    or likes) can change: the series list, the series and its reviews.
+    Runs once the current transaction commits, so a concurrent reader can't
+    cache the old rows under the new generation.
+    '''
+    def run():
+        invalidate('series_list')
+        invalidate('series', series_pk)
+        invalidate('reviews', series_pk)
+    transaction.on_commit(run)
+
+
+def series_added_or_removed(sender, instance, created=True, **kwargs):
+    # The views invalidate after their own writes; this catches series
+    # created or deleted anywhere else (commands, the shell).
+    if created:
+        invalidate_series(instance.pk)
+
+
+post_save.connect(series_added_or_removed, sender=Series)
+post_delete.connect(series_added_or_removed, sender=Series)
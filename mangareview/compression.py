@@ -0,0 +1,64 @@
+try:
+    import brotli
+except ImportError:  # Responses are gzipped only.
+    brotli = None
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_string
+
+
+def accepted_encodings(header):
+    '''
+    Codings of an Accept-Encoding header, those refused with q=0 excepted.
+    '''
+    encodings = set()
+    for part in header.split(','):
+        coding, _, params = part.partition(';')
+        params = params.replace(' ', '')
+        if params.startswith('q=') and not params[2:].strip('0.'):
+            continue
+        encodings.add(coding.strip().lower())
+    return encodings
+
+
+class CompressionMiddleware:
+    '''
+    Compresses response bodies of at least COMPRESSION_MIN_SIZE bytes: with
+    brotli if the client accepts it and the brotli package is installed,
+    else with gzip. Unlike Django's GZipMiddleware, small bodies (most
+    detail views) are left alone, since compressing them costs more time
+    than it saves bandwidth. Streamed responses (the exports) compress
+    themselves.
+    '''
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if (response.streaming or response.has_header('Content-Encoding')
+                or len(response.content) < settings.COMPRESSION_MIN_SIZE):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encodings = accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if brotli is not None and 'br' in encodings:
+            coding = 'br'
+            content = brotli.compress(response.content, quality=settings.COMPRESSION_BROTLI_QUALITY)
+        elif 'gzip' in encodings:
+            coding = 'gzip'
+            content = compress_string(response.content)
+        else:
+            return response
+        if len(content) >= len(response.content):
+            return response
+
+        response.content = content
+        response['Content-Length'] = str(len(content))
+        response['Content-Encoding'] = coding
+        # The compressed body isn't byte-for-byte the one the ETag names.
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        return response
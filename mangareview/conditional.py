@@ -0,0 +1,78 @@
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+
+from .cache import generation
+from .models import Series, Review
+
+
+def _lookup(request, name, compute):
+    '''
+    Runs `compute` once per request, since condition() asks for the ETag
+    and the Last-Modified date separately.
+    '''
+    attr = f"_conditional_{name}"
+    if not hasattr(request, attr):
+        setattr(request, attr, compute())
+    return getattr(request, attr)
+
+
+def _series(request, series_pk):
+    return _lookup(request, 'series', lambda: Series.objects.filter(
+        pk=series_pk).values_list('version', 'updated_at').first())
+
+
+def series_etag(request, series_pk, *args, **kwargs):
+    row = _series(request, series_pk)
+    return f"series-{series_pk}-{row[0]}" if row else None
+
+
+def series_last_modified(request, series_pk, *args, **kwargs):
+    row = _series(request, series_pk)
+    return row[1] if row else None
+
+
+def _review(request, series_pk, review_pk):
+    # The body also shows the series title, so the series' version counts too.
+    return _lookup(request, 'review', lambda: Review.objects.filter(
+        pk=review_pk, series_id=series_pk).values_list(
+        'version', 'updated_at', 'series__version', 'series__updated_at').first())
+
+
+def review_etag(request, series_pk, review_pk, *args, **kwargs):
+    row = _review(request, series_pk, review_pk)
+    return f"review-{review_pk}-{row[0]}-{row[2]}" if row else None
+
+
+def review_last_modified(request, series_pk, review_pk, *args, **kwargs):
+    row = _review(request, series_pk, review_pk)
+    return max(row[1], row[3]) if row else None
+
+
+def series_list_etag(request, *args, **kwargs):
+    '''
+    Collection ETag: the generation of the cached series list, which every
+    write to a series moves (see invalidate_series). A cache lookup rather
+    than an aggregate over the whole table on every request.
+    '''
+    return f"series-list-{generation('series_list')}"
+
+
+def review_list_etag(request, series_pk, *args, **kwargs):
+    '''
+    The series' version (its title and rating head the page) plus the
+    generation of its cached reviews, which every review and like write
+    moves. One indexed lookup instead of aggregating the reviews.
+    '''
+    version = Series.objects.filter(pk=series_pk).values_list(
+        'version', flat=True).first()
+    if version is None:
+        return None
+    return f"reviews-{series_pk}-{version}-{generation('reviews', series_pk)}"
+
+
+conditional_series = method_decorator(condition(
+    etag_func=series_etag, last_modified_func=series_last_modified))
+conditional_review = method_decorator(condition(
+    etag_func=review_etag, last_modified_func=review_last_modified))
+conditional_series_list = method_decorator(condition(etag_func=series_list_etag))
+conditional_review_list = method_decorator(condition(etag_func=review_list_etag))
@@ -0,0 +1,194 @@
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.signals import request_started
+from django.db import connections
+from django.dispatch import receiver
+
+# name: (type, description), exposed at /metrics/ with a `mangareview_db_pool_` prefix.
+POOL_METRICS = {
+    'checkouts_total': ('counter', "Connections handed out by the pool."),
+    'waits_total': ('counter', "Checkouts that had to wait for a connection to be free."),
+    'wait_seconds_total': ('counter', "Time spent waiting for a free connection."),
+    'timeouts_total': ('counter', "Checkouts that gave up after DB_POOL_TIMEOUT seconds."),
+    'connects_total': ('counter', "Connections opened to the database."),
+    'discards_total': ('counter', "Connections closed as broken or older than CONN_MAX_AGE."),
+    'size': ('gauge', "Most connections the pool opens (DB_POOL_SIZE)."),
+    'open': ('gauge', "Connections open, in use or idle."),
+    'idle': ('gauge', "Connections open and waiting in the pool."),
+}
+
+_pools = {}
+_lock = threading.Lock()
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+def ping(connection):
+    '''
+    Whether a DB-API connection still works. Leaves no transaction open.
+    '''
+    try:
+        cursor = connection.cursor()
+        cursor.execute('SELECT 1')
+        cursor.close()
+        connection.rollback()
+        return True
+    except Exception:
+        return False
+
+
+def discard(connection):
+    try:
+        connection.close()
+    except Exception:
+        pass
+
+
+class ConnectionPool:
+    '''
+    The DB-API connections of one database, shared by the threads of a
+    process: at most `size` are open, a thread needing one while all are in
+    use waits up to `timeout` seconds for one to come back, and connections
+    are replaced once `max_age` seconds old (never if None).
+    '''
+
+    def __init__(self, size, timeout, max_age):
+        self.size = size
+        self.timeout = timeout
+        self.max_age = max_age
+        self.open = 0
+        self.idle = []
+        self.opened_at = {}
+        self.condition = threading.Condition()
+        self.stats = Counter()
+
+    def checkout(self, connect):
+        '''
+        An idle connection, checked first with DB_HEALTH_CHECKS, or a new one
+        from `connect()` if fewer than `size` are open.
+        '''
+        with self.condition:
+            self.stats['checkouts_total'] += 1
+            if not self.idle and self.open >= self.size:
+                self.stats['waits_total'] += 1
+                started = time.monotonic()
+                free = self.condition.wait_for(
+                    lambda: self.idle or self.open < self.size, self.timeout)
+                self.stats['wait_seconds_total'] += time.monotonic() - started
+                if not free:
+                    self.stats['timeouts_total'] += 1
+                    raise PoolTimeout(
+                        f"No database connection free after {self.timeout}s "
+                        f"({self.size} in use)")
+            if self.idle:
+                connection = self.idle.pop()
+            else:
+                # Taken now, connected outside the lock.
+                connection = None
+                self.open += 1
+
+        if connection is not None:
+            if not settings.DB_HEALTH_CHECKS or ping(connection):
+                return connection
+            # Replaced by a new connection in the same slot.
+            discard(connection)
+            with self.condition:
+                del self.opened_at[id(connection)]
+                self.stats['discards_total'] += 1
+        try:
+            connection = connect()
+        except BaseException:
+            with self.condition:
+                self.open -= 1
+                self.condition.notify()
+            raise
+        with self.condition:
+            self.opened_at[id(connection)] = time.monotonic()
+            self.stats['connects_total'] += 1
+        return connection
+
+    def checkin(self, connection):
+        '''
+        Takes a connection back, rolling back whatever its user left open.
+        Broken or old connections are closed instead.
+        '''
+        opened_at = self.opened_at.get(id(connection), 0)
+        expired = self.max_age is not None and time.monotonic() - opened_at >= self.max_age
+        try:
+            connection.rollback()
+        except Exception:
+            expired = True
+        if expired:
+            discard(connection)
+        with self.condition:
+            if expired:
+                self.opened_at.pop(id(connection), None)
+                self.open -= 1
+                self.stats['discards_total'] += 1
+            else:
+                self.idle.append(connection)
+            self.condition.notify()
+
+    def snapshot(self):
+        with self.condition:
+            return dict(self.stats, size=self.size, open=self.open, idle=len(self.idle))
+
+
+def pool_for(alias):
+    with _lock:
+        pool = _pools.get(alias)
+        if pool is None:
+            pool = _pools[alias] = ConnectionPool(
+                settings.DB_POOL_SIZE, settings.DB_POOL_TIMEOUT, settings.CONN_MAX_AGE)
+        return pool
+
+
+def pool_stats():
+    '''
+    {alias: counters and gauges} of the pools of this process.
+    '''
+    with _lock:
+        pools = dict(_pools)
+    return {alias: pool.snapshot() for alias, pool in sorted(pools.items())}
+
+
+class PooledDatabaseWrapper:
+    '''
+    Mixin for a backend's DatabaseWrapper (see mangareview/backends) taking
+    its connections from the process' pool, and giving them back instead of
+    closing them. Used with CONN_MAX_AGE = 0, so a connection goes back at
+    the end of every request.
+    '''
+
+    def get_new_connection(self, conn_params):
+        connect = super().get_new_connection
+        try:
+            return pool_for(self.alias).checkout(lambda: connect(conn_params))
+        except PoolTimeout as e:
+            raise self.Database.OperationalError(str(e)) from e
+
+    def _close(self):
+        if self.connection is not None:
+            pool_for(self.alias).checkin(self.connection)
+
+
+@receiver(request_started)
+def check_connections(**kwargs):
+    '''
+    With DB_HEALTH_CHECKS, closes the persistent connections that stopped
+    working since the last request (e.g. the database restarted), so the
+    request opens a new one instead of failing on its first query. Runs
+    after Django's own handler, which only closes connections that are too
+    old or that already raised an error.
+    '''
+    if not settings.DB_HEALTH_CHECKS:
+        return
+    for connection in connections.all():
+        if (connection.connection is not None and not connection.in_atomic_block
+                and not connection.is_usable()):
+            connection.close()
@@ -0,0 +1,140 @@
+import csv
+import json
+from datetime import datetime, time
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.middleware.gzip import re_accepts_gzip
+from django.utils import timezone
+from django.utils.cache import patch_vary_headers
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.text import compress_sequence
+from rest_framework.renderers import BaseRenderer
+
+# Columns of each export: output name -> ORM path.
+SERIES_COLUMNS = {
+    'id': 'id', 'title': 'title', 'author': 'author', 'rating': 'rating',
+    'genre': 'genre', 'year': 'year', 'about': 'about', 'completed': 'completed',
+    'anime': 'anime', 'chapters': 'chapters', 'volumes': 'volumes',
+    'official_translation': 'official_translation',
+    'number_of_reviews': 'number_of_reviews', 'version': 'version',
+    'updated_at': 'updated_at',
+}
+REVIEW_COLUMNS = {
+    'id': 'id', 'series_id': 'series_id', 'reviewer': 'reviewer__username',
+    'content': 'content', 'rating': 'rating', 'likes': 'likes_count', 'date': 'date',
+    'version': 'version', 'updated_at': 'updated_at',
+}
+
+# Rows fetched per round trip from the server-side cursor, and bytes per
+# chunk written to the client.
+FETCH_SIZE = 2000
+WRITE_SIZE = 64 * 1024
+
+
+class JSONLinesRenderer(BaseRenderer):
+    '''
+    One JSON document per line. Exports stream their rows themselves; this
+    only renders error bodies.
+    '''
+    media_type = 'application/x-ndjson'
+    format = 'jsonl'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json_line(data).encode(self.charset)
+
+
+class CSVRenderer(BaseRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        data = data if isinstance(data, dict) else {'detail': data}
+        return ''.join(csv_lines([data.values()], data.keys())).encode(self.charset)
+
+
+def json_line(value):
+    return json.dumps(value, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+
+def jsonl_lines(rows, columns):
+    for row in rows:
+        yield json_line(dict(zip(columns, row)))
+
+
+class _Line:
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows, columns):
+    '''
+    CSV with a header row. Genres are joined with ";", like import_catalog
+    reads them.
+    '''
+    writer = csv.writer(_Line())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow([
+            ';'.join(value) if isinstance(value, list) else value for value in row
+        ])
+
+
+def buffered(lines, size=WRITE_SIZE):
+    '''
+    Joins lines into chunks of about `size` characters, so the server
+    doesn't write (and gzip doesn't flush) once per row.
+    '''
+    chunk, length = [], 0
+    for line in lines:
+        chunk.append(line)
+        length += len(line)
+        if length >= size:
+            yield ''.join(chunk).encode('utf-8')
+            chunk, length = [], 0
+    if chunk:
+        yield ''.join(chunk).encode('utf-8')
+
+
+def parse_since(value):
+    '''
+    `since=` as an ISO datetime or date (midnight, in the server's time
+    zone). Returns None if it is neither.
+    '''
+    since = parse_datetime(value)
+    if since is None:
+        day = parse_date(value)
+        if day is None:
+            return None
+        since = datetime.combine(day, time())
+    if timezone.is_naive(since):
+        since = timezone.make_aware(since)
+    return since
+
+
+def export_response(request, queryset, columns, name):
+    '''
+    Streams `queryset` as JSONL or CSV (the renderer picked by content
+    negotiation), oldest change first. Rows are read through a server-side
+    cursor and written as they come, so memory stays flat whatever the size
+    of the table. Gzipped on the fly for clients that accept it.
+    '''
+    rows = queryset.order_by('updated_at', 'pk').values_list(
+        *columns.values()).iterator(chunk_size=FETCH_SIZE)
+    renderer = request.accepted_renderer
+    lines = csv_lines(rows, columns) if renderer.format == 'csv' else jsonl_lines(rows, columns)
+
+    content = buffered(lines)
+    gzipped = re_accepts_gzip.search(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+    if gzipped:
+        content = compress_sequence(content)
+
+    response = StreamingHttpResponse(
+        content, content_type=f"{renderer.media_type}; charset=utf-8")
+    response['Content-Disposition'] = f'attachment; filename="{name}.{renderer.format}"'
+    if gzipped:
+        response['Content-Encoding'] = 'gzip'
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
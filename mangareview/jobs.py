@@ -0,0 +1,114 @@
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .cache import invalidate_series
+from .models import Series, RatingJob
+
+logger = logging.getLogger(__name__)
+
+# Jobs recomputed per transaction.
+BATCH_SIZE = 500
+
+_wakeup = threading.Event()
+_workers = []
+_workers_lock = threading.Lock()
+
+
+def enqueue_rating(series_pk):
+    '''
+    Queues a recompute of the series' rating, in the caller's transaction so
+    the job is durable exactly when the write is. A job already pending for
+    the series absorbs this one, unless it has been pending for longer than
+    RATING_MAX_STALENESS (the workers are down or behind): the series is then
+    recomputed right away.
+    '''
+    jobs = RatingJob.objects.filter(series_id=series_pk)
+    created_at = jobs.values_list('created_at', flat=True).first()
+    if created_at is None:
+        RatingJob.objects.bulk_create([RatingJob(series_id=series_pk)], ignore_conflicts=True)
+    elif created_at < timezone.now() - timedelta(seconds=settings.RATING_MAX_STALENESS):
+        jobs.delete()
+        Series.rebuild_ratings([series_pk])
+        invalidate_series(series_pk)
+        return
+    else:
+        jobs.update(generation=F('generation') + 1)
+    transaction.on_commit(wake_workers)
+
+
+def run_pending(limit=BATCH_SIZE):
+    '''
+    Recomputes up to `limit` queued series in one transaction and drops their
+    jobs. Returns how many were run. A job that another write bumped in the
+    meantime stays queued, since its write may not be counted yet.
+    '''
+    with transaction.atomic():
+        jobs = RatingJob.objects.order_by('created_at')
+        if connection.features.has_select_for_update_skip_locked:
+            # Concurrent workers (threads or processes) take different jobs.
+            jobs = jobs.select_for_update(skip_locked=True)
+        jobs = list(jobs.values_list('series_id', 'generation')[:limit])
+        if not jobs:
+            return 0
+
+        pks = [series_pk for series_pk, _ in jobs]
+        Series.rebuild_ratings(pks)
+        done = Q()
+        for series_pk, generation in jobs:
+            done |= Q(series_id=series_pk, generation=generation)
+        RatingJob.objects.filter(done).delete()
+        for series_pk in pks:
+            invalidate_series(series_pk)
+    return len(jobs)
+
+
+def run_all():
+    total = 0
+    while True:
+        count = run_pending()
+        total += count
+        if count < BATCH_SIZE:
+            return total
+
+
+def wake_workers():
+    start_workers()
+    _wakeup.set()
+
+
+def start_workers():
+    '''
+    Starts the RATING_WORKERS threads of this process, once.
+    '''
+    with _workers_lock:
+        while len(_workers) < settings.RATING_WORKERS:
+            worker = threading.Thread(
+                target=_work, name=f"rating-worker-{len(_workers)}", daemon=True)
+            worker.start()
+            _workers.append(worker)
+
+
+def _work():
+    # Jobs queued by a process that died are picked up by the periodic poll.
+    poll = max(settings.RATING_MAX_STALENESS / 2, settings.RATING_JOB_DELAY)
+    while True:
+        _wakeup.wait(timeout=poll)
+        # Let the burst that woke us up pile onto the same jobs.
+        time.sleep(settings.RATING_JOB_DELAY)
+        _wakeup.clear()
+        close_old_connections()
+        try:
+            run_all()
+        except Exception:
+            # e.g. SQLite refusing a write while a request holds the lock.
+            logger.exception("Rating jobs failed, retrying")
+            _wakeup.set()
+        finally:
+            close_old_connections()
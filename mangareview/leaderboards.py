@@ -0,0 +1,231 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Min, Sum
+from django.utils import timezone
+
+from .models import GENRES, Series, SeriesActivity, Leaderboard, LeaderboardEntry
+
+TRENDING = 'trending'
+RATING_BOARDS = ['top_rated', 'most_reviewed'] + [f"top_rated:{genre}" for genre in GENRES]
+BOARDS = RATING_BOARDS + [TRENDING]
+
+# A review counts as much as this many likes towards trending.
+REVIEW_WEIGHT = 3
+
+# Past this many series at once (imports, rating job batches), the boards
+# are rebuilt rather than updated series by series.
+MAX_INCREMENTAL = 20
+
+
+def rating_score(board, rating, number_of_reviews, mask):
+    '''
+    Score of a series on a rating board, None if it doesn't qualify.
+    '''
+    if board == 'most_reviewed':
+        return number_of_reviews or None
+    if board.startswith('top_rated:') and not mask & (1 << GENRES.index(board.split(':', 1)[1])):
+        return None
+    return rating
+
+
+def ranking(board):
+    '''
+    (series pk, score) of the series qualifying for `board`, best first.
+    '''
+    if board == TRENDING:
+        return (
+            SeriesActivity.objects.filter(hour__gte=window_start()).values('series').order_by()
+            .annotate(score=Sum(F('reviews') * REVIEW_WEIGHT + F('likes')))
+            .filter(score__gt=0).order_by('-score', '-series').values_list('series', 'score')
+        )
+    if board == 'most_reviewed':
+        return Series.objects.filter(number_of_reviews__gt=0).order_by(
+            '-number_of_reviews', '-pk').values_list('pk', 'number_of_reviews')
+    series = Series.objects.filter(rating__isnull=False)
+    if board.startswith('top_rated:'):
+        bit = 1 << GENRES.index(board.split(':', 1)[1])
+        series = series.annotate(genre_bit=F('genre_mask').bitand(bit)).filter(genre_bit__gt=0)
+    return series.order_by('-rating', '-pk').values_list('pk', 'rating')
+
+
+def window_start():
+    return hour_of(timezone.now()) - timedelta(hours=settings.LEADERBOARD_TRENDING_HOURS - 1)
+
+
+def hour_of(moment):
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def rebuild(name):
+    '''
+    Recomputes a board from scratch: one query over the indexed score.
+    '''
+    with transaction.atomic():
+        board, _ = Leaderboard.objects.select_for_update().get_or_create(name=name)
+        rows = list(ranking(name)[:settings.LEADERBOARD_SIZE])
+        board.entries.all().delete()
+        LeaderboardEntry.objects.bulk_create([
+            LeaderboardEntry(board=board, series_id=pk, score=score) for pk, score in rows
+        ])
+        board.complete = len(rows) < settings.LEADERBOARD_SIZE
+        board.refreshed_at = timezone.now()
+        board.save()
+        if name == TRENDING:
+            SeriesActivity.objects.filter(hour__lt=window_start()).delete()
+    return board
+
+
+def place(board, series_pk, score):
+    '''
+    Moves one series on a board after its score changed. The entries stay
+    the exact top of the ranking: a series comes in when it beats the
+    lowest entry, and an entry that falls to the bottom leaves, since a
+    series outside might now beat it. The board is rebuilt when it has
+    lost half its entries that way.
+    '''
+    entries = board.entries.all()
+    current = entries.filter(series_id=series_pk).first()
+    lowest = entries.exclude(series_id=series_pk).order_by('score', 'series_id').values_list(
+        'score', 'series_id').first()
+    beats_lowest = score is not None and lowest is not None and (score, series_pk) > lowest
+
+    if score is not None and (board.complete or beats_lowest):
+        if current is not None:
+            if current.score != score:
+                entries.filter(pk=current.pk).update(score=score)
+            return
+        LeaderboardEntry.objects.create(board=board, series_id=series_pk, score=score)
+        if entries.count() > settings.LEADERBOARD_SIZE:
+            entries.filter(pk__in=entries.order_by('score', 'series_id').values('pk')[:1]).delete()
+            board.complete = False
+            board.save(update_fields=['complete'])
+    elif current is not None:
+        current.delete()
+        if not board.complete and entries.count() < settings.LEADERBOARD_SIZE // 2:
+            board.complete = rebuild(board.name).complete
+
+
+def candidate_boards(mask):
+    '''
+    The rating boards a series with this genre mask can appear on.
+    '''
+    return ['top_rated', 'most_reviewed'] + [
+        f"top_rated:{genre}" for index, genre in enumerate(GENRES) if mask & (1 << index)]
+
+
+def place_series(pks):
+    '''
+    Updates the rating boards for the given series. The boards are first
+    read without a lock to find the ones a new score moves the series on:
+    those it has an entry on, and those it qualifies for and beats the
+    lowest entry of (any entry, on a complete board). Only these are then
+    locked and updated, so writes to unrelated series don't queue up
+    behind each other.
+    '''
+    pks = list(pks)
+    if len(pks) > MAX_INCREMENTAL:
+        with transaction.atomic():
+            names = list(Leaderboard.objects.select_for_update().filter(
+                name__in=RATING_BOARDS).order_by('name').values_list('name', flat=True))
+            for name in names:
+                rebuild(name)
+        return
+
+    boards = {
+        name: (complete, lowest) for name, complete, lowest in
+        Leaderboard.objects.filter(name__in=RATING_BOARDS).annotate(
+            lowest=Min('entries__score')).values_list('name', 'complete', 'lowest')
+    }
+    if not boards:
+        return
+    current = {
+        (name, pk): score for name, pk, score in LeaderboardEntry.objects.filter(
+            series_id__in=pks, board__in=boards).values_list('board_id', 'series_id', 'score')
+    }
+    # An entry whose score rises stays on its board: {(series, score): boards}.
+    rises, moves = {}, {}
+    rows = Series.objects.filter(pk__in=pks).values_list(
+        'pk', 'rating', 'number_of_reviews', 'genre_mask')
+    for pk, rating, number_of_reviews, mask in rows:
+        names = set(candidate_boards(mask)) | {name for name, entry in current if entry == pk}
+        for name in names & boards.keys():
+            score = rating_score(name, rating, number_of_reviews, mask)
+            complete, lowest = boards[name]
+            if (name, pk) in current:
+                if current[name, pk] == score:
+                    continue
+                if score is not None and score > current[name, pk]:
+                    rises.setdefault((pk, score), []).append(name)
+                    continue
+            elif score is None or not (complete or lowest is not None and score >= lowest):
+                continue
+            moves.setdefault(name, []).append((pk, score))
+    if not rises and not moves:
+        return
+
+    with transaction.atomic():
+        # In name order, so that two writes can't each hold a board the other waits for.
+        names = {name for names in rises.values() for name in names} | moves.keys()
+        locked = Leaderboard.objects.select_for_update().filter(name__in=names).order_by('name')
+        for board in locked:
+            for pk, score in moves.get(board.name, ()):
+                place(board, pk, score)
+        for (pk, score), names in rises.items():
+            LeaderboardEntry.objects.filter(board__in=names, series_id=pk).update(score=score)
+
+
+def place_trending(pks):
+    with transaction.atomic():
+        board = Leaderboard.objects.select_for_update().filter(name=TRENDING).first()
+        if board is None:
+            return
+        scores = dict(ranking(TRENDING).filter(series__in=pks))
+        for pk in pks:
+            place(board, pk, scores.get(pk))
+
+
+def series_changed(pks):
+    '''
+    Queues the rating boards update of the given series for when the
+    current transaction commits, so it sees the committed scores and
+    doesn't hold the boards locked for the length of the write.
+    '''
+    pks = list(pks)
+    transaction.on_commit(lambda: place_series(pks))
+
+
+def record_activity(series_pk, reviews=0, likes=0):
+    '''
+    Counts reviews and likes (negative ones take them back) in the current
+    hour of the series, once the write commits, and moves the series on the
+    trending board.
+    '''
+    def run():
+        hour = hour_of(timezone.now())
+        bucket = SeriesActivity.objects.filter(series_id=series_pk, hour=hour)
+        delta = {'reviews': F('reviews') + reviews, 'likes': F('likes') + likes}
+        if not bucket.update(**delta):
+            try:
+                with transaction.atomic():
+                    SeriesActivity.objects.create(
+                        series_id=series_pk, hour=hour, reviews=reviews, likes=likes)
+            except IntegrityError:
+                bucket.update(**delta)
+        place_trending([series_pk])
+    transaction.on_commit(run)
+
+
+def top(name, k):
+    '''
+    The k best entries of a board, with their series. The trending board is
+    rebuilt once it is LEADERBOARD_TRENDING_REFRESH seconds old, since its
+    window slides even without writes.
+    '''
+    board = Leaderboard.objects.filter(name=name).first()
+    stale = timezone.now() - timedelta(seconds=settings.LEADERBOARD_TRENDING_REFRESH)
+    if board is None or (name == TRENDING and board.refreshed_at < stale):
+        board = rebuild(name)
+    entries = board.entries.select_related('series').order_by('-score', '-series_id')[:k]
+    return board, list(entries)
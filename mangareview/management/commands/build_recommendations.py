@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from mangareview import recommendations
+
+
+class Command(BaseCommand):
+    help = (
+        "Recomputes the similar series of every series and the recommended "
+        "series of every user from all reviews and likes (item-item "
+        "collaborative filtering on sparse matrices). Needs numpy and scipy. "
+        "Meant to run periodically, e.g. nightly."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--size', type=int, default=settings.RECOMMENDATIONS_SIZE,
+            help="Similar series and recommendations stored per series and per user "
+                 "(default RECOMMENDATIONS_SIZE).",
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=1000,
+            help="Series (then users) scored at once; bounds memory (default 1000).",
+        )
+
+    def handle(self, *args, **options):
+        if recommendations.np is None:
+            raise CommandError("build_recommendations needs numpy and scipy.")
+        if options['size'] < 1 or options['chunk_size'] < 1:
+            raise CommandError("--size and --chunk-size must be positive.")
+        timings, counts = recommendations.build(options['size'], options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            "Stored {similar} similar series and {recommendations} recommendations "
+            "from {pairs} user-series pairs in {total:.1f}s ({steps}).".format(
+                total=sum(timings.values()),
+                steps=", ".join(f"{name} {seconds}s" for name, seconds in timings.items()),
+                **counts)))
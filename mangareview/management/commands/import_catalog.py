@@ -0,0 +1,242 @@
+import csv
+import gzip
+import io
+import itertools
+import json
+import sys
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from mangareview.cache import invalidate_series
+from mangareview.leaderboards import series_changed
+from mangareview.models import Series, Review, genre_mask
+from mangareview.serializers import SeriesSerializer, ReviewSerializer
+
+# Fields an import can set on a series; everything else is derived.
+SERIES_FIELDS = [
+    'title', 'author', 'genre', 'year', 'about', 'completed', 'anime',
+    'chapters', 'volumes', 'official_translation',
+]
+
+
+def open_input(path):
+    if path == '-':
+        return io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8')
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', newline='')
+    return open(path, encoding='utf-8', newline='')
+
+
+def read_jsonl(stream):
+    for number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            yield number, json.loads(line)
+        except ValueError as e:
+            yield number, e
+
+
+def read_csv(stream):
+    '''
+    One series per row, with the genres separated by ";". Empty cells are
+    left out so that optional fields get their defaults.
+    '''
+    for number, row in enumerate(csv.DictReader(stream), 2):
+        record = {key: value for key, value in row.items() if key and value != ''}
+        if 'genre' in record:
+            record['genre'] = [genre.strip() for genre in record['genre'].split(';')]
+        yield number, record
+
+
+class Command(BaseCommand):
+    report_every = 5  # seconds between progress lines
+    help = (
+        "Bulk imports series (and, from JSONL, their reviews) from a JSONL or "
+        "CSV file, in chunks: each chunk is validated, inserted with bulk_create "
+        "and has its series' ratings rebuilt once. Series that already exist "
+        "(same title and author) are skipped, or updated with --update."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Input file, optionally gzipped (.gz), or - for stdin.")
+        parser.add_argument(
+            '--format', choices=['jsonl', 'csv'],
+            help="Input format. Guessed from the file extension by default.",
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=1000,
+            help="Records validated and written per transaction (default 1000).",
+        )
+        parser.add_argument(
+            '--update', action='store_true',
+            help="Overwrite the fields of series that already exist instead of skipping them.",
+        )
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or ('csv' if '.csv' in options['path'] else 'jsonl')
+        if options['chunk_size'] < 1:
+            raise CommandError("--chunk-size must be positive.")
+        self.update = options['update']
+        self.totals = dict.fromkeys(
+            ['records', 'created', 'updated', 'skipped', 'reviews', 'rejected'], 0)
+
+        started = self.reported = time.monotonic()
+        try:
+            stream = open_input(options['path'])
+        except OSError as e:
+            raise CommandError(e)
+        with stream:
+            records = read_csv(stream) if fmt == 'csv' else read_jsonl(stream)
+            while True:
+                chunk = list(itertools.islice(records, options['chunk_size']))
+                if not chunk:
+                    break
+                self.import_chunk(chunk)
+                self.totals['records'] += len(chunk)
+                self.report(started)
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            "Imported {records} records in {elapsed:.1f}s: {created} series created, "
+            "{updated} updated, {skipped} skipped, {reviews} reviews, {rejected} rejected."
+            .format(elapsed=elapsed, **self.totals)))
+
+    def report(self, started):
+        if time.monotonic() - self.reported < self.report_every:
+            return
+        self.reported = time.monotonic()
+        elapsed = self.reported - started
+        rate = self.totals['records'] / elapsed if elapsed else 0
+        self.stderr.write(f"{self.totals['records']} records, {rate:.0f} records/s")
+
+    def reject(self, number, errors):
+        self.totals['rejected'] += 1
+        self.stderr.write(f"Record {number}: {errors}")
+
+    def validate(self, serializer, number, data):
+        '''
+        Runs the validation of the API on one record. The serializer is built
+        once per chunk: building its fields costs more than validating.
+        '''
+        try:
+            return serializer.run_validation(data)
+        except ValidationError as e:
+            self.reject(number, e.detail)
+            return None
+
+    def import_chunk(self, chunk):
+        series_by_key, reviews = {}, []
+        serializer = SeriesSerializer()
+        for number, record in chunk:
+            if not isinstance(record, dict):
+                self.reject(number, record)
+                continue
+            data = self.validate(serializer, number, {
+                field: record[field] for field in SERIES_FIELDS if field in record})
+            if data is None:
+                continue
+            key = (data['title'], data['author'])
+            series_by_key[key] = data
+            for review in record.get('reviews') or []:
+                reviews.append((number, key, review))
+
+        with transaction.atomic():
+            pks, changed = self.write_series(series_by_key)
+            reviewed = self.write_reviews(reviews, pks)
+            Series.rebuild_ratings(reviewed)
+            # bulk_update() skips Series.save(): move the other series written
+            # on the boards here (a new genre changes the genre boards).
+            series_changed(changed - reviewed)
+            for pk in changed | reviewed:
+                invalidate_series(pk)
+
+    def existing(self, keys):
+        titles = {title for title, _ in keys}
+        return {
+            (title, author): pk for title, author, pk in
+            Series.objects.filter(title__in=titles).values_list('title', 'author', 'pk')
+            if (title, author) in keys
+        }
+
+    def write_series(self, series_by_key):
+        '''
+        Inserts the new series and skips or updates the existing ones.
+        Returns the pk of every series of the chunk by (title, author), and
+        the pks of the series created or updated.
+        '''
+        existing = self.existing(series_by_key.keys())
+        new = []
+        for key, data in series_by_key.items():
+            if key not in existing:
+                series = Series(**data)
+                series.genre_mask = genre_mask(series.genre)
+                new.append(series)
+        # ignore_conflicts covers a concurrent insert of the same series.
+        Series.objects.bulk_create(new, ignore_conflicts=True)
+        pks = self.existing(series_by_key.keys())
+        changed = {pk for key, pk in pks.items() if key not in existing}
+        self.totals['created'] += len(changed)
+
+        if self.update and existing:
+            fields = set()
+            series_list = []
+            for series in Series.objects.filter(pk__in=existing.values()):
+                data = series_by_key[(series.title, series.author)]
+                for field, value in data.items():
+                    setattr(series, field, value)
+                fields.update(data)
+                series.genre_mask = genre_mask(series.genre)
+                series.version = F('version') + 1
+                series.updated_at = timezone.now()
+                series_list.append(series)
+            Series.objects.bulk_update(
+                series_list, [*fields, 'genre_mask', 'version', 'updated_at'])
+            changed.update(existing.values())
+            self.totals['updated'] += len(series_list)
+        else:
+            self.totals['skipped'] += len(existing)
+        return pks, changed
+
+    def write_reviews(self, reviews, pks):
+        '''
+        Inserts the reviews of the chunk, by reviewer username. A reviewer
+        reviews a series once, so reviews of an already reviewed series are
+        rejected. Returns the pks of the series that got reviews.
+        '''
+        if not reviews:
+            return set()
+        users = dict(User.objects.filter(
+            username__in={review.get('reviewer') for _, _, review in reviews
+                          if isinstance(review, dict)}
+        ).values_list('username', 'pk'))
+        reviewed = set(Review.objects.filter(
+            series__in=pks.values()).values_list('reviewer', 'series'))
+
+        new = []
+        serializer = ReviewSerializer()
+        for number, key, review in reviews:
+            if not isinstance(review, dict) or review.get('reviewer') not in users:
+                self.reject(number, f"unknown reviewer in review {review!r}")
+                continue
+            reviewer, series = users[review['reviewer']], pks[key]
+            if (reviewer, series) in reviewed:
+                self.reject(number, f"{review['reviewer']} already reviewed {key[0]}")
+                continue
+            data = self.validate(serializer, number, review)
+            if data is None:
+                continue
+            reviewed.add((reviewer, series))
+            new.append(Review(
+                reviewer_id=reviewer, series_id=series,
+                content=data['content'], rating=data['rating'],
+            ))
+        Review.objects.bulk_create(new)
+        self.totals['reviews'] += len(new)
+        return {review.series_id for review in new}
@@ -0,0 +1,107 @@
+import math
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from mangareview.cache import invalidate_series
+from mangareview.models import Series, Review
+
+# Series checked, then rebuilt under lock, at a time.
+BATCH_SIZE = 500
+
+
+def same_rating(a, b):
+    if a is None or b is None:
+        return a is b
+    # Ratings are rounded to two decimals, so allow one step of rounding noise.
+    return math.isclose(a, b, abs_tol=0.01)
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuilds every review's like counter and every series' running rating "
+        "sums from scratch and checks them against the reference formula "
+        "(Series.get_rating)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help="Only report series that are out of sync, don't write anything.",
+        )
+
+    def handle(self, *args, **options):
+        checked = 0
+        stale = 0
+        stale_reviews = 0
+        pks = list(Series.objects.order_by('pk').values_list('pk', flat=True))
+        for start in range(0, len(pks), BATCH_SIZE):
+            batch = pks[start:start + BATCH_SIZE]
+            rebuilt = self.check_batch(batch, options['check'])
+            checked += len(batch)
+            stale += rebuilt['series']
+            stale_reviews += rebuilt['reviews']
+
+        if options['check'] and (stale or stale_reviews):
+            raise CommandError(
+                f"{stale} of {checked} series and {stale_reviews} reviews are out of sync.")
+        verb = "out of sync" if options['check'] else "rebuilt"
+        self.stdout.write(self.style.SUCCESS(
+            f"Checked {checked} series, {stale} series and {stale_reviews} reviews {verb}."))
+
+    def check_batch(self, pks, check):
+        '''
+        Reports the series of `pks` and their reviews that are out of sync
+        and, unless `check`, rebuilds them. Like counters are recounted by
+        the database in the UPDATE itself, and the series are rebuilt with
+        Series.rebuild_ratings, under the same row locks as the API's writes,
+        so a review or like landing meanwhile isn't lost.
+        '''
+        counts = {'series': 0, 'reviews': 0}
+        rebuild, recounted = [], set()
+        likes = Review.likes.through.objects.filter(review=OuterRef('pk')).order_by().values(
+            'review').annotate(count=Count('pk')).values('count')
+        for series in Series.objects.filter(pk__in=pks).order_by('pk'):
+            stale_likes = (
+                series.reviews.annotate(num_likes=Count('likes'))
+                .exclude(likes_count=F('num_likes'))
+            )
+            for review in stale_likes:
+                counts['reviews'] += 1
+                self.stdout.write(
+                    f"Review {review.pk}: stored {review.likes_count} likes, "
+                    f"expected {review.num_likes}"
+                )
+                if not check:
+                    Review.objects.filter(pk=review.pk).update(
+                        likes_count=Coalesce(Subquery(likes), 0), **Review.touched())
+                    recounted.add(series.pk)
+
+            rating_sum, rating_weight, number_of_reviews = series.rating_totals()
+            expected = series.get_rating if rating_weight else None
+
+            in_sync = (
+                series.rating_weight == rating_weight
+                and series.number_of_reviews == number_of_reviews
+                and math.isclose(series.rating_sum, rating_sum, abs_tol=1e-6)
+                and same_rating(series.rating, expected)
+            )
+            if in_sync:
+                continue
+
+            counts['series'] += 1
+            rebuild.append(series.pk)
+            self.stdout.write(
+                f"Series {series.pk} ({series.title}): stored rating {series.rating} "
+                f"(sum={series.rating_sum}, weight={series.rating_weight}, "
+                f"reviews={series.number_of_reviews}), expected {expected} "
+                f"(sum={rating_sum}, weight={rating_weight}, reviews={number_of_reviews})"
+            )
+
+        if not check:
+            if rebuild:
+                Series.rebuild_ratings(rebuild)
+            for pk in recounted.union(rebuild):
+                invalidate_series(pk)
+        return counts
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from mangareview.leaderboards import BOARDS, rebuild
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuilds every leaderboard from scratch, e.g. after editing series "
+        "outside the API, or periodically to keep the trending board fresh "
+        "when it is rarely read."
+    )
+
+    def handle(self, *args, **options):
+        for name in BOARDS:
+            rebuild(name)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {len(BOARDS)} leaderboards."))
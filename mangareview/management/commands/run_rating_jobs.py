@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from mangareview.jobs import run_all
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs every queued rating recompute job (see RATING_ASYNC), e.g. "
+        "after a deploy or when no web process is running the queue."
+    )
+
+    def handle(self, *args, **options):
+        count = run_all()
+        self.stdout.write(self.style.SUCCESS(f"Recomputed {count} series."))
@@ -0,0 +1,213 @@
+import bisect
+import contextvars
+import random
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from .dbpool import POOL_METRICS, pool_stats
+
+SECONDS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERIES = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200)
+BYTES = (128, 512, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# name: (description, buckets), exposed with a `mangareview_` prefix.
+METRICS = {
+    'request_duration_seconds': ("Wall time of the request, middlewares included.", SECONDS),
+    'db_queries': ("Database queries run by the request.", QUERIES),
+    'db_duration_seconds': ("Time spent running those queries.", SECONDS),
+    'render_duration_seconds': ("Time spent rendering (serializing) the response body.", SECONDS),
+    'response_size_bytes': ("Size of the response body, streamed ones excepted.", BYTES),
+}
+
+_histograms = {}
+_lock = threading.Lock()
+
+# The RenderTimer of the request being measured, if any.
+_render_timer = contextvars.ContextVar('render_timer', default=None)
+
+
+class Histogram:
+    '''
+    Prometheus-style histogram: non-cumulative counts per bucket (the last
+    one being +Inf), made cumulative when exposed.
+    '''
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+def observe(method, route, **values):
+    with _lock:
+        for name, value in values.items():
+            key = (name, method, route)
+            histogram = _histograms.get(key)
+            if histogram is None:
+                histogram = _histograms[key] = Histogram(METRICS[name][1])
+            histogram.observe(value)
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+
+
+def _labels(method, route, le=None):
+    pairs = [('method', method), ('route', route)]
+    if le is not None:
+        pairs.append(('le', le))
+    escaped = (
+        (name, value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in pairs
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+def exposition():
+    '''
+    The histograms of this process, and the counters of its connection
+    pools (see mangareview/dbpool.py), in the Prometheus text format (0.0.4).
+    '''
+    with _lock:
+        snapshot = {
+            key: (histogram.buckets, list(histogram.counts), histogram.sum)
+            for key, histogram in _histograms.items()
+        }
+    lines = []
+    for name, (description, _) in METRICS.items():
+        metric = f"mangareview_{name}"
+        lines.append(f"# HELP {metric} {description}")
+        lines.append(f"# TYPE {metric} histogram")
+        for (key_name, method, route), (buckets, counts, total) in sorted(snapshot.items()):
+            if key_name != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(buckets + ('+Inf',), counts):
+                cumulative += count
+                lines.append(f"{metric}_bucket{_labels(method, route, str(bound))} {cumulative}")
+            lines.append(f"{metric}_sum{_labels(method, route)} {total}")
+            lines.append(f"{metric}_count{_labels(method, route)} {cumulative}")
+
+    pools = pool_stats()
+    for name, (kind, description) in POOL_METRICS.items():
+        metric = f"mangareview_db_pool_{name}"
+        lines.append(f"# HELP {metric} {description}")
+        lines.append(f"# TYPE {metric} {kind}")
+        for alias, values in pools.items():
+            lines.append(f'{metric}{{database="{alias}"}} {values.get(name, 0)}')
+    return '\n'.join(lines) + '\n'
+
+
+class QueryTimer:
+    '''
+    Database execute wrapper counting the queries it sees and their time.
+    '''
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+
+
+class RenderTimer:
+    '''
+    Render time of one request. Nested timed blocks count once.
+    '''
+
+    def __init__(self):
+        self.duration = 0
+        self.depth = 0
+
+
+@contextmanager
+def timing_render():
+    '''
+    Counts the time spent in the block as render time of the request being
+    measured: serializer data and renderers, wherever they run (the view,
+    cache_response, the thread of an async view).
+    '''
+    timer = _render_timer.get()
+    if timer is None:
+        yield
+        return
+    timer.depth += 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timer.depth -= 1
+        if not timer.depth:
+            timer.duration += time.perf_counter() - started
+
+
+class MetricsMiddleware:
+    '''
+    Records, per URL pattern and method, the wall time, query count, query
+    time, render time and body size of a METRICS_SAMPLE_RATE share of the
+    requests. With a rate of 0 Django drops the middleware altogether.
+    '''
+
+    def __init__(self, get_response):
+        if not settings.METRICS_SAMPLE_RATE:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = settings.METRICS_SAMPLE_RATE
+
+    def __call__(self, request):
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        queries = QueryTimer()
+        render = request._metrics_render = RenderTimer()
+        token = _render_timer.set(render)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(queries))
+                response = self.get_response(request)
+        finally:
+            _render_timer.reset(token)
+        duration = time.perf_counter() - started
+
+        match = request.resolver_match
+        values = {
+            'request_duration_seconds': duration,
+            'db_queries': queries.count,
+            'db_duration_seconds': queries.duration,
+            'render_duration_seconds': render.duration,
+        }
+        if not response.streaming:
+            values['response_size_bytes'] = len(response.content)
+        observe(request.method, match.route if match else '<unmatched>', **values)
+        return response
+
+    def process_template_response(self, request, response):
+        # Called right before DRF responses are rendered, unless already
+        # rendered (async views), in which case the callback runs at once.
+        render = getattr(request, '_metrics_render', None)
+        if render is not None and not response.is_rendered:
+            started = time.perf_counter()
+
+            def rendered(response):
+                render.duration += time.perf_counter() - started
+
+            response.add_post_render_callback(rendered)
+        return response
@@ -0,0 +1,39 @@
+# Generated by Django 4.0.3 on 2026-10-18 06:56
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_rating_sums(apps, schema_editor):
+    Series = apps.get_model('mangareview', 'Series')
+    Review = apps.get_model('mangareview', 'Review')
+    for series in Series.objects.all().iterator():
+        rating_sum, rating_weight = 0, 0
+        reviews = Review.objects.filter(series=series).annotate(num_likes=Count('likes'))
+        for rating, num_likes in reviews.values_list('rating', 'num_likes'):
+            rating_sum += rating * (num_likes + 1)
+            rating_weight += num_likes + 1
+        series.rating_sum = rating_sum
+        series.rating_weight = rating_weight
+        series.save(update_fields=['rating_sum', 'rating_weight'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mangareview', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='series',
+            name='rating_sum',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='series',
+            name='rating_weight',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_rating_sums, migrations.RunPython.noop),
+    ]
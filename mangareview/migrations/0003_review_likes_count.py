@@ -0,0 +1,28 @@
+# Generated by Django 4.0.3 on 2026-10-18 07:10
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_likes_count(apps, schema_editor):
+    Review = apps.get_model('mangareview', 'Review')
+    reviews = Review.objects.annotate(num_likes=Count('likes')).filter(num_likes__gt=0)
+    for review in reviews.iterator():
+        review.likes_count = review.num_likes
+        review.save(update_fields=['likes_count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mangareview', '0002_series_rating_sums'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='review',
+            name='likes_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_likes_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.0.3 on 2026-10-18 06:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mangareview', '0003_review_likes_count'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['series', '-date', '-id'], name='review_series_date_idx'),
+        ),
+    ]
@@ -0,0 +1,65 @@
+from django.db import migrations
+
+FTS_TABLE = 'mangareview_series_fts'
+PG_DOCUMENT = "to_tsvector('simple', title || ' ' || author || ' ' || about)"
+
+SQLITE_FORWARD = [
+    f"""CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+        title, author, about,
+        content='mangareview_series', content_rowid='id', tokenize='unicode61'
+    )""",
+    f"""CREATE TRIGGER {FTS_TABLE}_insert AFTER INSERT ON mangareview_series BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, author, about)
+        VALUES (new.id, new.title, new.author, new.about);
+    END""",
+    f"""CREATE TRIGGER {FTS_TABLE}_delete AFTER DELETE ON mangareview_series BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, author, about)
+        VALUES ('delete', old.id, old.title, old.author, old.about);
+    END""",
+    # Rating updates touch the row on every like, only reindex on text changes.
+    f"""CREATE TRIGGER {FTS_TABLE}_update AFTER UPDATE OF title, author, about
+        ON mangareview_series BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, author, about)
+        VALUES ('delete', old.id, old.title, old.author, old.about);
+        INSERT INTO {FTS_TABLE}(rowid, title, author, about)
+        VALUES (new.id, new.title, new.author, new.about);
+    END""",
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+]
+
+SQLITE_BACKWARD = [
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_update",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_delete",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_insert",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+POSTGRES_FORWARD = [
+    f"CREATE INDEX series_search_idx ON mangareview_series USING GIN ({PG_DOCUMENT})",
+]
+
+POSTGRES_BACKWARD = [
+    "DROP INDEX IF EXISTS series_search_idx",
+]
+
+
+def run(statements):
+    def operation(apps, schema_editor):
+        vendor = schema_editor.connection.vendor
+        for sql in statements.get(vendor, []):
+            schema_editor.execute(sql)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mangareview', '0005_versions'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run({'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRES_FORWARD}),
+            run({'sqlite': SQLITE_BACKWARD, 'postgresql': POSTGRES_BACKWARD}),
+        ),
+    ]
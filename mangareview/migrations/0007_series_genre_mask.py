@@ -0,0 +1,37 @@
+from django.db import migrations, models
+
+GENRES = ["shonen", "shojo", "seinen", "romance",
+    "sports", "action", "adventure", "comedy", "drama",
+    "slice of life", "fantasy", "horror", "psychological",
+    "mecha", "historical", "cyberpunk"]
+
+
+def backfill_genre_mask(apps, schema_editor):
+    Series = apps.get_model('mangareview', 'Series')
+    batch = []
+    for series in Series.objects.only('pk', 'genre').iterator(chunk_size=2000):
+        series.genre_mask = 0
+        for genre in series.genre or []:
+            if genre in GENRES:
+                series.genre_mask |= 1 << GENRES.index(genre)
+        batch.append(series)
+        if len(batch) == 2000:
+            Series.objects.bulk_update(batch, ['genre_mask'])
+            batch = []
+    Series.objects.bulk_update(batch, ['genre_mask'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mangareview', '0006_series_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='series',
+            name='genre_mask',
+            field=models.PositiveIntegerField(db_index=True, default=0),
+        ),
+        migrations.RunPython(backfill_genre_mask, migrations.RunPython.noop),
+    ]
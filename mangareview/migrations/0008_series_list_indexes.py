@@ -0,0 +1,60 @@
+# Generated by Django 4.0.3 on 2026-10-18 07:13
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_number_of_reviews(apps, schema_editor):
+    Series = apps.get_model('mangareview', 'Series')
+    series_list = Series.objects.annotate(num_reviews=Count('reviews')).filter(num_reviews__gt=0)
+    for series in series_list.iterator():
+        series.number_of_reviews = series.num_reviews
+        series.save(update_fields=['number_of_reviews'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mangareview', '0007_series_genre_mask'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='series',
+            name='number_of_reviews',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_number_of_reviews, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='series',
+            index=models.Index(fields=['rating', 'id'], name='series_rating_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='series',
+            index=models.Index(fields=['year', 'id'], name='series_year_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='series',
+            index=models.Index(fields=['number_of_reviews', 'id'], name='series_reviews_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='series',
+            index=models.Index(fields=['chapters', 'id'], name='series_chapters_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='series',
+            index=models.Index(fields=['volumes', 'id'], name='series_volumes_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='series',
+            index=models.Index(fields=['completed', 'id'], name='series_completed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='series',
+            index=models.Index(fields=['anime', 'id'], name='series_anime_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='series',
+            index=models.Index(fields=['official_translation', 'id'], name='series_translation_idx'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 4.0.3 on 2026-10-18 07:23
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def drop_duplicate_reviews(apps, schema_editor):
+    '''
+    Keeps the first review of each (reviewer, series) pair, which is the one
+    the API showed as the reviewer's, and resyncs the affected series.
+    '''
+    Review = apps.get_model('mangareview', 'Review')
+    Series = apps.get_model('mangareview', 'Series')
+    duplicates = (
+        Review.objects.values('reviewer', 'series').order_by()
+        .annotate(first=Min('pk'), count=Count('pk')).filter(count__gt=1)
+    )
+    affected = set()
+    for row in duplicates:
+        Review.objects.filter(reviewer=row['reviewer'], series=row['series']).exclude(
+            pk=row['first']).delete()
+        affected.add(row['series'])
+
+    for series in Series.objects.filter(pk__in=affected):
+        series.rating_sum, series.rating_weight, series.number_of_reviews = 0, 0, 0
+        for rating, num_likes in series.reviews.values_list('rating', 'likes_count'):
+            series.rating_sum += rating*(num_likes+1)
+            series.rating_weight += num_likes+1
+            series.number_of_reviews += 1
+        series.rating = (
+            round(series.rating_sum/series.rating_weight, 2) if series.rating_weight else None)
+        series.save(update_fields=['rating_sum', 'rating_weight', 'number_of_reviews', 'rating'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mangareview', '0008_series_list_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_duplicate_reviews, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='review',
+            constraint=models.UniqueConstraint(fields=('reviewer', 'series'), name='unique_review'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.0.3 on 2026-10-18 07:26
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mangareview', '0009_review_unique_reviewer'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RatingJob',
+            fields=[
+                ('series', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rating_job', serialize=False, to='mangareview.series')),
+                ('generation', models.PositiveIntegerField(default=1)),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
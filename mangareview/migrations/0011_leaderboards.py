@@ -0,0 +1,54 @@
+# Generated by Django 4.0.3 on 2026-10-18 07:44
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mangareview', '0010_rating_jobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Leaderboard',
+            fields=[
+                ('name', models.CharField(max_length=40, primary_key=True, serialize=False)),
+                ('complete', models.BooleanField(default=False)),
+                ('refreshed_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SeriesActivity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField(db_index=True)),
+                ('reviews', models.IntegerField(default=0)),
+                ('likes', models.IntegerField(default=0)),
+                ('series', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='activity', to='mangareview.series')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='LeaderboardEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('board', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='entries', to='mangareview.leaderboard')),
+                ('series', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='leaderboard_entries', to='mangareview.series')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='seriesactivity',
+            constraint=models.UniqueConstraint(fields=('series', 'hour'), name='unique_series_hour'),
+        ),
+        migrations.AddIndex(
+            model_name='leaderboardentry',
+            index=models.Index(fields=['board', '-score', '-series'], name='leaderboard_rank_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='leaderboardentry',
+            constraint=models.UniqueConstraint(fields=('board', 'series'), name='unique_leaderboard_series'),
+        ),
+    ]
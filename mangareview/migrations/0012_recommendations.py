@@ -0,0 +1,50 @@
+# Generated by Django 4.0.3 on 2026-10-18 07:48
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('mangareview', '0011_leaderboards'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimilarSeries',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('other', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='mangareview.series')),
+                ('series', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar', to='mangareview.series')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Recommendation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('series', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='mangareview.series')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommendations', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='similarseries',
+            index=models.Index(fields=['series', '-score', 'other'], name='similar_series_rank_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='similarseries',
+            constraint=models.UniqueConstraint(fields=('series', 'other'), name='unique_similar_series'),
+        ),
+        migrations.AddIndex(
+            model_name='recommendation',
+            index=models.Index(fields=['user', '-score', 'series'], name='recommendation_rank_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='recommendation',
+            constraint=models.UniqueConstraint(fields=('user', 'series'), name='unique_recommendation'),
+        ),
+    ]
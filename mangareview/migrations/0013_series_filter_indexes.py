@@ -0,0 +1,37 @@
+# Generated by Django 4.0.3 on 2026-10-18 08:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mangareview', '0012_recommendations'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='series',
+            index=models.Index(fields=['completed', 'rating', 'id'], name='series_completed_rating_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='series',
+            index=models.Index(fields=['completed', 'year', 'id'], name='series_completed_year_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='series',
+            index=models.Index(fields=['anime', 'rating', 'id'], name='series_anime_rating_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='series',
+            index=models.Index(fields=['anime', 'year', 'id'], name='series_anime_year_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='series',
+            index=models.Index(fields=['official_translation', 'rating', 'id'], name='series_translation_rating_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='series',
+            index=models.Index(fields=['official_translation', 'year', 'id'], name='series_translation_year_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.0.3 on 2026-10-18 08:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mangareview', '0013_series_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='series',
+            name='genre_mask',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -2,23 +2,63 @@
 # from tkinter import CASCADE
 from unicodedata import name
 from wsgiref.validate import validator
-from django.db import models
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import Count, F, Sum
 from django.contrib.auth.models import User
+from django.utils import timezone
 from django.core.validators import MaxValueValidator, MinValueValidator 
 from datetime import date
 from django.core.exceptions import ValidationError
 
+# The position of a genre is its bit in Series.genre_mask: only ever append.
+GENRES = ["shonen", "shojo", "seinen", "romance",
+"sports", "action", "adventure", "comedy", "drama",
+"slice of life", "fantasy", "horror", "psychological",
+"mecha", "historical", "cyberpunk"]
+
 def genre_validator(genres_input):
-    GENRES = ["shonen", "shojo", "seinen", "romance",
-    "sports", "action", "adventure", "comedy", "drama",
-    "slice of life", "fantasy", "horror", "psychological",
-    "mecha", "historical", "cyberpunk"]
     for genre in genres_input:
       if genre not in GENRES:
         raise ValidationError(
           f"/{genre}/ is not a valid genre")
-  
-class Series(models.Model):
+
+def genre_mask(genres):
+    '''
+    Bitmask of the given genres, bit i standing for GENRES[i].
+    '''
+    mask = 0
+    for genre in genres:
+      if genre in GENRES:
+        mask |= 1 << GENRES.index(genre)
+    return mask
+
+class Versioned:
+  '''
+  Bumps `version` and `updated_at` (the ETag and Last-Modified of the row)
+  on every save() of an existing row. The bump is done by the database, so
+  concurrent saves can't both write the same version; the new one is read
+  back afterwards.
+  '''
+
+  def save(self, *args, **kwargs):
+    if self._state.adding:
+      return super().save(*args, **kwargs)
+    self.version = F('version') + 1
+    update_fields = kwargs.get('update_fields')
+    if update_fields is not None:
+      kwargs['update_fields'] = {*update_fields, 'version', 'updated_at'}
+    super().save(*args, **kwargs)
+    self.refresh_from_db(fields=['version'])
+
+  @staticmethod
+  def touched():
+    '''
+    update() kwargs doing the same bump for queryset updates.
+    '''
+    return {'version': F('version') + 1, 'updated_at': timezone.now()}
+
+class Series(Versioned, models.Model):
   
   title = models.CharField(max_length = 180)
   author=models.CharField(max_length = 180)
@@ -33,22 +73,125 @@ class Series(models.Model):
   chapters = models.PositiveIntegerField(blank=True,null=True)
   volumes = models.PositiveIntegerField(blank=True,null=True)
   official_translation=models.BooleanField(default=False)
+  # Running sums behind the weighted rating: Σ rating·(likes+1) and Σ (likes+1).
+  rating_sum = models.FloatField(default=0)
+  rating_weight = models.PositiveIntegerField(default=0)
+  # Denormalized reviews.count(), kept in step with the sums.
+  number_of_reviews = models.PositiveIntegerField(default=0)
+  # genre as a bitmask (see genre_mask), so genre filters compare integers
+  # instead of decoding the JSON of every row. Not indexed: no index can
+  # answer `genre_mask & bits`, so the filter still visits each row it walks.
+  genre_mask = models.PositiveIntegerField(default=0)
+  version = models.PositiveIntegerField(default=1)
+  updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
   @property
   def get_rating(self):
+    '''
+    Reference formula, recomputed from every review. Only used to check
+    the running sums (see the rebuild_ratings command).
+    '''
     ratings=[]
     likes=[]
     for review in self.reviews.all():
       ratings.append(review.rating)
-      likes.append(review.likes.count()+1)  
-    return round(sum([(a*b)/sum(likes) for a,b in zip(ratings,likes)]),2)
-    
+      likes.append(review.likes.count()+1)
+    total_likes = sum(likes)
+    return round(sum([(a*b)/total_likes for a,b in zip(ratings,likes)]),2)
+
+  def save(self, *args, **kwargs):
+    self.genre_mask = genre_mask(self.genre)
+    update_fields = kwargs.get('update_fields')
+    if update_fields is not None and 'genre' in update_fields:
+      kwargs['update_fields'] = {*update_fields, 'genre_mask'}
+    super().save(*args, **kwargs)
+    if update_fields is None or {'rating', 'number_of_reviews', 'genre'} & set(update_fields):
+      from .leaderboards import series_changed
+      series_changed([self.pk])
+
+  def compute_rating(self):
+    if not self.rating_weight:
+      return None
+    return round(self.rating_sum/self.rating_weight, 2)
+
+  def rating_totals(self):
+    '''
+    Computes Σ rating·(likes+1), Σ (likes+1) and the number of reviews
+    from scratch in a single query.
+    '''
+    rating_sum, rating_weight, number_of_reviews = 0, 0, 0
+    for rating, num_likes in self.reviews.values_list('rating', 'likes_count'):
+      rating_sum += rating*(num_likes+1)
+      rating_weight += num_likes+1
+      number_of_reviews += 1
+    return rating_sum, rating_weight, number_of_reviews
+
+  def apply_rating_delta(self, rating_sum, rating_weight, number_of_reviews=0):
+    '''
+    Adds the given deltas to the running sums and refreshes the rating.
+    The row is locked for the duration so concurrent writes can't lose an update.
+    With settings.RATING_ASYNC, queues a recompute of the series instead.
+    '''
+    if settings.RATING_ASYNC:
+      from .jobs import enqueue_rating
+      enqueue_rating(self.pk)
+      return
+    with transaction.atomic():
+      series = Series.objects.select_for_update().get(pk=self.pk)
+      series.rating_weight += rating_weight
+      series.number_of_reviews += number_of_reviews
+      # Drop accumulated float error once the last review is gone.
+      series.rating_sum = series.rating_sum + rating_sum if series.rating_weight else 0
+      series.rating = series.compute_rating()
+      # The row is locked, so the next version is known: an update() saves
+      # reading it back as save() does.
+      series.version += 1
+      series.updated_at = timezone.now()
+      Series.objects.filter(pk=self.pk).update(
+        rating_sum=series.rating_sum, rating_weight=series.rating_weight,
+        number_of_reviews=series.number_of_reviews, rating=series.rating,
+        version=series.version, updated_at=series.updated_at)
+      from .leaderboards import series_changed
+      series_changed([self.pk])
+    self.rating_sum = series.rating_sum
+    self.rating_weight = series.rating_weight
+    self.number_of_reviews = series.number_of_reviews
+    self.rating = series.rating
+    self.version = series.version
+    self.updated_at = series.updated_at
+
+  @classmethod
+  def rebuild_ratings(cls, pks):
+    '''
+    Rebuilds the running sums and the rating of many series at once, from
+    one aggregate query over all their reviews instead of a rating_totals()
+    rescan per series.
+    '''
+    weight = F('likes_count') + 1
+    with transaction.atomic():
+      locked = list(cls.objects.select_for_update().filter(pk__in=pks).values_list('pk', flat=True))
+      totals = Review.objects.filter(series__in=locked).values('series').order_by().annotate(
+        rating_sum=Sum(F('rating') * weight, output_field=models.FloatField()),
+        rating_weight=Sum(weight), number_of_reviews=Count('pk'))
+      totals = {row.pop('series'): row for row in totals}
+      for pk in locked:
+        series = Series(**totals.get(pk, {'rating_sum': 0, 'rating_weight': 0, 'number_of_reviews': 0}))
+        # Row by row: a bulk_update() CASE over thousands of rows costs more
+        # to compile than the UPDATEs it saves.
+        cls.objects.filter(pk=pk).update(
+          rating_sum=series.rating_sum, rating_weight=series.rating_weight,
+          number_of_reviews=series.number_of_reviews, rating=series.compute_rating(),
+          **cls.touched())
+      from .leaderboards import series_changed
+      series_changed(locked)
+
   def update(self, *args, **kwargs):
-      if self.reviews.exists():
-        self.rating = self.get_rating
-      else:
-        self.rating = None
-      super(Series, self).save(*args, **kwargs)
+      '''
+      Rebuilds the running sums and the rating from scratch.
+      '''
+      self.rating_sum, self.rating_weight, self.number_of_reviews = self.rating_totals()
+      self.rating = self.compute_rating()
+      self.save(*args, **kwargs)
 
   class Meta:
     ordering = ['-pk']
@@ -56,20 +199,152 @@ class Series(models.Model):
     constraints = [models.UniqueConstraint(
       fields=('title', 'author'), name='unique_series')]
 
+    # One index per filter/ordering of the series list, each ending in id
+    # so that keyset pages on (field, id) are a single index range scan.
+    indexes = [
+      models.Index(fields=['rating', 'id'], name='series_rating_idx'),
+      models.Index(fields=['year', 'id'], name='series_year_idx'),
+      models.Index(fields=['number_of_reviews', 'id'], name='series_reviews_idx'),
+      models.Index(fields=['chapters', 'id'], name='series_chapters_idx'),
+      models.Index(fields=['volumes', 'id'], name='series_volumes_idx'),
+      models.Index(fields=['completed', 'id'], name='series_completed_idx'),
+      models.Index(fields=['anime', 'id'], name='series_anime_idx'),
+      models.Index(fields=['official_translation', 'id'], name='series_translation_idx'),
+      # A boolean filter on a list sorted by rating or year: without these,
+      # the boolean's index is picked and the page sorted in a temp b-tree.
+      models.Index(fields=['completed', 'rating', 'id'], name='series_completed_rating_idx'),
+      models.Index(fields=['completed', 'year', 'id'], name='series_completed_year_idx'),
+      models.Index(fields=['anime', 'rating', 'id'], name='series_anime_rating_idx'),
+      models.Index(fields=['anime', 'year', 'id'], name='series_anime_year_idx'),
+      models.Index(fields=['official_translation', 'rating', 'id'], name='series_translation_rating_idx'),
+      models.Index(fields=['official_translation', 'year', 'id'], name='series_translation_year_idx'),
+    ]
+
   def __str__(self):
     return self.title
 
-class Review(models.Model):
+class Review(Versioned, models.Model):
   reviewer=models.ForeignKey(User,on_delete=models.CASCADE,related_name="reviews")
   content = models.TextField(max_length = 5000)
   rating = models.FloatField(validators=
   [MinValueValidator(0), 
   MaxValueValidator(10)])
   likes=models.ManyToManyField(User,blank=True,related_name="liked")
+  # Denormalized likes.count(), kept in step by the like/unlike views.
+  likes_count = models.PositiveIntegerField(default=0)
   date=models.DateField(auto_now_add=True)
   series = models.ForeignKey(Series, on_delete=models.CASCADE, related_name="reviews")
+  version = models.PositiveIntegerField(default=1)
+  updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+  @property
+  def weight(self):
+    '''
+    Weight of this review in its series' rating.
+    '''
+    return self.likes_count+1
 
   def __str__(self):
     return f"Review from {self.reviewer.username} for {self.series.title}"
   class Meta:
-    ordering = ['-pk']
\ No newline at end of file
+    ordering = ['-pk']
+    indexes = [models.Index(
+      fields=['series', '-date', '-id'], name='review_series_date_idx')]
+    # A user reviews a series once; the index also serves the EXISTS check.
+    constraints = [models.UniqueConstraint(
+      fields=('reviewer', 'series'), name='unique_review')]
+
+class RatingJob(models.Model):
+  '''
+  Pending recompute of a series' rating (see mangareview/jobs.py). There is
+  one row per series, so repeated writes coalesce into one job; every write
+  bumps `generation`, so a job that changed while it ran isn't dropped.
+  '''
+  series = models.OneToOneField(
+    Series, on_delete=models.CASCADE, primary_key=True, related_name="rating_job")
+  generation = models.PositiveIntegerField(default=1)
+  created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+  def __str__(self):
+    return f"Rating job for series {self.series_id}"
+
+
+class SeriesActivity(models.Model):
+  '''
+  Reviews and likes a series got in an hour (net of deletes and unlikes),
+  behind the trending leaderboard (see mangareview/leaderboards.py).
+  '''
+  series = models.ForeignKey(Series, on_delete=models.CASCADE, related_name="activity")
+  hour = models.DateTimeField(db_index=True)
+  reviews = models.IntegerField(default=0)
+  likes = models.IntegerField(default=0)
+
+  class Meta:
+    constraints = [models.UniqueConstraint(
+      fields=('series', 'hour'), name='unique_series_hour')]
+
+  def __str__(self):
+    return f"Activity of series {self.series_id} at {self.hour}"
+
+class Leaderboard(models.Model):
+  '''
+  A precomputed ranking of series, e.g. "top_rated" or "trending". Its
+  entries are the top series by score, kept in step by the write paths.
+  `complete` is set when the entries hold every series that qualifies.
+  '''
+  name = models.CharField(max_length=40, primary_key=True)
+  complete = models.BooleanField(default=False)
+  refreshed_at = models.DateTimeField(default=timezone.now)
+
+  def __str__(self):
+    return self.name
+
+class LeaderboardEntry(models.Model):
+  board = models.ForeignKey(Leaderboard, on_delete=models.CASCADE, related_name="entries")
+  series = models.ForeignKey(Series, on_delete=models.CASCADE, related_name="leaderboard_entries")
+  score = models.FloatField()
+
+  class Meta:
+    indexes = [models.Index(
+      fields=['board', '-score', '-series'], name='leaderboard_rank_idx')]
+    constraints = [models.UniqueConstraint(
+      fields=('board', 'series'), name='unique_leaderboard_series')]
+
+  def __str__(self):
+    return f"{self.board_id}: series {self.series_id} ({self.score})"
+
+class SimilarSeries(models.Model):
+  '''
+  One of the RECOMMENDATIONS_SIZE series most similar to `series`, by the
+  readers they share (see mangareview/recommendations.py).
+  '''
+  series = models.ForeignKey(Series, on_delete=models.CASCADE, related_name="similar")
+  other = models.ForeignKey(Series, on_delete=models.CASCADE, related_name="+")
+  score = models.FloatField()
+
+  class Meta:
+    indexes = [models.Index(
+      fields=['series', '-score', 'other'], name='similar_series_rank_idx')]
+    constraints = [models.UniqueConstraint(
+      fields=('series', 'other'), name='unique_similar_series')]
+
+  def __str__(self):
+    return f"Series {self.other_id} similar to {self.series_id} ({self.score})"
+
+class Recommendation(models.Model):
+  '''
+  One of the RECOMMENDATIONS_SIZE series a user hasn't reviewed yet that
+  are most similar to those they have.
+  '''
+  user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="recommendations")
+  series = models.ForeignKey(Series, on_delete=models.CASCADE, related_name="+")
+  score = models.FloatField()
+
+  class Meta:
+    indexes = [models.Index(
+      fields=['user', '-score', 'series'], name='recommendation_rank_idx')]
+    constraints = [models.UniqueConstraint(
+      fields=('user', 'series'), name='unique_recommendation')]
+
+  def __str__(self):
+    return f"Series {self.series_id} for user {self.user_id} ({self.score})"
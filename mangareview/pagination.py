@@ -0,0 +1,260 @@
+import base64
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class PageSizeMixin:
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size < 1:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+
+class KeysetPagination(PageSizeMixin, BasePagination):
+    '''
+    Keyset ("seek") pagination over a fixed, unique ordering.
+
+    The opaque cursor holds the ordering values of the row at the edge of the
+    page, and the next page is fetched with a `WHERE (ordering) > (cursor)`
+    condition plus a LIMIT, so deep pages cost the same as the first one
+    (there is no OFFSET). The last field of the ordering must be unique.
+    NULLs of nullable fields sort below every other value, on every database.
+    '''
+    cursor_query_param = 'cursor'
+    ordering = ('-pk',)
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_ordering(self, request, queryset, view):
+        return self.ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(request, queryset, view)
+        cursor = self.decode_cursor(request, queryset.model)
+
+        reverse = cursor is not None and cursor['reverse']
+        fields = [
+            (field.lstrip('-'), field.startswith('-') != reverse,
+             self.is_nullable(queryset.model, field.lstrip('-')))
+            for field in self.ordering
+        ]
+        queryset = queryset.order_by(*[
+            self.order_by(name, descending, nullable)
+            for name, descending, nullable in fields
+        ])
+        if cursor is not None:
+            queryset = queryset.filter(self.seek(fields, cursor['values']))
+
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, cursor is not None
+
+        self.next_values = self.row_values(rows[-1]) if rows and has_next else None
+        self.previous_values = self.row_values(rows[0]) if rows and has_previous else None
+        return rows
+
+    @staticmethod
+    def is_nullable(model, name):
+        try:
+            return model._meta.get_field(name).null
+        except FieldDoesNotExist:
+            return False
+
+    @staticmethod
+    def order_by(name, descending, nullable):
+        if not nullable:
+            return f"-{name}" if descending else name
+        if descending:
+            return F(name).desc(nulls_last=True)
+        return F(name).asc(nulls_first=True)
+
+    def seek(self, fields, values):
+        '''
+        Builds the condition for rows strictly after `values` in the given order:
+        (a > x) OR (a = x AND b > y) OR ...
+        '''
+        condition = Q()
+        for index, (name, descending, nullable) in enumerate(fields):
+            term = self.after(name, descending, nullable, values[index])
+            if term is None:
+                continue
+            for (previous_name, _, _), value in zip(fields[:index], values):
+                if value is None:
+                    term &= Q(**{f"{previous_name}__isnull": True})
+                else:
+                    term &= Q(**{previous_name: value})
+            condition |= term
+        return condition
+
+    @staticmethod
+    def after(name, descending, nullable, value):
+        '''
+        Condition for `name` strictly after `value`, None if nothing can be.
+        '''
+        if value is None:
+            return None if descending else Q(**{f"{name}__isnull": False})
+        term = Q(**{f"{name}__{'lt' if descending else 'gt'}": value})
+        if nullable and descending:
+            term |= Q(**{f"{name}__isnull": True})
+        return term
+
+    def row_values(self, row):
+        return [getattr(row, field.lstrip('-')) for field in self.ordering]
+
+    def decode_cursor(self, request, model):
+        '''
+        The cursor's values, each converted by its ordering field, and
+        direction. Cursors come from the client, so anything that isn't one
+        value of the right type per ordering field is refused.
+        '''
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+            values, reverse = cursor['v'], bool(cursor.get('r'))
+            if not isinstance(values, list) or len(values) != len(self.ordering):
+                raise ValueError(values)
+            values = [
+                self.to_python(model, field.lstrip('-'), value)
+                for field, value in zip(self.ordering, values)
+            ]
+        except (TypeError, ValueError, KeyError, UnicodeEncodeError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return {'values': values, 'reverse': reverse}
+
+    @staticmethod
+    def to_python(model, name, value):
+        if isinstance(value, (list, dict)):
+            raise TypeError(value)
+        field = model._meta.pk if name == 'pk' else model._meta.get_field(name)
+        if value is None:
+            if not field.null:
+                raise ValueError(value)
+            return None
+        return field.to_python(value)
+
+    def encode_cursor(self, values, reverse):
+        cursor = {'v': values}
+        if reverse:
+            cursor['r'] = 1
+        encoded = json.dumps(cursor, cls=DjangoJSONEncoder, separators=(',', ':'))
+        return base64.urlsafe_b64encode(encoded.encode('utf-8')).decode('ascii')
+
+    def get_link(self, values, reverse):
+        if values is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(values, reverse))
+
+    def get_next_link(self):
+        return self.get_link(self.next_values, reverse=False)
+
+    def get_previous_link(self):
+        return self.get_link(self.previous_values, reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'previous': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
+
+
+class RankedPagination(PageSizeMixin, BasePagination):
+    '''
+    Page-number pagination for ranked results (search), which have no stable
+    key to seek on. The ranking query gets the LIMIT/OFFSET window of the page;
+    pages past `max_page` are refused so the OFFSET stays bounded.
+    '''
+    page_query_param = 'page'
+    max_page = 50
+    invalid_page_message = 'Invalid page'
+
+    def paginate_ranking(self, rank, request):
+        '''
+        `rank(limit, offset)` returns the ranked rows in that window.
+        '''
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        try:
+            self.page = int(request.query_params.get(self.page_query_param, 1))
+        except ValueError:
+            raise NotFound(self.invalid_page_message)
+        if not 1 <= self.page <= self.max_page:
+            raise NotFound(self.invalid_page_message)
+
+        rows = rank(self.page_size + 1, (self.page - 1) * self.page_size)
+        self.has_next = len(rows) > self.page_size and self.page < self.max_page
+        return rows[:self.page_size]
+
+    def get_link(self, page):
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.page_query_param, page)
+
+    def get_next_link(self):
+        return self.get_link(self.page + 1) if self.has_next else None
+
+    def get_previous_link(self):
+        return self.get_link(self.page - 1) if self.page > 1 else None
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+
+class SeriesPagination(KeysetPagination):
+    ordering = ('-pk',)
+    ordering_query_param = 'ordering'
+    # ?ordering=rating or -rating..., ties broken by pk in the same direction.
+    orderings = ('rating', 'year', 'number_of_reviews', 'chapters', 'volumes')
+
+    def get_ordering(self, request, queryset, view):
+        ordering = request.query_params.get(self.ordering_query_param)
+        if ordering is None or ordering.lstrip('-') not in self.orderings:
+            return self.ordering
+        return (ordering, '-pk' if ordering.startswith('-') else 'pk')
+
+
+class ReviewPagination(KeysetPagination):
+    ordering = ('-date', '-pk')
+
+
+class UserPagination(KeysetPagination):
+    ordering = ('pk',)
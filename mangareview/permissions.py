@@ -1,3 +1,6 @@
+import hmac
+
+from django.conf import settings
 from rest_framework import permissions
 
 
@@ -15,3 +18,28 @@ class IsOwnerOrReadOnly(permissions.BasePermission):
 
         # Instance must have an attribute named `owner`.
         return obj.reviewer == request.user
+
+
+class HasMetricsToken(permissions.BasePermission):
+    """
+    Lets in requests bearing METRICS_TOKEN (Authorization: Bearer <token>),
+    for scrapers that can't log in. Nobody gets in while it isn't set.
+    """
+
+    def has_permission(self, request, view):
+        expected = settings.METRICS_TOKEN
+        if not expected:
+            return False
+        given = request.META.get('HTTP_AUTHORIZATION', '')
+        return hmac.compare_digest(given.encode(), f"Bearer {expected}".encode())
+
+
+class IsSelfOrAdmin(permissions.BasePermission):
+    """
+    Lets a user in to the views of their own user_id, and admins to all.
+    """
+
+    def has_permission(self, request, view):
+        user = request.user
+        return bool(user and user.is_authenticated and (
+            user.is_staff or user.pk == view.kwargs.get('user_id')))
@@ -0,0 +1,166 @@
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:  # Only build_recommendations needs them.
+    np = sparse = None
+
+import itertools
+import time
+
+from django.db import connection, transaction
+
+from .models import Review, SimilarSeries, Recommendation
+
+# Strength of a user's interest in a series: 1 for reviewing it, plus up to
+# 1 more the higher they rated it, plus LIKE_WEIGHT per review of it they liked.
+LIKE_WEIGHT = 0.5
+
+# Rows sent per executemany() when storing the results.
+BATCH_SIZE = 5000
+
+
+def load_interactions():
+    '''
+    (user ids, series ids, strengths) arrays of every review and like, one
+    entry per review or like: repeated pairs add up in the matrix.
+    '''
+    reviews = np.array(
+        list(Review.objects.values_list('reviewer_id', 'series_id', 'rating').order_by()),
+        dtype=np.float64).reshape(-1, 3)
+    likes = np.array(
+        list(Review.likes.through.objects.values_list('user_id', 'review__series_id').order_by()),
+        dtype=np.int64).reshape(-1, 2)
+    users = np.concatenate([reviews[:, 0].astype(np.int64), likes[:, 0]])
+    series = np.concatenate([reviews[:, 1].astype(np.int64), likes[:, 1]])
+    strengths = np.concatenate([1 + reviews[:, 2] / 10, np.full(len(likes), LIKE_WEIGHT)])
+    return users, series, strengths
+
+
+def interaction_matrix(users, series, strengths):
+    '''
+    The users × series CSR matrix of the interactions, with the user and
+    series ids of its rows and columns.
+    '''
+    user_ids, rows = np.unique(users, return_inverse=True)
+    series_ids, columns = np.unique(series, return_inverse=True)
+    matrix = sparse.csr_matrix(
+        (strengths, (rows, columns)), shape=(len(user_ids), len(series_ids)))
+    matrix.sum_duplicates()
+    return user_ids, series_ids, matrix
+
+
+def top_n(matrix, n):
+    '''
+    (rows, columns, values) of the n largest entries of each row of a CSR
+    matrix, in one sort of all its entries rather than a loop over rows.
+    '''
+    rows = np.repeat(np.arange(matrix.shape[0]), np.diff(matrix.indptr))
+    order = np.lexsort((-matrix.data, rows))
+    rank = np.arange(len(order)) - matrix.indptr[rows[order]]
+    keep = order[rank < n]
+    return rows[keep], matrix.indices[keep], matrix.data[keep]
+
+
+def concatenate(parts):
+    '''
+    Joins the (rows, columns, values) of top_n() over successive chunks.
+    '''
+    if not parts:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.int64), np.array([])
+    return tuple(np.concatenate(part) for part in zip(*parts))
+
+
+def similar_series(matrix, n, chunk_size=1000):
+    '''
+    The n most similar series of every series, by cosine similarity of
+    their columns, as a series × series CSR matrix. Similarities are
+    computed chunk_size series at a time, so memory is bounded by a
+    chunk_size × series block instead of the full series × series product.
+    '''
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=0))).ravel()
+    norms[norms == 0] = 1
+    normalized = matrix @ sparse.diags(1 / norms)
+    columns = normalized.T.tocsr()
+    count = matrix.shape[1]
+
+    parts = []
+    for start in range(0, count, chunk_size):
+        block = (columns[start:start + chunk_size] @ normalized).tocoo()
+        # A series isn't its own neighbour.
+        block.data[block.row + start == block.col] = 0
+        block = block.tocsr()
+        block.eliminate_zeros()
+        rows, cols, values = top_n(block, n)
+        parts.append((rows + start, cols, values))
+    rows, cols, values = concatenate(parts)
+    return sparse.csr_matrix((values, (rows, cols)), shape=(count, count))
+
+
+def recommend(matrix, similar, n, chunk_size=1000):
+    '''
+    The n best series for every user that they haven't interacted with yet,
+    scored by the similarity of each series to theirs weighted by their
+    interest in them, chunk_size users at a time. Returns (rows, columns,
+    scores).
+    '''
+    parts = []
+    for start in range(0, matrix.shape[0], chunk_size):
+        interests = matrix[start:start + chunk_size]
+        scores = interests @ similar
+        scores = (scores - scores.multiply(interests > 0)).tocsr()
+        scores.eliminate_zeros()
+        rows, cols, values = top_n(scores, n)
+        parts.append((rows + start, cols, values))
+    return concatenate(parts)
+
+
+def store(model, owner, owner_ids, item_ids, rows, columns, scores):
+    '''
+    Replaces every row of `model` (SimilarSeries or Recommendation) with the
+    given results, in one transaction so that readers never see a half
+    written table. Rows go through executemany() rather than bulk_create():
+    building millions of model instances takes most of the job's time.
+    '''
+    item = 'other_id' if model is SimilarSeries else 'series_id'
+    table = connection.ops.quote_name(model._meta.db_table)
+    sql = f"INSERT INTO {table} ({owner}, {item}, score) VALUES (%s, %s, %s)"
+    values = zip(owner_ids[rows].tolist(), item_ids[columns].tolist(), scores.round(6).tolist())
+    with transaction.atomic(), connection.cursor() as cursor:
+        model.objects.all().delete()
+        while True:
+            batch = list(itertools.islice(values, BATCH_SIZE))
+            if not batch:
+                break
+            cursor.executemany(sql, batch)
+    return len(rows)
+
+
+def build(n, chunk_size=1000):
+    '''
+    Recomputes and stores the n most similar series of every series and
+    the n recommended series of every user. Returns the seconds each step
+    took and the number of rows stored.
+    '''
+    timings = {}
+    started = time.perf_counter()
+
+    def step(name):
+        nonlocal started
+        timings[name] = round(time.perf_counter() - started, 3)
+        started = time.perf_counter()
+
+    user_ids, series_ids, matrix = interaction_matrix(*load_interactions())
+    step('load')
+    similar = similar_series(matrix, n, chunk_size)
+    step('similar')
+    recommended = recommend(matrix, similar, n, chunk_size)
+    step('recommend')
+    coo = similar.tocoo()
+    counts = {
+        'pairs': matrix.nnz,
+        'similar': store(SimilarSeries, 'series_id', series_ids, series_ids,
+                         coo.row, coo.col, coo.data),
+        'recommendations': store(Recommendation, 'user_id', user_ids, series_ids, *recommended),
+    }
+    step('store')
+    return timings, counts
@@ -0,0 +1,51 @@
+try:
+    import orjson
+except ImportError:  # The stdlib json module is used instead.
+    orjson = None
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+
+class FastJSONRenderer(JSONRenderer):
+    '''
+    DRF's JSONRenderer on orjson, several times faster on long lists, with
+    the same bytes out: compact, UTF-8, U+2028/U+2029 escaped. Falls back to
+    the stdlib renderer without orjson, when the client asks for indented
+    JSON, and for what orjson can't encode (e.g. integers past 64 bits).
+    '''
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if orjson is None or not settings.JSON_FAST or self.get_indent(
+                accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            # Dates go through DRF's encoder, which formats them its own way.
+            ret = orjson.dumps(
+                data, default=JSONEncoder().default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # As the stdlib renderer does, for JSON embedded in JavaScript.
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+
+class FastJSONParser(JSONParser):
+    '''
+    DRF's JSONParser on orjson, falling back to it without orjson and for
+    bodies in another charset than UTF-8.
+    '''
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        if orjson is None or not settings.JSON_FAST or encoding.lower() not in ('utf-8', 'utf8'):
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f"JSON parse error - {exc}")
@@ -0,0 +1,138 @@
+import contextvars
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, connections
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Read from the primary whatever the request: tokens and sessions, so that a
+# new login works and a logout takes effect at once.
+PRIMARY_MODELS = {'knox.authtoken', 'sessions.session'}
+
+# Seconds a Postgres replica is behind: 0 when it has replayed all it received.
+POSTGRES_LAG = '''
+    SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END
+'''
+
+# The request being served, if its reads may go to a replica.
+_request = contextvars.ContextVar('replica_request', default=None)
+
+_lags = {}
+_lock = threading.Lock()
+
+
+def pin_key(user_pk):
+    return f"replica-pin:{user_pk}"
+
+
+def replica_lag(alias):
+    '''
+    How many seconds a replica is behind, checked at most every
+    REPLICA_LAG_CHECK_INTERVAL seconds. Only Postgres replicas report a
+    lag; one that can't be queried counts as infinitely behind.
+    '''
+    now = time.monotonic()
+    with _lock:
+        checked_at, lag = _lags.get(alias, (None, 0))
+    if checked_at is not None and now - checked_at < settings.REPLICA_LAG_CHECK_INTERVAL:
+        return lag
+    connection = connections[alias]
+    lag = 0
+    if connection.vendor == 'postgresql':
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(POSTGRES_LAG)
+                lag = float(cursor.fetchone()[0] or 0)
+        except Exception:
+            lag = float('inf')
+    with _lock:
+        _lags[alias] = (now, lag)
+    return lag
+
+
+def pinned(request):
+    '''
+    Whether the request's user wrote in the last REPLICA_PIN_SECONDS
+    seconds, and so reads from the primary to see their own writes.
+    '''
+    if getattr(request, '_replica_pinned', None) is None:
+        # Reads made to find out (the session's user) go to the primary.
+        request._replica_pinned = True
+        user = request.user
+        if not user.is_authenticated:
+            # Not known yet: DRF authenticates the request later on.
+            request._replica_pinned = None
+            return False
+        request._replica_pinned = cache.get(pin_key(user.pk)) is not None
+    return request._replica_pinned
+
+
+def pinned_to_primary(request):
+    return bool(settings.REPLICA_DATABASES and settings.REPLICA_READS) and pinned(request)
+
+
+def read_from_replica(request):
+    return getattr(request, '_replica_read', False)
+
+
+class ReplicaRouter:
+    '''
+    Sends the reads of GET, HEAD and OPTIONS requests to a replica among
+    REPLICA_DATABASES, picked at random among those at most REPLICA_MAX_LAG
+    seconds behind. Everything else uses the primary: writes, reads of
+    other requests and of background work, reads inside a transaction on
+    the primary, and the reads of users pinned after a write.
+    '''
+
+    def db_for_read(self, model, **hints):
+        request = _request.get()
+        if (request is None or not settings.REPLICA_READS
+                or model._meta.label_lower in PRIMARY_MODELS
+                or connections[DEFAULT_DB_ALIAS].in_atomic_block or pinned(request)):
+            return DEFAULT_DB_ALIAS
+        replicas = [alias for alias in settings.REPLICA_DATABASES
+                    if replica_lag(alias) <= settings.REPLICA_MAX_LAG]
+        if not replicas:
+            return DEFAULT_DB_ALIAS
+        request._replica_read = True
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary.
+        return True
+
+
+class ReplicaMiddleware:
+    '''
+    Lets the ReplicaRouter know which request it routes, and pins users to
+    the primary for REPLICA_PIN_SECONDS seconds after a successful write.
+    Pins are kept in the default cache, which should then be shared by
+    all the processes. Unused without replicas.
+    '''
+
+    def __init__(self, get_response):
+        if not settings.REPLICA_DATABASES:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _request.set(request if request.method in SAFE_METHODS else None)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request.reset(token)
+        # DRF has set request.user by now.
+        user = getattr(request, 'user', None)
+        if (request.method not in SAFE_METHODS and response.status_code < 400
+                and user is not None and user.is_authenticated):
+            cache.set(pin_key(user.pk), True, settings.REPLICA_PIN_SECONDS)
+        return response
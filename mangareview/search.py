@@ -0,0 +1,116 @@
+import re
+
+from django.db import connection, connections
+from django.db.models import Q
+
+from .models import Series
+
+FTS_TABLE = 'mangareview_series_fts'
+
+# Must stay identical to the expression of the GIN index created in
+# migration 0006, or Postgres won't use the index.
+PG_DOCUMENT = "to_tsvector('simple', title || ' ' || author || ' ' || about)"
+
+SQLITE_TRIGGERS = {
+    f"{FTS_TABLE}_insert": f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert AFTER INSERT ON mangareview_series BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, title, author, about)
+            VALUES (new.id, new.title, new.author, new.about);
+        END""",
+    f"{FTS_TABLE}_delete": f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete AFTER DELETE ON mangareview_series BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, author, about)
+            VALUES ('delete', old.id, old.title, old.author, old.about);
+        END""",
+    # Rating updates touch the row on every like, only reindex on text changes.
+    f"{FTS_TABLE}_update": f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update AFTER UPDATE OF title, author, about
+            ON mangareview_series BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, author, about)
+            VALUES ('delete', old.id, old.title, old.author, old.about);
+            INSERT INTO {FTS_TABLE}(rowid, title, author, about)
+            VALUES (new.id, new.title, new.author, new.about);
+        END""",
+}
+
+SQLITE_SEARCH = f"""
+    SELECT rowid,
+           bm25({FTS_TABLE}, 10.0, 5.0, 1.0) AS rank,
+           snippet({FTS_TABLE}, -1, '<b>', '</b>', '…', 16)
+    FROM {FTS_TABLE}
+    WHERE {FTS_TABLE} MATCH %s
+    ORDER BY rank, rowid
+    LIMIT %s OFFSET %s
+"""
+
+POSTGRES_SEARCH = f"""
+    SELECT id,
+           -ts_rank({PG_DOCUMENT}, query) AS rank,
+           ts_headline('simple', title || ' ' || author || ' ' || about, query,
+                       'StartSel=<b>, StopSel=</b>, MaxFragments=1, MinWords=8, MaxWords=16')
+    FROM mangareview_series, to_tsquery('simple', %s) query
+    WHERE {PG_DOCUMENT} @@ query
+    ORDER BY rank, id
+    LIMIT %s OFFSET %s
+"""
+
+
+def tokens(text):
+    return re.findall(r'\w+', text.lower())
+
+
+def search_series(text, limit, offset=0):
+    '''
+    Ranks series whose title, author or about match every word of `text`
+    (the last letters of a word may be missing). Returns (pk, snippet) pairs,
+    best match first.
+
+    Backed by an FTS5 table on SQLite and a GIN index on Postgres, both kept
+    in sync by the database itself (see migration 0006). Other databases fall
+    back to a substring scan without snippets.
+    '''
+    words = tokens(text)
+    if not words:
+        return []
+
+    if connection.vendor == 'sqlite':
+        sql, query = SQLITE_SEARCH, ' '.join(f'"{word}"*' for word in words)
+    elif connection.vendor == 'postgresql':
+        sql, query = POSTGRES_SEARCH, ' & '.join(f"{word}:*" for word in words)
+    else:
+        condition = Q()
+        for word in words:
+            condition &= (Q(title__icontains=word) | Q(author__icontains=word)
+                          | Q(about__icontains=word))
+        pks = Series.objects.filter(condition).values_list('pk', flat=True)
+        return [(pk, None) for pk in pks[offset:offset + limit]]
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [query, limit, offset])
+        return [(pk, snippet) for pk, _, snippet in cursor.fetchall()]
+
+
+def ensure_search_triggers(using='default', **kwargs):
+    '''
+    post_migrate handler. SQLite can't alter most columns in place, so when a
+    migration changes the series table Django rebuilds it, and the FTS
+    triggers go away with the old table. Recreate them and rebuild the index.
+    '''
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+        if cursor.fetchone() is None:
+            return
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = %s",
+            ['mangareview_series'])
+        existing = {name for name, in cursor.fetchall()}
+        missing = [sql for name, sql in SQLITE_TRIGGERS.items() if name not in existing]
+        if not missing:
+            return
+        for sql in missing:
+            cursor.execute(sql)
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
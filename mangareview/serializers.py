@@ -1,18 +1,195 @@
 from rest_framework import serializers
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Count
+from .metrics import timing_render
 from .models import Series, Review
 from django.contrib.auth.models import User
 from django.contrib.auth.password_validation import validate_password
 from rest_framework.validators import UniqueValidator
 
 
-class UserSerializer(serializers.ModelSerializer):
+class RelatedCountField(serializers.ReadOnlyField):
+    '''
+    Number of rows in the related manager named by `source`. Reads the
+    `<source>_count` annotation added by EagerLoadingMixin when the
+    queryset has it and falls back to a COUNT query otherwise.
+    '''
+
+    @property
+    def annotation_name(self):
+        return f"{self.source}_count"
+
+    def get_attribute(self, instance):
+        try:
+            return getattr(instance, self.annotation_name)
+        except AttributeError:
+            return getattr(instance, self.source).count()
+
+
+class TimedDataMixin:
+    '''
+    Counts building `.data` as render time in the request metrics. Lists go
+    through TimedListSerializer, set as Meta.list_serializer_class.
+    '''
+
+    @property
+    def data(self):
+        with timing_render():
+            return super().data
+
+
+class TimedListSerializer(TimedDataMixin, serializers.ListSerializer):
+    pass
+
+
+class EagerLoadingMixin:
+    '''
+    Plans the queryset of a list view from the fields the serializer declares:
+    dotted sources over foreign keys (e.g. `reviewer.username`) are fetched
+    with select_related, and RelatedCountFields are annotated with Count(),
+    so a page costs a fixed number of queries whatever its size.
+    '''
+
+    @classmethod
+    def setup_eager_loading(cls, queryset, fields=None, required=()):
+        '''
+        With `fields` (see SparseFieldsMixin), only what those fields read is
+        joined and selected, plus the `required` columns (e.g. the ones the
+        pagination seeks on).
+        '''
+        select_related = []
+        annotations = {}
+        for name, field in cls._declared_fields.items():
+            if fields is not None and name not in fields:
+                continue
+            source = field.source or name
+            if isinstance(field, RelatedCountField):
+                annotations[f"{source}_count"] = Count(source, distinct=True)
+                continue
+            path = cls.related_path(queryset.model, source.split('.')[:-1])
+            if path:
+                select_related.append(path)
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+        if annotations:
+            queryset = queryset.annotate(**annotations)
+        if fields is not None:
+            columns = cls.columns(queryset.model, fields)
+            if columns is not None:
+                queryset = queryset.only(*columns, *required)
+        return queryset
+
+    @staticmethod
+    def related_path(model, attrs):
+        '''
+        Longest chain of forward foreign keys in `attrs`, as a lookup path.
+        '''
+        path = []
+        for attr in attrs:
+            try:
+                field = model._meta.get_field(attr)
+            except FieldDoesNotExist:
+                break
+            if not (field.many_to_one or (field.one_to_one and field.concrete)):
+                break
+            path.append(attr)
+            model = field.related_model
+        return '__'.join(path)
+
+    @classmethod
+    def field_sources(cls):
+        '''
+        Name -> source of the fields the serializer outputs.
+        '''
+        if '_field_sources' not in cls.__dict__:
+            cls._field_sources = {
+                name: field.source for name, field in cls().fields.items() if not field.write_only
+            }
+        return cls._field_sources
+
+    @classmethod
+    def columns(cls, model, fields):
+        '''
+        only() arguments loading what `fields` read, or None when one of them
+        reads something other than columns (a property, a related count...).
+        '''
+        columns = set()
+        for name in fields:
+            attrs = cls.field_sources()[name].split('.')
+            path = cls.related_path(model, attrs[:-1])
+            joins = path.split('__') if path else []
+            target = model
+            for depth, attr in enumerate(joins):
+                columns.add('__'.join(joins[:depth + 1]))
+                target = target._meta.get_field(attr).related_model
+            if len(attrs) != len(joins) + 1:
+                return None
+            try:
+                field = target._meta.get_field(attrs[-1])
+            except FieldDoesNotExist:
+                return None
+            if not field.concrete or field.many_to_many:
+                return None
+            columns.add('__'.join(joins + [attrs[-1]]))
+        return columns
+
+
+class SparseFieldsMixin:
+    '''
+    Narrows the serializer to the fields a list view was asked for with
+    ?fields=title,rating or ?exclude=about. In ?fields=, `summary` stands
+    for Meta.summary_fields: the compact representation grids need.
+    '''
+
+    def __init__(self, *args, fields=None, **kwargs):
+        self.sparse_fields_kept = fields
+        super().__init__(*args, **kwargs)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if self.sparse_fields_kept is None:
+            return fields
+        return {name: field for name, field in fields.items() if name in self.sparse_fields_kept}
+
+    @classmethod
+    def sparse_fields(cls, query_params):
+        '''
+        Names of the fields asked for, or None for all of them. Raises
+        ValueError with the first name that isn't a field.
+        '''
+        requested = query_params.get('fields') or None
+        excluded = query_params.get('exclude') or None
+        if requested is None and excluded is None:
+            return None
+
+        available = cls.field_sources()
+        fields = set(available) if requested is None else set()
+        for name in (requested or '').split(','):
+            name = name.strip()
+            if name == 'summary':
+                fields.update(cls.Meta.summary_fields)
+            elif name in available:
+                fields.add(name)
+            elif name:
+                raise ValueError(name)
+        for name in (excluded or '').split(','):
+            name = name.strip()
+            if name in available:
+                fields.discard(name)
+            elif name:
+                raise ValueError(name)
+        return fields
+
+
+class UserSerializer(TimedDataMixin, EagerLoadingMixin, serializers.ModelSerializer):
     id = serializers.ReadOnlyField()
-    liked = serializers.ReadOnlyField(source='liked.count')
+    liked = RelatedCountField()
     # likes= serializers.ReadOnlyField(source='likes.count')
 
     class Meta:
         model = User
         fields = ['id','liked','username', 'email']
+        list_serializer_class = TimedListSerializer
         # extra_kwargs = {
         #     'first_name': {'required': False},
         #     'last_name': {'required': False}
@@ -46,26 +223,31 @@ class RegisterSerializer(serializers.ModelSerializer):
 
         return user
 
-class ReviewSerializer(serializers.ModelSerializer):
+class ReviewSerializer(TimedDataMixin, SparseFieldsMixin, EagerLoadingMixin, serializers.ModelSerializer):
     # series = serializers.CharField(source='series.title')
     reviewer = serializers.ReadOnlyField(source='reviewer.username')
-    likes= serializers.ReadOnlyField(source='likes.count')
+    likes= serializers.ReadOnlyField(source='likes_count')
     series= serializers.ReadOnlyField(source='series.title')
     date=serializers.ReadOnlyField()
    
     class Meta:
         model = Review
-        fields = "__all__"
+        exclude = ["likes_count"]
+        read_only_fields = ["version"]
+        summary_fields = ["id", "reviewer", "rating", "likes", "date"]
+        list_serializer_class = TimedListSerializer
      
-class SeriesSerializer(serializers.ModelSerializer):
+class SeriesSerializer(TimedDataMixin, SparseFieldsMixin, EagerLoadingMixin, serializers.ModelSerializer):
     # reviews = ReviewSerializer(many=True,read_only=True)
     rating = serializers.ReadOnlyField()
-    number_of_reviews = serializers.ReadOnlyField(source='reviews.count')
+    number_of_reviews = serializers.ReadOnlyField()
     
     class Meta:
         model = Series
-        fields = "__all__"
-        # exclude =["reviews"]
+        exclude = ["rating_sum", "rating_weight", "genre_mask"]
+        read_only_fields = ["version"]
+        summary_fields = ["id", "title", "rating"]
+        list_serializer_class = TimedListSerializer
         # extra_kwargs = {
         #     'chapters': {'required': False},
         #     'volumes': {'required': False}
@@ -1,3 +1,1285 @@
-from django.test import TestCase
+import gzip
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+from datetime import timedelta
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.db.models import F, QuerySet
+from django.utils import timezone
+from django.test import AsyncRequestFactory, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from knox.models import AuthToken
+from knox.settings import knox_settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from .models import Series, Review, User, RatingJob, genre_mask
+from .jobs import run_pending
+from . import authentication, dbpool, metrics, recommendations, renderers, routers
+from .async_views import (AsyncSeriesListApiView, AsyncSeriesDetailApiView,
+    AsyncReviewListApiView)
+from .pagination import SeriesPagination
+from .views import SERIES_BOOLEAN_FILTERS, SERIES_RANGE_FILTERS
+from .serializers import SeriesSerializer, ReviewSerializer
+from .cache import RESPONSE_CACHE_ALIAS, cache_stats
+
+
+def make_series(**kwargs):
+    data = {
+        "title": "Berserk",
+        "author": "Kentaro Miura",
+        "genre": ["seinen", "fantasy"],
+        "year": 1989,
+    }
+    data.update(kwargs)
+    return Series.objects.create(**data)
+
+
+class ApiTestCase(TestCase):
+
+    def setUp(self):
+        caches[RESPONSE_CACHE_ALIAS].clear()
+        self.client = APIClient()
+        self.users = [
+            User.objects.create_user(username=f"user{i}", password="secret")
+            for i in range(4)
+        ]
+        self.series = make_series()
+
+    def as_user(self, user):
+        self.client.force_authenticate(user)
+        return self.client
+
+    def review_url(self, review=None, action=""):
+        url = f"/series/{self.series.pk}/reviews/"
+        if review is not None:
+            url += f"{review.pk}/"
+        return url + (f"{action}/" if action else "")
+
+    def post_review(self, user, rating, content="Great"):
+        response = self.as_user(user).post(
+            self.review_url(), {"content": content, "rating": rating}, format="json")
+        self.assertEqual(response.status_code, 201, response.data)
+        return Review.objects.get(reviewer=user, series=self.series)
+
+
+class RatingEngineTests(ApiTestCase):
+
+    def assertRatingInSync(self):
+        self.series.refresh_from_db()
+        if self.series.reviews.exists():
+            self.assertAlmostEqual(self.series.rating, self.series.get_rating, places=2)
+        else:
+            self.assertIsNone(self.series.rating)
+        self.assertEqual(
+            (self.series.rating_sum, self.series.rating_weight, self.series.number_of_reviews),
+            self.series.rating_totals(),
+        )
+
+    def test_rating_follows_every_write(self):
+        first = self.post_review(self.users[0], 8)
+        second = self.post_review(self.users[1], 4)
+        self.assertRatingInSync()
+        self.assertEqual(self.series.rating, 6)
+
+        for user in self.users[2:]:
+            response = self.as_user(user).put(self.review_url(first, "like"))
+            self.assertEqual(response.status_code, 200)
+        self.assertRatingInSync()
+        self.assertEqual(self.series.rating, 7)
+
+        response = self.as_user(self.users[1]).put(
+            self.review_url(second), {"rating": 10}, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertRatingInSync()
+
+        response = self.as_user(self.users[2]).put(self.review_url(first, "unlike"))
+        self.assertEqual(response.status_code, 200)
+        self.assertRatingInSync()
+
+        for review in (first, second):
+            response = self.as_user(review.reviewer).delete(self.review_url(review))
+            self.assertEqual(response.status_code, 200)
+            self.assertRatingInSync()
+        self.assertEqual(self.series.rating_sum, 0)
+
+    def test_edits_lock_the_review_before_reading_its_weight(self):
+        review = self.post_review(self.users[0], 8)
+        select_for_update = QuerySet.select_for_update
+        locked = []
+
+        def record(queryset, *args, **kwargs):
+            locked.append(queryset.model)
+            return select_for_update(queryset, *args, **kwargs)
+
+        with mock.patch.object(QuerySet, "select_for_update", record):
+            self.as_user(self.users[0]).put(self.review_url(review), {"rating": 4}, format="json")
+            self.assertEqual(locked[0], Review)
+            locked.clear()
+            self.as_user(self.users[0]).delete(self.review_url(review))
+            self.assertEqual(locked[0], Review)
+        self.assertRatingInSync()
+
+    def test_series_edits_lock_the_series_before_reading_it(self):
+        self.post_review(self.users[0], 8)
+        select_for_update = QuerySet.select_for_update
+        locked = []
+
+        def record(queryset, *args, **kwargs):
+            locked.append(queryset.model)
+            return select_for_update(queryset, *args, **kwargs)
+
+        version = Series.objects.get(pk=self.series.pk).version
+        with mock.patch.object(QuerySet, "select_for_update", record):
+            response = self.as_user(self.users[0]).put(
+                f"/series/{self.series.pk}/", {"about": "Guts."}, format="json")
+        self.assertEqual(locked, [Series])
+        self.assertEqual(response.json()["version"], version + 1)
+        self.assertRatingInSync()
+
+    def test_deleting_user_rebuilds_touched_series(self):
+        review = self.post_review(self.users[0], 2)
+        self.post_review(self.users[1], 10)
+        self.as_user(self.users[2]).put(self.review_url(review, "like"))
+
+        admin = User.objects.create_superuser(username="admin", password="secret")
+        response = self.as_user(admin).delete(f"/users/{self.users[2].pk}/")
+        self.assertEqual(response.status_code, 200)
+        self.assertRatingInSync()
+        self.assertEqual(self.series.rating, 6)
+
+    def test_rebuild_ratings_command(self):
+        self.post_review(self.users[0], 7)
+        call_command("rebuild_ratings", "--check", stdout=StringIO())
+
+        Series.objects.filter(pk=self.series.pk).update(rating_sum=0, rating=1)
+        with self.assertRaises(CommandError):
+            call_command("rebuild_ratings", "--check", stdout=StringIO())
+
+        call_command("rebuild_ratings", stdout=StringIO())
+        self.assertRatingInSync()
+        self.assertEqual(self.series.rating, 7)
+
+    def test_rebuild_ratings_command_locks_like_the_api(self):
+        other = make_series(title="Monster", author="Naoki Urasawa")
+        self.post_review(self.users[0], 7)
+        Series.objects.update(rating_sum=0, rating=1)
+        rebuild = Series.rebuild_ratings
+        with mock.patch("mangareview.management.commands.rebuild_ratings.BATCH_SIZE", 1), \
+                mock.patch.object(Series, "rebuild_ratings", side_effect=rebuild) as rebuilt:
+            call_command("rebuild_ratings", stdout=StringIO())
+        self.assertEqual([call.args[0] for call in rebuilt.call_args_list],
+                         [[self.series.pk], [other.pk]])
+        self.assertRatingInSync()
+
+
+class LikeCounterTests(ApiTestCase):
+
+    def test_like_and_unlike_keep_counter_in_step(self):
+        review = self.post_review(self.users[0], 9)
+        for user in self.users[1:]:
+            self.as_user(user).put(self.review_url(review, "like"))
+        self.as_user(self.users[1]).put(self.review_url(review, "unlike"))
+
+        review.refresh_from_db()
+        self.assertEqual(review.likes_count, 2)
+        self.assertEqual(review.likes_count, review.likes.count())
+        response = self.client.get(self.review_url(review))
+        self.assertEqual(response.data["likes"], 2)
+
+    def test_membership_checks(self):
+        review = self.post_review(self.users[0], 9)
+        self.as_user(self.users[1]).put(self.review_url(review, "like"))
+        response = self.client.put(self.review_url(review, "like"))
+        self.assertEqual(response.data["res"], "You have already liked this review")
+        response = self.as_user(self.users[2]).put(self.review_url(review, "unlike"))
+        self.assertEqual(response.data["res"], "Review not in your liked list")
+        review.refresh_from_db()
+        self.assertEqual(review.likes_count, 1)
+
+        response = self.as_user(self.users[0]).post(
+            self.review_url(), {"content": "Again", "rating": 1}, format="json")
+        self.assertEqual(response.data["res"], "You can't review a series more than once")
+
+    def test_concurrent_duplicate_review_is_refused(self):
+        self.post_review(self.users[0], 9)
+        # As if another worker inserted the review after the EXISTS check.
+        with mock.patch("django.db.models.QuerySet.exists", return_value=False):
+            response = self.as_user(self.users[0]).post(
+                self.review_url(), {"content": "Again", "rating": 1}, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.series.refresh_from_db()
+        self.assertEqual((self.series.number_of_reviews, self.series.rating), (1, 9))
+
+    def test_rebuild_ratings_resyncs_counter(self):
+        review = self.post_review(self.users[0], 9)
+        self.as_user(self.users[1]).put(self.review_url(review, "like"))
+        Review.objects.filter(pk=review.pk).update(likes_count=5)
+
+        with self.assertRaises(CommandError):
+            call_command("rebuild_ratings", "--check", stdout=StringIO())
+        call_command("rebuild_ratings", stdout=StringIO())
+        review.refresh_from_db()
+        self.assertEqual(review.likes_count, 1)
+
+
+class BatchLikeTests(ApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.other = make_series(title="Uzumaki", author="Junji Ito")
+        self.reviews = [self.post_review(user, rating) for user, rating in
+                        zip(self.users[:3], (9, 7, 4))]
+        self.reviews.append(Review.objects.create(
+            reviewer=self.users[0], series=self.other, rating=3, content="Meh"))
+        self.other.update()
+
+    def batch(self, user, **body):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.as_user(user).put("/liked_reviews/", body, format="json")
+
+    def test_like_and_unlike_many(self):
+        user = self.users[3]
+        self.as_user(user).put(self.review_url(self.reviews[1], "like"))
+        pks = [review.pk for review in self.reviews]
+
+        response = self.batch(user, like=[pks[0], pks[1], pks[3]], unlike=[pks[2], 999])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["liked"], [pks[0], pks[3]])
+        self.assertEqual(response.json()["unliked"], [])
+        self.assertEqual(response.json()["not_found"], [999])
+
+        response = self.batch(user, unlike=[pks[1], pks[3]])
+        self.assertEqual(response.json()["unliked"], [pks[1], pks[3]])
+
+        self.assertEqual(list(user.liked.values_list("pk", flat=True)), [pks[0]])
+        for review in self.reviews:
+            review.refresh_from_db()
+            self.assertEqual(review.likes_count, review.likes.count())
+        for series in (self.series, self.other):
+            series.refresh_from_db()
+            self.assertEqual(
+                (series.rating_sum, series.rating_weight, series.number_of_reviews),
+                series.rating_totals())
+        self.assertEqual(self.series.rating, 7.25)
+        self.assertEqual(self.client.get("/series/").json()["results"][1]["rating"], 7.25)
+
+    def test_queries_per_series_not_per_review(self):
+        pks = [review.pk for review in self.reviews[:3]]
+        # Lock reviews + current likes + insert + counters, then lock and save
+        # the one series (plus the savepoints of the two atomic blocks). The
+        # leaderboard and trending updates run once the request has committed.
+        with self.captureOnCommitCallbacks(), self.assertNumQueries(10):
+            self.as_user(self.users[3]).put("/liked_reviews/", {"like": pks}, format="json")
+
+    def test_invalid_bodies(self):
+        for body in ({}, {"like": 1}, {"like": ["1"]}, {"like": [1], "unlike": [1]},
+                     {"like": list(range(1001))}):
+            response = self.batch(self.users[3], **body)
+            self.assertEqual(response.status_code, 400, body)
+        for body in ([1, 2], "like", 1):
+            response = self.as_user(self.users[3]).put("/liked_reviews/", body, format="json")
+            self.assertEqual(response.status_code, 400, body)
+
+    def test_series_are_locked_in_pk_order(self):
+        # The review of the first series comes after the one of the second.
+        later = self.post_review(self.users[3], 6)
+        pks = [later.pk, self.reviews[3].pk]
+        locked = []
+        apply_rating_delta = Series.apply_rating_delta
+
+        def record(series, *args):
+            locked.append(series.pk)
+            return apply_rating_delta(series, *args)
+
+        with mock.patch.object(Series, "apply_rating_delta", record):
+            self.batch(self.users[3], like=pks)
+        self.assertEqual(locked, sorted([self.series.pk, self.other.pk]))
+
+
+@override_settings(RATING_ASYNC=True, RATING_WORKERS=0)
+class RatingJobTests(ApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.review = self.post_review(self.users[0], 9)
+
+    def like(self, user):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.as_user(user).put(self.review_url(self.review, "like"))
+
+    def test_burst_coalesces_into_one_job(self):
+        for user in self.users[1:]:
+            self.like(user)
+        self.post_review(self.users[1], 1)
+        self.assertEqual(RatingJob.objects.count(), 1)
+        self.series.refresh_from_db()
+        self.assertIsNone(self.series.rating)
+
+        self.assertEqual(run_pending(), 1)
+        self.assertFalse(RatingJob.objects.exists())
+        self.series.refresh_from_db()
+        self.assertEqual(self.series.rating, 7.4)
+        self.assertEqual(self.client.get("/series/").json()["results"][0]["rating"], 7.4)
+
+    def test_job_bumped_while_running_stays_queued(self):
+        rebuild = Series.rebuild_ratings
+
+        def racing_write(pks):
+            RatingJob.objects.update(generation=F("generation") + 1)
+            rebuild(pks)
+
+        with mock.patch.object(Series, "rebuild_ratings", side_effect=racing_write):
+            run_pending()
+        self.assertTrue(RatingJob.objects.exists())
+        call_command("run_rating_jobs", stdout=StringIO())
+        self.assertFalse(RatingJob.objects.exists())
+
+    def test_stale_job_is_run_by_the_next_write(self):
+        RatingJob.objects.update(
+            created_at=timezone.now() - timedelta(seconds=settings.RATING_MAX_STALENESS + 1))
+        self.like(self.users[1])
+        self.assertFalse(RatingJob.objects.exists())
+        self.series.refresh_from_db()
+        self.assertEqual(self.series.rating, 9)
+
+
+class AsyncViewTests(ApiTestCase):
+
+    async def test_async_views_serve_the_same_bodies(self):
+        factory = AsyncRequestFactory()
+        review = await sync_to_async(self.post_review)(self.users[0], 8)
+        for view, url, kwargs in (
+            (AsyncSeriesListApiView, "/series/?year[gte]=1980", {}),
+            (AsyncSeriesDetailApiView, f"/series/{self.series.pk}/", {"series_pk": self.series.pk}),
+            (AsyncReviewListApiView, self.review_url(), {"series_pk": self.series.pk}),
+        ):
+            response = await view.as_view()(factory.get(url), **kwargs)
+            self.assertEqual(response.status_code, 200)
+            expected = await sync_to_async(self.client.get)(url)
+            self.assertEqual(json.loads(response.content), expected.json())
+        self.assertEqual(json.loads(response.content)["results"][0]["id"], review.pk)
+
+
+class TokenCacheTests(ApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        authentication.clear()
+        _, token = AuthToken.objects.create(self.users[0])
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {token}")
+
+    def token_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get("/liked_reviews/").status_code, 200)
+        return [q for q in queries if "knox_authtoken" in q["sql"]]
+
+    def test_cached_token_skips_the_token_queries(self):
+        self.assertTrue(self.token_queries())
+        self.assertEqual(self.token_queries(), [])
+
+    def test_logout_drops_the_cached_token(self):
+        self.token_queries()
+        self.assertEqual(self.client.post("/logout/").status_code, 204)
+        self.assertEqual(self.client.get("/liked_reviews/").status_code, 401)
+
+    def test_logout_reaches_the_other_processes(self):
+        self.token_queries()
+        # What another process still has cached once the logout is done.
+        entries = dict(authentication._entries)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.post("/logout/").status_code, 204)
+        authentication._entries.update(entries)
+        self.assertEqual(self.client.get("/liked_reviews/").status_code, 401)
+
+    def test_expired_token_is_rejected(self):
+        self.token_queries()
+        later = timezone.now() + knox_settings.TOKEN_TTL + timedelta(seconds=1)
+        with mock.patch("django.utils.timezone.now", return_value=later):
+            self.assertEqual(self.client.get("/liked_reviews/").status_code, 401)
+        self.assertFalse(AuthToken.objects.exists())
+
+    def test_expiry_refreshes_are_written_after_the_request(self):
+        tokens = [AuthToken.objects.create(user)[1] for user in self.users[1:]]
+        later = timezone.now() + timedelta(hours=1)
+        with mock.patch.object(knox_settings, "AUTO_REFRESH", True), \
+                mock.patch("django.utils.timezone.now", return_value=later):
+            for token in tokens:
+                self.client.credentials(HTTP_AUTHORIZATION=f"Token {token}")
+                self.client.get("/liked_reviews/")
+                self.assertFalse(authentication._refreshes)
+            # Cached, and used again within MIN_REFRESH_INTERVAL: nothing to write.
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get("/liked_reviews/")
+            self.assertFalse([q for q in queries if "knox_authtoken" in q["sql"]])
+        self.assertEqual(
+            AuthToken.objects.filter(expiry__gt=later + timedelta(hours=3)).count(), 3)
+
+    def test_pending_refreshes_are_written_in_one_update(self):
+        tokens = [AuthToken.objects.create(user)[0] for user in self.users[1:]]
+        authentication._refreshes.update(token.digest for token in tokens)
+        with self.assertNumQueries(1):
+            self.assertEqual(authentication.flush_refreshes(), 3)
+
+
+@override_settings(METRICS_SAMPLE_RATE=1, METRICS_TOKEN="scraper")
+class MetricsTests(ApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        metrics.reset()
+
+    def scrape(self, **headers):
+        return APIClient().get("/metrics/", **headers)
+
+    def test_requests_are_recorded_per_route(self):
+        self.post_review(self.users[0], 8)
+        self.client.get(self.review_url())
+        self.client.get(self.review_url())
+        body = self.scrape(HTTP_AUTHORIZATION="Bearer scraper").content.decode()
+        route = 'method="GET",route="series/<int:series_pk>/reviews/"'
+        self.assertIn(f"mangareview_request_duration_seconds_count{{{route}}} 2", body)
+        self.assertIn(f'mangareview_db_queries_bucket{{{route},le="+Inf"}} 2', body)
+        self.assertIn(
+            'mangareview_request_duration_seconds_count'
+            '{method="POST",route="series/<int:series_pk>/reviews/"} 1', body)
+        self.assertIn("# TYPE mangareview_render_duration_seconds histogram", body)
+
+    def render_seconds(self, route):
+        prefix = f'mangareview_render_duration_seconds_sum{{method="GET",route="{route}"}} '
+        line = next(line for line in metrics.exposition().splitlines() if line.startswith(prefix))
+        return float(line[len(prefix):])
+
+    def test_render_time_is_recorded_on_cache_miss(self):
+        response = self.client.get("/series/")
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertGreater(self.render_seconds("series/"), 0)
+
+    def test_render_time_is_recorded_for_async_views(self):
+        view = async_to_sync(AsyncSeriesDetailApiView.as_view())
+        middleware = metrics.MetricsMiddleware(
+            lambda request: view(request, series_pk=self.series.pk))
+        request = RequestFactory().get(f"/series/{self.series.pk}/")
+        request.resolver_match = mock.Mock(route="series/<int:series_pk>/")
+        self.assertEqual(middleware(request).status_code, 200)
+        self.assertGreater(self.render_seconds("series/<int:series_pk>/"), 0)
+
+    def test_metrics_are_protected(self):
+        self.assertEqual(self.scrape().status_code, 401)
+        self.assertEqual(self.scrape(HTTP_AUTHORIZATION="Bearer guess").status_code, 401)
+        admin = User.objects.create_user(username="admin", is_staff=True)
+        self.client.force_authenticate(admin)
+        self.assertEqual(self.client.get("/metrics/").status_code, 200)
+
+    @override_settings(METRICS_SAMPLE_RATE=0)
+    def test_sampling_off_records_nothing(self):
+        APIClient().get("/series/")
+        self.assertNotIn("_count{", metrics.exposition())
+
+
+class ConnectionPoolTests(TestCase):
+
+    def pool(self, size=1, timeout=0.05, max_age=None):
+        return dbpool.ConnectionPool(size, timeout, max_age)
+
+    def connect(self):
+        return sqlite3.connect(":memory:", check_same_thread=False)
+
+    def test_connections_are_reused(self):
+        pool = self.pool()
+        first = pool.checkout(self.connect)
+        pool.checkin(first)
+        self.assertIs(pool.checkout(self.connect), first)
+        self.assertEqual(pool.snapshot(), {
+            "checkouts_total": 2, "connects_total": 1, "size": 1, "open": 1, "idle": 0})
+
+    def test_waits_then_times_out(self):
+        pool = self.pool()
+        held = pool.checkout(self.connect)
+        with self.assertRaises(dbpool.PoolTimeout):
+            pool.checkout(self.connect)
+
+        threading.Timer(0.01, pool.checkin, [held]).start()
+        pool.timeout = 5
+        self.assertIs(pool.checkout(self.connect), held)
+        stats = pool.snapshot()
+        self.assertEqual((stats["waits_total"], stats["timeouts_total"]), (2, 1))
+        self.assertGreater(stats["wait_seconds_total"], 0)
+
+    def test_broken_and_old_connections_are_replaced(self):
+        pool = self.pool()
+        broken = pool.checkout(self.connect)
+        pool.checkin(broken)
+        broken.close()
+        replacement = pool.checkout(self.connect)
+        self.assertIsNot(replacement, broken)
+
+        pool.max_age = 0
+        pool.checkin(replacement)
+        self.assertEqual(pool.snapshot()["discards_total"], 2)
+        self.assertEqual((pool.snapshot()["open"], pool.snapshot()["idle"]), (0, 0))
+
+    @override_settings(DB_POOL_SIZE=3)
+    def test_exposed_as_metrics(self):
+        self.addCleanup(dbpool._pools.pop, "reports", None)
+        pool = dbpool.pool_for("reports")
+        pool.checkin(pool.checkout(self.connect))
+        text = metrics.exposition()
+        self.assertIn('mangareview_db_pool_checkouts_total{database="reports"} 1', text)
+        self.assertIn('mangareview_db_pool_size{database="reports"} 3', text)
+
+
+@override_settings(REPLICA_DATABASES=["replica1"])
+class ReplicaRoutingTests(ApiTestCase):
+
+    def read_db(self, method="GET", user=None, model=Series):
+        request = RequestFactory().generic(method, "/series/")
+        request.user = user or AnonymousUser()
+        token = routers._request.set(request if method in routers.SAFE_METHODS else None)
+        # Test cases run in a transaction, which keeps reads on the primary.
+        try:
+            with mock.patch.object(connection, "in_atomic_block", False):
+                return routers.ReplicaRouter().db_for_read(model)
+        finally:
+            routers._request.reset(token)
+
+    def setUp(self):
+        super().setUp()
+        caches["default"].clear()
+        lag = mock.patch.object(routers, "replica_lag", return_value=0)
+        self.lag = lag.start()
+        self.addCleanup(lag.stop)
+
+    def test_safe_requests_read_from_replicas(self):
+        self.assertEqual(self.read_db("GET"), "replica1")
+        self.assertEqual(self.read_db("POST"), "default")
+        self.assertEqual(self.read_db("GET", model=AuthToken), "default")
+        with override_settings(REPLICA_READS=False):
+            self.assertEqual(self.read_db("GET"), "default")
+        self.lag.return_value = settings.REPLICA_MAX_LAG + 1
+        self.assertEqual(self.read_db("GET"), "default")
+
+    def test_writers_are_pinned_to_the_primary(self):
+        self.client.get("/series/")
+        self.post_review(self.users[0], 8)
+        self.assertEqual(self.read_db("GET", self.users[0]), "default")
+        self.assertEqual(self.read_db("GET", self.users[1]), "replica1")
+
+        # Nor do they see response bodies cached from a replica.
+        self.assertEqual(self.client.get("/series/")["X-Cache"], "MISS")
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get("/series/")["X-Cache"], "HIT")
+
+
+class RenderingTests(ApiTestCase):
+
+    def test_fast_renderer_matches_the_stdlib_one(self):
+        review = self.post_review(self.users[0], 8, content="Ｌｉｎｅ\u2028 \"quoted\" ✓")
+        data = {"series": SeriesSerializer(Series.objects.all(), many=True).data,
+                "review": ReviewSerializer(review).data, "date": review.date,
+                "content": review.content, "rating": 7.25, "big": 2**70}
+        expected = JSONRenderer().render(data)
+        self.assertEqual(renderers.FastJSONRenderer().render(data), expected)
+        with mock.patch.object(renderers, "orjson", None):
+            self.assertEqual(renderers.FastJSONRenderer().render(data), expected)
+
+    def test_large_responses_are_compressed(self):
+        for i in range(30):
+            make_series(title=f"Series {i}")
+        plain = self.client.get("/series/")
+        response = self.client.get("/series/", HTTP_ACCEPT_ENCODING="br;q=0, gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", response["Vary"])
+        self.assertLess(len(response.content), len(plain.content))
+        self.assertEqual(json.loads(gzip.decompress(response.content)), plain.json())
+
+    def test_small_responses_are_not_compressed(self):
+        response = self.client.get(f"/series/{self.series.pk}/", HTTP_ACCEPT_ENCODING="gzip")
+        self.assertFalse(response.has_header("Content-Encoding"))
+
+
+class SparseFieldsTests(ApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        for i in range(3):
+            make_series(title=f"Series {i}", about="About " * 500)
+        self.post_review(self.users[0], 8, content="Long " * 800)
+
+    def test_fields_narrow_the_output_and_the_select(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/series/?fields=title,year&ordering=-rating")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            {tuple(row) for row in response.json()["results"]}, {("title", "year")})
+        select = next(q["sql"] for q in queries if 'FROM "mangareview_series"' in q["sql"]
+                      and "ORDER BY" in q["sql"])
+        self.assertNotIn('"about"', select)
+
+        next_page = self.client.get("/series/?fields=title&ordering=-rating&page_size=2")
+        self.assertIsNotNone(next_page.json()["next"])
+
+    def test_summary_and_exclude(self):
+        summary = self.client.get("/series/?fields=summary").json()["results"][0]
+        self.assertEqual(set(summary), {"id", "title", "rating"})
+        excluded = self.client.get("/series/?exclude=about,genre").json()["results"][0]
+        self.assertNotIn("about", excluded)
+        self.assertIn("number_of_reviews", excluded)
+
+        with CaptureQueriesContext(connection) as queries:
+            reviews = self.client.get(self.review_url() + "?fields=summary").json()["results"]
+        self.assertEqual(set(reviews[0]), {"id", "reviewer", "rating", "likes", "date"})
+        self.assertFalse(any('"content"' in q["sql"] for q in queries))
+
+    def test_unknown_field_is_refused(self):
+        response = self.client.get("/series/?fields=title,password")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["res"], "/password/ is not a valid field")
+
+
+class LeaderboardTests(ApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        for title, genre, rating, reviews in (("Monster", ["seinen"], 9.0, 4),
+                                              ("Uzumaki", ["horror"], 7.5, 9),
+                                              ("Nana", ["shojo", "drama"], 8.0, 2)):
+            make_series(title=title, author=title, genre=genre, rating=rating,
+                        number_of_reviews=reviews)
+
+    def board(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        return [(row["series"]["title"], row["score"]) for row in response.json()["results"]]
+
+    def test_top_rated_and_most_reviewed(self):
+        self.assertEqual(self.board("/leaderboards/top_rated/?k=2"),
+                         [("Monster", 9.0), ("Nana", 8.0)])
+        self.assertEqual([title for title, _ in self.board("/leaderboards/most_reviewed/")],
+                         ["Uzumaki", "Monster", "Nana"])
+        self.assertEqual(self.board("/leaderboards/top_rated/?genre=horror"), [("Uzumaki", 7.5)])
+
+    def test_writes_move_series_on_the_boards(self):
+        self.board("/leaderboards/top_rated/")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post_review(self.users[0], 10)
+        self.assertEqual(self.board("/leaderboards/top_rated/?k=1"), [("Berserk", 10.0)])
+        self.assertEqual(self.board("/leaderboards/top_rated/?genre=fantasy"), [("Berserk", 10.0)])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.series.rating = 8.5
+            self.series.save()
+        self.assertEqual([title for title, _ in self.board("/leaderboards/top_rated/")],
+                         ["Monster", "Berserk", "Nana", "Uzumaki"])
+
+    def test_a_like_only_touches_the_boards_it_moves_on(self):
+        review = self.post_review(self.users[0], 10)
+        self.post_review(self.users[1], 6)
+        call_command("refresh_leaderboards", stdout=StringIO())
+        # The like itself (11), then its rating boards: board states, entries
+        # and scores, and one UPDATE of the three boards Berserk rises on,
+        # under their lock (7), and trending (12). Not most_reviewed, nor the
+        # genre boards of other series.
+        with self.assertNumQueries(30), self.captureOnCommitCallbacks(execute=True):
+            self.as_user(self.users[2]).put(self.review_url(review, "like"))
+        self.assertEqual(self.board("/leaderboards/top_rated/?k=2"),
+                         [("Monster", 9.0), ("Berserk", 8.67)])
+        self.assertEqual(self.board("/leaderboards/top_rated/?genre=fantasy"), [("Berserk", 8.67)])
+
+    def test_reimport_with_a_new_genre_moves_the_genre_boards(self):
+        self.assertEqual(self.board("/leaderboards/top_rated/?genre=horror"), [("Uzumaki", 7.5)])
+        record = {"title": "Monster", "author": "Monster", "genre": ["horror"], "year": 1994}
+        with tempfile.NamedTemporaryFile("w", suffix=".jsonl", delete=False) as f:
+            f.write(json.dumps(record) + "\n")
+        self.addCleanup(os.remove, f.name)
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("import_catalog", f.name, "--update", stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(self.board("/leaderboards/top_rated/?genre=horror"),
+                         [("Monster", 9.0), ("Uzumaki", 7.5)])
+        self.assertEqual(self.board("/leaderboards/top_rated/?genre=seinen"), [])
+
+    def test_trending_counts_reviews_and_likes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            review = self.post_review(self.users[0], 8)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.as_user(self.users[1]).put(self.review_url(review, "like"))
+        self.assertEqual(self.board("/leaderboards/trending/"), [("Berserk", 4.0)])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.as_user(self.users[1]).put(self.review_url(review, "unlike"))
+        self.assertEqual(self.board("/leaderboards/trending/"), [("Berserk", 3.0)])
+
+    def test_invalid_requests(self):
+        for url in ("/leaderboards/best/", "/leaderboards/top_rated/?genre=cooking",
+                    "/leaderboards/most_reviewed/?genre=horror", "/leaderboards/trending/?k=0",
+                    "/leaderboards/top_rated/?k=ten", "/leaderboards/top_rated:horror/"):
+            self.assertEqual(self.client.get(url).status_code, 400, url)
+
+
+@skipUnless(recommendations.np is not None, "needs numpy and scipy")
+class RecommendationTests(ApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.monster = make_series(title="Monster", author="Naoki Urasawa", genre=["seinen"])
+        self.nana = make_series(title="Nana", author="Ai Yazawa", genre=["shojo"])
+        for user, series, rating in ((self.users[0], self.series, 9), (self.users[0], self.monster, 8),
+                                     (self.users[1], self.series, 8), (self.users[1], self.monster, 9),
+                                     (self.users[2], self.series, 7), (self.users[3], self.nana, 6)):
+            Review.objects.create(reviewer=user, series=series, rating=rating, content="Good")
+        call_command("build_recommendations", stdout=StringIO())
+
+    def results(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        return [row["series"]["title"] for row in response.json()["results"]]
+
+    def test_top_n_keeps_the_largest_of_each_row(self):
+        matrix = recommendations.sparse.csr_matrix([[1, 5, 3, 0], [0, 0, 2, 0], [4, 1, 6, 2]])
+        rows, columns, values = recommendations.top_n(matrix, 2)
+        self.assertEqual(list(zip(rows, columns, values)),
+                         [(0, 1, 5), (0, 2, 3), (1, 2, 2), (2, 2, 6), (2, 0, 4)])
+
+    def test_similar_series(self):
+        self.assertEqual(self.results(f"/series/{self.series.pk}/similar/"), ["Monster"])
+        self.assertEqual(self.results(f"/series/{self.nana.pk}/similar/"), [])
+        self.assertEqual(self.client.get(f"/series/{self.series.pk}/similar/?k=0").status_code, 400)
+
+    def test_recommended_to_readers_of_similar_series(self):
+        self.as_user(self.users[2])
+        response = self.client.get(f"/users/{self.users[2].pk}/recommended/")
+        self.assertEqual(response.json()["source"], "recommendations")
+        self.assertEqual(self.results(f"/users/{self.users[2].pk}/recommended/"), ["Monster"])
+        self.assertEqual(self.client.get(f"/users/{self.users[1].pk}/recommended/").status_code, 403)
+
+    def test_falls_back_to_top_rated(self):
+        user = User.objects.create_user(username="newcomer")
+        Review.objects.create(reviewer=user, series=self.series, rating=9, content="Good")
+        self.series.update()
+        self.nana.update()
+        response = self.as_user(user).get(f"/users/{user.pk}/recommended/")
+        self.assertEqual(response.json()["source"], "top_rated")
+        self.assertEqual([row["series"]["title"] for row in response.json()["results"]], ["Nana"])
+
+
+class PaginationTests(ApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        for i in range(6):
+            make_series(title=f"Series {i}")
+
+    def walk(self, url, link="next"):
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append([row["id"] for row in response.json()["results"]])
+            url = response.json()[link]
+        return pages
+
+    def test_pages_cover_the_table_in_order(self):
+        pages = self.walk("/series/?page_size=3")
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        ids = [pk for page in pages for pk in page]
+        self.assertEqual(ids, list(Series.objects.values_list("pk", flat=True)))
+
+    def test_previous_link_walks_back(self):
+        first = self.client.get("/series/?page_size=3").json()
+        second = self.client.get(first["next"]).json()
+        self.assertEqual(self.client.get(second["previous"]).json()["results"], first["results"])
+        self.assertIsNone(first["previous"])
+
+    def test_page_size_is_capped(self):
+        with mock.patch.object(SeriesPagination, "max_page_size", 4):
+            response = self.client.get("/series/?page_size=1000")
+        self.assertEqual(len(response.json()["results"]), 4)
+
+    def test_invalid_cursor(self):
+        response = self.client.get("/series/?cursor=not-a-cursor")
+        self.assertEqual(response.status_code, 404)
+
+    def test_tampered_cursors_are_refused(self):
+        def cursor(values):
+            return SeriesPagination().encode_cursor(values, reverse=False)
+
+        for url in (
+            f"/series/?cursor={cursor(['abc'])}",
+            f"/series/?cursor={cursor([[1]])}",
+            f"/series/?cursor={cursor([{'pk': 1}])}",
+            f"/series/?cursor={cursor([None])}",
+            f"/series/?cursor={cursor([1, 2])}",
+            f"/series/?ordering=rating&cursor={cursor(['x', 1])}",
+            f"{self.review_url()}?cursor={cursor(['yesterday', 1])}",
+        ):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 404)
+                self.assertEqual(response.json()["detail"], "Invalid cursor")
+
+    def test_reviews_are_paginated_by_date_then_pk(self):
+        reviews = [self.post_review(user, 5) for user in self.users]
+        pages = self.walk(self.review_url() + "?page_size=3")
+        self.assertEqual(
+            [pk for page in pages for pk in page],
+            [review.pk for review in reversed(reviews)],
+        )
+
+
+class QueryCountTests(ApiTestCase):
+
+    def populate(self, rows):
+        for i in range(rows):
+            series = make_series(title=f"Series {i}")
+            user = User.objects.create_user(username=f"reader{i}")
+            review = Review.objects.create(
+                reviewer=user, series=self.series, rating=5, content="Fine")
+            review.likes.add(self.users[0])
+            Review.objects.create(reviewer=user, series=series, rating=7, content="Good")
+
+    def assertConstantQueries(self, url, expected):
+        for rows in (2, 8):
+            self.populate(rows)
+            with self.assertNumQueries(expected):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            Series.objects.exclude(pk=self.series.pk).delete()
+            User.objects.filter(username__startswith="reader").delete()
+            caches[RESPONSE_CACHE_ALIAS].clear()
+
+    def test_series_list(self):
+        # Just the page: the ETag is the cached list's generation.
+        self.assertConstantQueries("/series/", 1)
+
+    def test_review_list(self):
+        # ETag lookup + series + page.
+        self.assertConstantQueries(self.review_url(), 3)
+
+    def test_user_list(self):
+        self.as_user(self.users[0])
+        self.assertConstantQueries("/users/", 1)
+
+    def test_liked_review_list(self):
+        self.as_user(self.users[0])
+        self.assertConstantQueries("/liked_reviews/", 1)
+
+    def test_counts_match_fallback(self):
+        self.populate(3)
+        self.as_user(self.users[0])
+        response = self.client.get("/users/")
+        for row in response.json()["results"]:
+            self.assertEqual(
+                row["liked"], Review.objects.filter(likes__id=row["id"]).count())
+
+
+class ResponseCacheTests(ApiTestCase):
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_second_read_is_served_from_cache(self):
+        before = cache_stats()
+        first = self.get("/series/?page_size=5&title=Berserk")
+        second = self.get("/series/?title=Berserk&page_size=5")
+        self.assertEqual(first["X-Cache"], "MISS")
+        self.assertEqual(second["X-Cache"], "HIT")
+        self.assertEqual(first.content, second.content)
+        after = cache_stats()
+        self.assertEqual(after["hits"] - before["hits"], 1)
+        self.assertEqual(after["misses"] - before["misses"], 1)
+
+    def test_hosts_get_their_own_links(self):
+        for i in range(3):
+            make_series(title=f"Series {i}")
+        for host in ("api.example.com", "mirror.example.com"):
+            response = self.client.get("/series/?page_size=1", HTTP_HOST=host)
+            self.assertEqual(response["X-Cache"], "MISS")
+            self.assertTrue(response.json()["next"].startswith(f"http://{host}/series/"))
+
+    def test_writes_invalidate_affected_responses(self):
+        review = self.post_review(self.users[0], 4)
+        other = make_series(title="Monster", author="Naoki Urasawa")
+        urls = ["/series/", f"/series/{self.series.pk}/", self.review_url()]
+        for url in urls + [f"/series/{other.pk}/"]:
+            self.get(url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.as_user(self.users[1]).put(self.review_url(review, "like"))
+        for url in urls:
+            self.assertEqual(self.get(url)["X-Cache"], "MISS", url)
+        self.assertEqual(self.get(f"/series/{other.pk}/")["X-Cache"], "HIT")
+        self.assertEqual(self.get(self.review_url()).json()["results"][0]["likes"], 1)
+
+    @override_settings(RESPONSE_GENERATIONS_CACHE="default")
+    def test_generations_can_live_in_the_shared_cache(self):
+        caches["default"].clear()
+        url = f"/series/{self.series.pk}/"
+        self.get(url)
+        self.assertEqual(self.get(url)["X-Cache"], "HIT")
+        key = f"generation:series:{self.series.pk}"
+        self.assertIsNone(caches[RESPONSE_CACHE_ALIAS].get(key))
+        before = caches["default"].get(key)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.as_user(self.users[0]).put(url, {"about": "Guts."}, format="json")
+        self.assertNotEqual(caches["default"].get(key), before)
+        self.assertEqual(self.get(url)["X-Cache"], "MISS")
+
+    def test_several_workers_need_a_shared_cache(self):
+        env = {name: value for name, value in os.environ.items()
+               if name not in ("REDIS_URL", "RESPONSE_CACHE_DIR")}
+        env.update(SECRET_KEY="x", WEB_CONCURRENCY="2")
+        result = subprocess.run([sys.executable, "-c", "import apirest.settings"],
+                                env=env, capture_output=True, text=True)
+        self.assertIn("ImproperlyConfigured", result.stderr)
+        env["RESPONSE_CACHE_DIR"] = tempfile.gettempdir()
+        result = subprocess.run([sys.executable, "-c", "import apirest.settings"],
+                                env=env, capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stderr)
+
+    def test_evictions_are_counted(self):
+        cache = caches[RESPONSE_CACHE_ALIAS]
+        before = cache_stats()["evictions"]
+        for i in range(cache._max_entries + 1):
+            cache.set(f"key{i}", i)
+        self.assertGreater(cache_stats()["evictions"], before)
+
+
+class ConditionalGetTests(ApiTestCase):
+
+    def test_series_detail_not_modified(self):
+        url = f"/series/{self.series.pk}/"
+        response = self.client.get(url)
+        etag = response["ETag"]
+        self.assertIn("Last-Modified", response)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+
+        self.post_review(self.users[0], 6)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_review_etag_follows_likes(self):
+        review = self.post_review(self.users[0], 6)
+        url = self.review_url(review)
+        etag = self.client.get(url)["ETag"]
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.as_user(self.users[1]).put(self.review_url(review, "like"))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["likes"], 1)
+
+    def test_series_list_etag_needs_no_query(self):
+        etag = self.client.get("/series/")["ETag"]
+        with self.assertNumQueries(0):
+            response = self.client.get("/series/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.as_user(self.users[0]).put(
+                f"/series/{self.series.pk}/", {"about": "Guts."}, format="json")
+        self.assertEqual(self.client.get("/series/", HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_list_etags_change_on_insert_and_delete(self):
+        etag = self.client.get("/series/")["ETag"]
+        self.assertEqual(self.client.get("/series/", HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        # The list's generation moves once the write commits.
+        with self.captureOnCommitCallbacks(execute=True):
+            other = make_series(title="Monster", author="Naoki Urasawa")
+        self.assertEqual(self.client.get("/series/", HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        etag = self.client.get("/series/")["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            other.delete()
+        self.assertEqual(self.client.get("/series/", HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        etag = self.client.get(self.review_url())["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            review = self.post_review(self.users[0], 3)
+        self.assertEqual(
+            self.client.get(self.review_url(), HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        # A like leaves the series row alone but still moves the reviews'
+        # generation.
+        etag = self.client.get(self.review_url())["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.as_user(self.users[1]).put(self.review_url(review, "like"))
+        self.assertEqual(
+            self.client.get(self.review_url(), HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class SearchTests(ApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        make_series(title="Vagabond", author="Takehiko Inoue",
+                    about="A retelling of the life of the swordsman Miyamoto Musashi.")
+        make_series(title="Slam Dunk", author="Takehiko Inoue",
+                    about="A delinquent joins the basketball team.")
+        self.monster = make_series(title="Monster", author="Naoki Urasawa",
+                                   about="A surgeon hunts a former patient.")
+
+    def search(self, query, **params):
+        response = self.client.get("/series/search/", {"q": query, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_ranked_results_with_snippets(self):
+        results = self.search("inoue sword")["results"]
+        self.assertEqual([row["title"] for row in results], ["Vagabond"])
+        self.assertIn("<b>", results[0]["snippet"])
+
+        titles = [row["title"] for row in self.search("takehiko")["results"]]
+        self.assertCountEqual(titles, ["Vagabond", "Slam Dunk"])
+
+    def test_prefix_and_empty_queries(self):
+        self.assertEqual(self.search("basket")["results"][0]["title"], "Slam Dunk")
+        self.assertEqual(self.search("")["results"], [])
+        self.assertEqual(self.search('"')["results"], [])
+
+    def test_index_follows_writes(self):
+        self.monster.about = "A neurosurgeon chases a serial killer."
+        self.monster.save()
+        self.assertEqual(self.search("killer")["results"][0]["id"], self.monster.pk)
+        self.assertEqual(self.search("patient")["results"], [])
+        self.monster.delete()
+        self.assertEqual(self.search("killer")["results"], [])
+
+    def test_pagination(self):
+        page = self.search("a", page_size=2)
+        self.assertEqual(len(page["results"]), 2)
+        self.assertIsNotNone(page["next"])
+        self.assertEqual(self.client.get("/series/search/?q=a&page=0").status_code, 404)
+
+
+class GenreFilterTests(ApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        make_series(title="Uzumaki", author="Junji Ito", genre=["seinen", "horror"])
+        make_series(title="Haikyu!!", author="Haruichi Furudate", genre=["shonen", "sports"])
+
+    def titles(self, query):
+        response = self.client.get(f"/series/?{query}")
+        self.assertEqual(response.status_code, 200)
+        return sorted(row["title"] for row in response.json()["results"])
+
+    def test_all_and_any(self):
+        self.assertEqual(self.titles("genre=seinen"), ["Berserk", "Uzumaki"])
+        self.assertEqual(self.titles("genre=seinen&genre=horror"), ["Uzumaki"])
+        self.assertEqual(
+            self.titles("genre=horror&genre=sports&genre_match=any"), ["Haikyu!!", "Uzumaki"])
+        self.assertEqual(self.titles("genre=horror&genre=sports"), [])
+
+    def test_mask_follows_updates(self):
+        response = self.as_user(self.users[0]).put(
+            f"/series/{self.series.pk}/", {"genre": ["horror"]}, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.titles("genre=horror"), ["Berserk", "Uzumaki"])
+        self.assertEqual(self.titles("genre=seinen"), ["Uzumaki"])
+
+    def test_unknown_genre(self):
+        response = self.client.get("/series/?genre=isekai")
+        self.assertEqual(response.status_code, 400)
+
+
+class SeriesFilterTests(ApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.series.rating = 9.5
+        self.series.chapters = 374
+        self.series.save()
+        make_series(title="Uzumaki", author="Junji Ito", year=1998,
+                    rating=8, chapters=19, volumes=3, completed=True)
+        make_series(title="Haikyu!!", author="Haruichi Furudate", year=2012,
+                    rating=8, chapters=402, volumes=45, completed=True, anime=True)
+        make_series(title="Dandadan", author="Yukinobu Tatsu", year=2021)
+
+    def titles(self, query):
+        response = self.client.get(f"/series/?{query}")
+        self.assertEqual(response.status_code, 200)
+        return [row["title"] for row in response.json()["results"]]
+
+    def test_ranges_and_booleans(self):
+        self.assertEqual(self.titles("year[gte]=1990&year[lte]=2015"), ["Haikyu!!", "Uzumaki"])
+        self.assertEqual(self.titles("rating[lte]=8.5"), ["Haikyu!!", "Uzumaki"])
+        self.assertEqual(self.titles("chapters[gte]=100"), ["Haikyu!!", "Berserk"])
+        self.assertEqual(self.titles("volumes[lte]=10"), ["Uzumaki"])
+        self.assertEqual(self.titles("completed=true&anime=0"), ["Uzumaki"])
+        self.assertEqual(self.titles("official_translation=false&year[gte]=2020"), ["Dandadan"])
+
+    def test_invalid_filters(self):
+        for query in ("year[gte]=soon", "rating[lte]=high", "anime=maybe", "ordering=title"):
+            response = self.client.get(f"/series/?{query}")
+            self.assertEqual(response.status_code, 400, query)
+
+    def test_ordering_pages_through_nulls(self):
+        # Unrated series sort below every rated one, both ways and across pages.
+        for ordering, expected in (
+            ("-rating", ["Berserk", "Haikyu!!", "Uzumaki", "Dandadan"]),
+            ("rating", ["Dandadan", "Uzumaki", "Haikyu!!", "Berserk"]),
+        ):
+            titles, url = [], f"/series/?ordering={ordering}&page_size=1"
+            while url:
+                page = self.client.get(url).json()
+                titles += [row["title"] for row in page["results"]]
+                url = page["next"]
+            self.assertEqual(titles, expected)
+
+            previous = self.client.get(
+                f"/series/?ordering={ordering}&page_size=3").json()["next"]
+            page = self.client.get(previous).json()
+            self.assertEqual(page["results"][0]["title"], expected[3])
+            page = self.client.get(page["previous"]).json()
+            self.assertEqual([row["title"] for row in page["results"]], expected[:3])
+
+    def test_ordering_by_number_of_reviews(self):
+        self.post_review(self.users[0], 7)
+        self.assertEqual(self.titles("ordering=-number_of_reviews&page_size=1"), ["Berserk"])
+        self.assertEqual(
+            self.client.get("/series/").json()["results"][-1]["number_of_reviews"], 1)
+
+    @staticmethod
+    def indexed_queries():
+        '''
+        Every combination the README promises an index for: any ordering,
+        with range filters on the ordered field, and with one boolean filter
+        when sorted by pk (the default), rating or year.
+        '''
+        orderings = [None] + [
+            f"{direction}{field}" for field in SeriesPagination.orderings for direction in ("", "-")]
+        for ordering in orderings:
+            field = ordering and ordering.lstrip("-")
+            ranges = [[]]
+            if field in SERIES_RANGE_FILTERS:
+                ranges += [[f"{field}[gte]=5"], [f"{field}[lte]=5"],
+                           [f"{field}[gte]=2", f"{field}[lte]=2000"]]
+            booleans = [None]
+            if field in (None, "rating", "year"):
+                booleans += [f"{name}={value}" for name in SERIES_BOOLEAN_FILTERS
+                             for value in ("true", "false")]
+            for bounds in ranges:
+                for boolean in booleans:
+                    params = bounds + [param for param in (boolean, ordering and f"ordering={ordering}") if param]
+                    yield "&".join(params)
+
+    @skipUnless(connection.vendor == 'sqlite', "EXPLAIN QUERY PLAN is SQLite's")
+    def test_filters_use_an_index(self):
+        for query in self.indexed_queries():
+            caches[RESPONSE_CACHE_ALIAS].clear()
+            with CaptureQueriesContext(connection) as captured:
+                self.client.get(f"/series/?{query}")
+            sql = next(q["sql"] for q in captured if "LIMIT" in q["sql"])
+            with connection.cursor() as cursor:
+                cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+                plan = [row[-1] for row in cursor.fetchall()]
+            with self.subTest(query=query):
+                # Unfiltered and in pk order, the table itself is the index.
+                if not query:
+                    self.assertEqual(plan, [f"SCAN {Series._meta.db_table}"])
+                    continue
+                self.assertTrue(all("USING" in step for step in plan), plan)
+                self.assertFalse(any("TEMP B-TREE" in step for step in plan), plan)
+
+
+class ImportCatalogTests(ApiTestCase):
+
+    def run_import(self, suffix, content, *args):
+        with tempfile.NamedTemporaryFile("w", suffix=suffix, delete=False) as f:
+            f.write(content)
+        self.addCleanup(os.remove, f.name)
+        stdout = StringIO()
+        call_command("import_catalog", f.name, *args, stdout=stdout, stderr=StringIO())
+        return stdout.getvalue()
+
+    def test_jsonl_with_reviews(self):
+        records = [
+            {"title": "Uzumaki", "author": "Junji Ito", "genre": ["horror"], "year": 1998,
+             "reviews": [{"reviewer": "user0", "content": "Spiral", "rating": 8},
+                         {"reviewer": "user1", "content": "Creepy", "rating": 6},
+                         {"reviewer": "nobody", "content": "?", "rating": 1}]},
+            {"title": "Bad", "author": "Nobody", "genre": ["isekai"], "year": 2000},
+            {"title": "Berserk", "author": "Kentaro Miura", "genre": ["seinen"], "year": 1989,
+             "reviews": [{"reviewer": "user0", "content": "Dark", "rating": 10}]},
+        ]
+        output = self.run_import(
+            ".jsonl", "\n".join(json.dumps(record) for record in records), "--chunk-size", "2")
+        self.assertIn("1 series created, 0 updated, 1 skipped, 3 reviews, 2 rejected", output)
+
+        uzumaki = Series.objects.get(title="Uzumaki")
+        self.assertEqual((uzumaki.rating, uzumaki.number_of_reviews), (7, 2))
+        self.assertEqual(uzumaki.genre_mask, genre_mask(["horror"]))
+        self.series.refresh_from_db()
+        self.assertEqual((self.series.rating, self.series.genre), (10, ["seinen", "fantasy"]))
+        call_command("rebuild_ratings", "--check", stdout=StringIO())
+
+    def test_csv_update(self):
+        content = (
+            "title,author,genre,year,completed,chapters\n"
+            "Berserk,Kentaro Miura,seinen;horror,1989,true,\n"
+            "Dandadan,Yukinobu Tatsu,shonen;comedy,2021,false,150\n"
+        )
+        output = self.run_import(".csv", content, "--update")
+        self.assertIn("1 series created, 1 updated, 0 skipped", output)
+        self.series.refresh_from_db()
+        self.assertEqual((self.series.genre, self.series.completed), (["seinen", "horror"], True))
+        self.assertEqual(self.series.version, 2)
+        self.assertEqual(Series.objects.get(title="Dandadan").chapters, 150)
+
+
+class ExportTests(ApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.post_review(self.users[0], 8, content="Dark, but great")
+        self.as_user(User.objects.create_superuser(username="admin"))
+
+    def export(self, url, **headers):
+        response = self.client.get(url, **headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b"".join(response.streaming_content)
+
+    def test_jsonl_and_csv(self):
+        rows = [json.loads(line) for line in self.export("/export/series/").splitlines()]
+        self.assertEqual([row["title"] for row in rows], ["Berserk"])
+        self.assertEqual(rows[0]["genre"], ["seinen", "fantasy"])
+
+        lines = self.export("/export/reviews/?format=csv").decode().splitlines()
+        self.assertEqual(lines[0], "id,series_id,reviewer,content,rating,likes,date,version,updated_at")
+        self.assertIn('user0,"Dark, but great",8.0,0', lines[1])
+
+    def test_since_and_gzip(self):
+        later = make_series(title="Uzumaki", author="Junji Ito")
+        since = later.updated_at.isoformat()
+        body = gzip.decompress(self.export(
+            f"/export/series/?since={since.replace('+', '%2B')}", HTTP_ACCEPT_ENCODING="gzip"))
+        self.assertEqual([json.loads(line)["title"] for line in body.splitlines()], ["Uzumaki"])
+
+        response = self.client.get("/export/series/?since=yesterday")
+        self.assertEqual(response.status_code, 400)
+
+    def test_requires_admin(self):
+        self.as_user(self.users[0])
+        self.assertEqual(self.client.get("/export/reviews/").status_code, 403)
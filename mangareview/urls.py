@@ -1,26 +1,45 @@
 # todo/todo/urls.py : Main urls.py
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, re_path, include
 from knox import views as knox_views
 from .views import (SeriesListApiView, ReviewListApiView, 
 SeriesDetailApiView, ReviewDetailApiView, RegisterApiView, 
 LoginAPI, UserListApiView, UserDetailApiView, 
-ReviewLikeListApiView, ReviewUnlikeListApiView, LikedReviewListApiView)
+ReviewLikeListApiView, ReviewUnlikeListApiView, LikedReviewListApiView,
+CacheStatsApiView, MetricsApiView, SeriesSearchApiView, LeaderboardApiView, SimilarSeriesApiView,
+RecommendedSeriesApiView, SeriesExportApiView, ReviewExportApiView)
+from .async_views import (AsyncSeriesListApiView, AsyncSeriesDetailApiView,
+AsyncReviewListApiView)
+
+# The ASGI profile serves the busiest endpoints from async handlers.
+if settings.SERVER_PROFILE == 'asgi':
+    SeriesListApiView = AsyncSeriesListApiView
+    SeriesDetailApiView = AsyncSeriesDetailApiView
+    ReviewListApiView = AsyncReviewListApiView
 
 
 urlpatterns = [
     path('series/', SeriesListApiView.as_view()),
+    path('series/search/', SeriesSearchApiView.as_view()),
+    path('leaderboards/<str:board>/', LeaderboardApiView.as_view()),
     path('users/', UserListApiView.as_view()),
     path('users/<int:user_id>/', UserDetailApiView.as_view()),
+    path('users/<int:user_id>/recommended/', RecommendedSeriesApiView.as_view()),
     path('register/', RegisterApiView.as_view()),
     path('login/', LoginAPI.as_view()),
     path('logout/', knox_views.LogoutView.as_view()),
     path('series/<int:series_pk>/', SeriesDetailApiView.as_view()),
+    path('series/<int:series_pk>/similar/', SimilarSeriesApiView.as_view()),
     path('series/<int:series_pk>/reviews/', ReviewListApiView.as_view()),
     path('series/<int:series_pk>/reviews/<int:review_pk>/', ReviewDetailApiView.as_view()),
     path('series/<int:series_pk>/reviews/<int:review_pk>/like/', ReviewLikeListApiView.as_view()),
     path('series/<int:series_pk>/reviews/<int:review_pk>/unlike/', ReviewUnlikeListApiView.as_view()),
     path('liked_reviews/', LikedReviewListApiView.as_view()),
+    path('cache/stats/', CacheStatsApiView.as_view()),
+    path('metrics/', MetricsApiView.as_view()),
+    path('export/series/', SeriesExportApiView.as_view()),
+    path('export/reviews/', ReviewExportApiView.as_view()),
 
 ]
 
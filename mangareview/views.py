@@ -1,11 +1,24 @@
 from django.shortcuts import render
+from django.conf import settings
+from django.http import HttpResponse
 
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework import permissions
-from .models import Series, Review, User
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from .models import Series, Review, User, SimilarSeries, Recommendation, GENRES, genre_mask
 from .serializers import SeriesSerializer, ReviewSerializer, RegisterSerializer, UserSerializer
+from .pagination import SeriesPagination, ReviewPagination, UserPagination, RankedPagination
+from .search import search_series
+from .export import (JSONLinesRenderer, CSVRenderer, SERIES_COLUMNS, REVIEW_COLUMNS,
+    export_response, parse_since)
+from .cache import cache_response, cache_stats, invalidate_series
+from .metrics import exposition
+from .leaderboards import BOARDS, record_activity, top
+from .conditional import (conditional_series, conditional_review,
+    conditional_series_list, conditional_review_list)
 from rest_framework.renderers import JSONRenderer
 from knox.models import AuthToken
 from django.contrib.auth import login
@@ -59,11 +72,13 @@ class UserListApiView(APIView):
     def get(self, request, *args, **kwargs):
         
         '''
-        Retrieves users list. Requires authentication.
+        Retrieves users list, one page at a time. Requires authentication.
         '''
-        user_list = User.objects.all()
-        serializer = UserSerializer(user_list, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        user_list = UserSerializer.setup_eager_loading(User.objects.all())
+        paginator = UserPagination()
+        page = paginator.paginate_queryset(user_list, request, view=self)
+        serializer = UserSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
 
 class UserDetailApiView(APIView):
     permission_classes = [permissions.IsAdminUser, permissions.IsAuthenticatedOrReadOnly]
@@ -104,21 +119,52 @@ class UserDetailApiView(APIView):
                 {"res": "Object with user pk does not exists"}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
-        user_instance.delete()
+        # The user's reviews and likes go away with it, so the ratings of
+        # every series they touched have to be rebuilt.
+        with transaction.atomic():
+            affected_series = list(Series.objects.filter(
+                Q(reviews__reviewer=user_instance) | Q(reviews__likes=user_instance)
+            ).distinct().values_list('pk', flat=True))
+            Review.objects.filter(likes=user_instance).update(
+                likes_count=F('likes_count') - 1, **Review.touched())
+            user_instance.delete()
+            # Locks the series and rebuilds them all in one aggregate.
+            Series.rebuild_ratings(affected_series)
+            for series_pk in affected_series:
+                invalidate_series(series_pk)
         return Response(
             {"res": "Object deleted!"},
             status=status.HTTP_200_OK
         )
+# Filters of the series list, each backed by an index (see Series.Meta).
+# Ranges seek their index when the list is sorted on the same field
+# (?year[gte]=2000&ordering=year); with the default order they filter the
+# primary key walk instead.
+SERIES_RANGE_FILTERS = {'rating': float, 'year': int, 'chapters': int, 'volumes': int}
+SERIES_BOOLEAN_FILTERS = ('completed', 'anime', 'official_translation')
+BOOLEANS = {'true': True, '1': True, 'false': False, '0': False}
+
 class SeriesListApiView(APIView):
     permission_classes=[permissions.IsAuthenticatedOrReadOnly]
     serializer_class = SeriesSerializer
 
     # 1. List all
+    @conditional_series_list
+    @cache_response('series_list')
     def get(self, request, *args, **kwargs):
         '''
-        Retrieves series list. No authentication is needed.
+        Retrieves series list, one page at a time. No authentication is needed.
         '''
-        series_list = Series.objects.all()
+        # ?fields=title,rating / ?fields=summary / ?exclude=about
+        try:
+            fields = SeriesSerializer.sparse_fields(request.query_params)
+        except ValueError as error:
+            return Response(
+                {"res": f"/{error}/ is not a valid field"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        series_list = SeriesSerializer.setup_eager_loading(
+            Series.objects.all(), fields, required=SeriesPagination.orderings)
         title = request.query_params.get('title', None)
         author = request.query_params.get('author', None)
         year = request.query_params.get('year', None)
@@ -128,12 +174,62 @@ class SeriesListApiView(APIView):
             if value is not None:
                 series_list = series_list.filter(**{key:value})
 
-        rating = request.query_params.get('rating[gte]', None)
-        if rating is not None:
-            series_list = series_list.filter(rating__gte=rating)
-       
-        serializer = SeriesSerializer(series_list, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        # ?year[gte]=2000&year[lte]=2010, ?completed=true...
+        for field, parse in SERIES_RANGE_FILTERS.items():
+            for bound in ('gte', 'lte'):
+                value = request.query_params.get(f"{field}[{bound}]", None)
+                if value is None:
+                    continue
+                try:
+                    value = parse(value)
+                except ValueError:
+                    return Response(
+                        {"res": f"/{value}/ is not a valid {field}[{bound}]"},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+                series_list = series_list.filter(**{f"{field}__{bound}": value})
+
+        for field in SERIES_BOOLEAN_FILTERS:
+            value = request.query_params.get(field, None)
+            if value is None:
+                continue
+            if value.lower() not in BOOLEANS:
+                return Response(
+                    {"res": f"/{value}/ is not a valid {field}, use true or false"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            # `field IN (x)` rather than `field = x`: on SQLite the latter
+            # compiles to a bare `WHERE field`, which can't seek the index.
+            series_list = series_list.filter(**{f"{field}__in": [BOOLEANS[value.lower()]]})
+
+        ordering = request.query_params.get('ordering', None)
+        if ordering is not None and ordering.lstrip('-') not in SeriesPagination.orderings:
+            return Response(
+                {"res": f"/{ordering}/ is not a valid ordering"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # ?genre=seinen&genre=horror: series with all of them, or any of
+        # them with &genre_match=any.
+        genres = request.query_params.getlist('genre')
+        if genres:
+            for genre in genres:
+                if genre not in GENRES:
+                    return Response(
+                        {"res": f"/{genre}/ is not a valid genre"},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+            mask = genre_mask(genres)
+            series_list = series_list.annotate(genre_bits=F('genre_mask').bitand(mask))
+            if request.query_params.get('genre_match', 'all') == 'any':
+                series_list = series_list.filter(genre_bits__gt=0)
+            else:
+                series_list = series_list.filter(genre_bits=mask)
+
+        paginator = SeriesPagination()
+        page = paginator.paginate_queryset(series_list, request, view=self)
+        serializer = SeriesSerializer(page, many=True, fields=fields)
+        return paginator.get_paginated_response(serializer.data)
     
     # 2. Create
     # @swagger_auto_schema(request_body=SeriesSerializer)
@@ -144,26 +240,185 @@ class SeriesListApiView(APIView):
         # request.data["reviews"] = []
         serializer = SeriesSerializer(data=request.data)
         if serializer.is_valid():
-            serializer.save()
+            series = serializer.save()
+            invalidate_series(series.pk)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+class SeriesSearchApiView(APIView):
+    permission_classes=[permissions.IsAuthenticatedOrReadOnly]
+
+    def get(self, request, *args, **kwargs):
+        '''
+        Full-text search over series title, author and about (?q=), best match
+        first, one page at a time. Each result carries a highlighted snippet.
+        No authentication is needed.
+        '''
+        query = request.query_params.get('q', '')
+        try:
+            fields = SeriesSerializer.sparse_fields(request.query_params)
+        except ValueError as error:
+            return Response(
+                {"res": f"/{error}/ is not a valid field"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        paginator = RankedPagination()
+        matches = paginator.paginate_ranking(
+            lambda limit, offset: search_series(query, limit, offset), request)
+
+        series_list = SeriesSerializer.setup_eager_loading(
+            Series.objects.filter(pk__in=[pk for pk, _ in matches]), fields)
+        series_by_pk = {series.pk: series for series in series_list}
+        results = []
+        for pk, snippet in matches:
+            if pk in series_by_pk:
+                data = SeriesSerializer(series_by_pk[pk], fields=fields).data
+                data['snippet'] = snippet
+                results.append(data)
+        return paginator.get_paginated_response(results)
+
+def requested_k(request, maximum):
+    '''
+    The ?k= of a top-k view (10 by default), None if not between 1 and maximum.
+    '''
+    try:
+        k = int(request.query_params.get('k', 10))
+    except ValueError:
+        return None
+    return k if 1 <= k <= maximum else None
+
+def ranked(entries, series_field='series'):
+    '''
+    Results of a top-k view: rank, score and summary of each entry's series.
+    '''
+    fields = set(SeriesSerializer.Meta.summary_fields)
+    return [
+        {"rank": rank, "score": entry.score,
+         "series": SeriesSerializer(getattr(entry, series_field), fields=fields).data}
+        for rank, entry in enumerate(entries, start=1)
+    ]
+
+class LeaderboardApiView(APIView):
+    permission_classes=[permissions.IsAuthenticatedOrReadOnly]
+    max_k = settings.LEADERBOARD_SIZE // 2
+
+    def get(self, request, board, *args, **kwargs):
+        '''
+        Retrieves the k (?k=, 10 by default) best series of a leaderboard:
+        top_rated (of a genre with ?genre=), most_reviewed or trending (most
+        reviews and likes over the last LEADERBOARD_TRENDING_HOURS hours).
+        No authentication is needed.
+        '''
+        genre = request.query_params.get('genre', None)
+        if board not in BOARDS or ':' in board or (
+                genre is not None and (board != 'top_rated' or genre not in GENRES)):
+            return Response(
+                {"res": f"/{board}/ is not a valid leaderboard"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if genre is not None:
+            board = f"top_rated:{genre}"
+        k = requested_k(request, self.max_k)
+        if k is None:
+            return Response(
+                {"res": f"k must be between 1 and {self.max_k}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        leaderboard, entries = top(board, k)
+        return Response(
+            {"board": board, "refreshed_at": leaderboard.refreshed_at, "results": ranked(entries)},
+            status=status.HTTP_200_OK
+        )
+
+class SimilarSeriesApiView(APIView):
+    permission_classes=[permissions.IsAuthenticatedOrReadOnly]
+    max_k = settings.RECOMMENDATIONS_SIZE
+
+    def get(self, request, series_pk, *args, **kwargs):
+        '''
+        Retrieves the k (?k=, 10 by default) series most often read by the
+        readers of a series, as of the last build_recommendations run.
+        No authentication is needed.
+        '''
+        if not Series.objects.filter(pk=series_pk).exists():
+            return Response(
+                {"res": "Series does not exist"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        k = requested_k(request, self.max_k)
+        if k is None:
+            return Response(
+                {"res": f"k must be between 1 and {self.max_k}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        entries = SimilarSeries.objects.filter(series=series_pk).select_related(
+            'other').order_by('-score', 'other')[:k]
+        return Response({"results": ranked(entries, 'other')}, status=status.HTTP_200_OK)
+
+class RecommendedSeriesApiView(APIView):
+    permission_classes=[IsSelfOrAdmin]
+    max_k = settings.RECOMMENDATIONS_SIZE
+
+    def get(self, request, user_id, *args, **kwargs):
+        '''
+        Retrieves the k (?k=, 10 by default) series recommended to a user
+        from what they reviewed and liked, as of the last
+        build_recommendations run. Users without recommendations yet get
+        the top rated series they haven't reviewed ("source": "top_rated").
+        Users can only see their own recommendations, admins everyone's.
+        '''
+        if not User.objects.filter(pk=user_id).exists():
+            return Response(
+                {"res": "Object with user pk does not exists"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        k = requested_k(request, self.max_k)
+        if k is None:
+            return Response(
+                {"res": f"k must be between 1 and {self.max_k}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        source = "recommendations"
+        entries = list(Recommendation.objects.filter(user=user_id).select_related(
+            'series').order_by('-score', 'series')[:k])
+        if not entries:
+            source = "top_rated"
+            reviewed = set(Review.objects.filter(reviewer=user_id).values_list('series', flat=True))
+            _, entries = top(source, settings.LEADERBOARD_SIZE)
+            entries = [entry for entry in entries if entry.series_id not in reviewed][:k]
+        return Response({"source": source, "results": ranked(entries)}, status=status.HTTP_200_OK)
+
 class ReviewListApiView(APIView):
     # add permission to check if user is authenticated
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
     serializer_class = ReviewSerializer
 
     # 1. List all
+    @conditional_review_list
+    @cache_response('reviews', 'series_pk')
     def get(self, request, series_pk, *args, **kwargs):
         '''
-        Retrieves reviews list. No authentication is needed. 
+        Retrieves reviews list, one page at a time. No authentication is needed. 
         '''
         # reviews = Review.objects.all()
+        try:
+            fields = ReviewSerializer.sparse_fields(request.query_params)
+        except ValueError as error:
+            return Response(
+                {"res": f"/{error}/ is not a valid field"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         series = Series.objects.get(pk=series_pk)
-        reviews = Review.objects.filter(series=series)
-        serializer = ReviewSerializer(reviews, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        reviews = ReviewSerializer.setup_eager_loading(
+            Review.objects.filter(series=series), fields, required=('date',))
+        paginator = ReviewPagination()
+        page = paginator.paginate_queryset(reviews, request, view=self)
+        serializer = ReviewSerializer(page, many=True, fields=fields)
+        return paginator.get_paginated_response(serializer.data)
     
     # 2. Create
     # @swagger_auto_schema(request_body=ReviewSerializer)
@@ -177,19 +432,25 @@ class ReviewListApiView(APIView):
         #     'rating': request.data.get('rating'), 
         # }
         series = Series.objects.get(pk=series_pk)
+        already_reviewed = Response(
+            {"res": "You can't review a series more than once"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+        if Review.objects.filter(reviewer=request.user, series=series).exists():
+            return already_reviewed
 
-        review_list = series.reviews.all()
-        for review in review_list:
-            if review.reviewer == request.user:
-                return Response(
-                    {"res": "You can't review a series more than once"}, 
-                    status=status.HTTP_400_BAD_REQUEST
-                ) 
-    
         serializer = ReviewSerializer(data=request.data)
         if serializer.is_valid():
-            serializer.save(reviewer=request.user,series=series)
-            series.update()
+            try:
+                with transaction.atomic():
+                    review = serializer.save(reviewer=request.user,series=series)
+                    series.apply_rating_delta(review.rating, 1, 1)
+                    invalidate_series(series.pk)
+                    record_activity(series.pk, reviews=1)
+            except IntegrityError:
+                # A concurrent request got there first (unique_review).
+                return already_reviewed
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -198,16 +459,21 @@ class SeriesDetailApiView(APIView):
     
     permission_classes=[permissions.IsAuthenticatedOrReadOnly]
 
-    def get_object(self, series_pk):
+    def get_object(self, series_pk, lock=False):
         '''
-        Helper method to get the object with given series_id
+        Helper method to get the object with given series_id. With `lock`,
+        the row stays locked until the end of the transaction, so that the
+        rating sums saved with it can't overwrite a concurrent review or like.
         '''
+        series = Series.objects.select_for_update() if lock else Series.objects
         try:
-            return Series.objects.get(pk=series_pk)
+            return series.get(pk=series_pk)
         except Series.DoesNotExist:
             return None
   
     # 3. Retrieve
+    @conditional_series
+    @cache_response('series', 'series_pk')
     def get(self, request, series_pk, *args, **kwargs):
         '''
         Retrieves a series details given a series_id. No authentication is needed.
@@ -228,23 +494,25 @@ class SeriesDetailApiView(APIView):
         '''
         Updates a series details given a series_id. Requires authentication.
         '''
-        series_instance = self.get_object(series_pk)
-        if not series_instance:
-            return Response(
-                {"res": "Series does not exist"}, 
-                status=status.HTTP_400_BAD_REQUEST
-            )
-       
-        try:
-            request.data.pop("reviews")
-        except:
-            pass
-        serializer = SeriesSerializer(instance = series_instance, data=request.data, partial=True)
+        with transaction.atomic():
+            series_instance = self.get_object(series_pk, lock=True)
+            if not series_instance:
+                return Response(
+                    {"res": "Series does not exist"}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
 
-        if serializer.is_valid():
+            try:
+                request.data.pop("reviews")
+            except:
+                pass
+            serializer = SeriesSerializer(instance = series_instance, data=request.data, partial=True)
+
+            if not serializer.is_valid():
+                return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
             serializer.save()
-            return Response(serializer.data, status=status.HTTP_200_OK)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+            invalidate_series(series_instance.pk)
+        return Response(serializer.data, status=status.HTTP_200_OK)
 
     # 5. Delete
     def delete(self, request, series_pk, *args, **kwargs):
@@ -257,6 +525,7 @@ class SeriesDetailApiView(APIView):
                 {"res": "Series does not exist"}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
+        invalidate_series(series_instance.pk)
         series_instance.delete()
         return Response(
             {"res": "Series successfully deleted!"},
@@ -266,12 +535,15 @@ class SeriesDetailApiView(APIView):
 class ReviewDetailApiView(APIView):
     permission_classes = [IsOwnerOrReadOnly]
 
-    def get_object(self, review_pk):
+    def get_object(self, review_pk, lock=False):
         '''
-        Helper method to get the object with given a review_id
+        Helper method to get the object with given a review_id. With `lock`,
+        the row stays locked until the end of the transaction, so that its
+        likes (and so its weight) can't change under a write.
         '''
+        reviews = Review.objects.select_for_update() if lock else Review.objects
         try:
-            return Review.objects.get(pk=review_pk)
+            return reviews.get(pk=review_pk)
         except Review.DoesNotExist:
             return None
     def review_belongs_to_series(self, review_instance, series_pk):
@@ -285,6 +557,7 @@ class ReviewDetailApiView(APIView):
         else:
             return None
     # 3. Retrieve
+    @conditional_review
     def get(self, request, series_pk, review_pk, *args, **kwargs):
         '''
         Retrieves review details given a series_id and a review_id.
@@ -313,27 +586,30 @@ class ReviewDetailApiView(APIView):
         Review must belong to series. 
         Authentication: user must be the creator of the review.
         '''
-        review_instance = self.get_object(review_pk)
-        if not review_instance:
-            return Response(
-                {"res": "Review does not exist"}, 
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        series_instance=self.review_belongs_to_series(review_instance, series_pk)
-        if not series_instance:
-            return Response(
-                {"res": "Review does not belong to series"},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        self.check_object_permissions(request, review_instance)
-        
-        serializer = ReviewSerializer(instance = review_instance, data=request.data, partial=True)
-
-        if serializer.is_valid():
-            serializer.save()
-            series_instance.update()
-            return Response(serializer.data, status=status.HTTP_200_OK)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        with transaction.atomic():
+            review_instance = self.get_object(review_pk, lock=True)
+            if not review_instance:
+                return Response(
+                    {"res": "Review does not exist"}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            series_instance=self.review_belongs_to_series(review_instance, series_pk)
+            if not series_instance:
+                return Response(
+                    {"res": "Review does not belong to series"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            self.check_object_permissions(request, review_instance)
+
+            old_rating = review_instance.rating
+            serializer = ReviewSerializer(instance = review_instance, data=request.data, partial=True)
+            if not serializer.is_valid():
+                return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+            review = serializer.save()
+            series_instance.apply_rating_delta(
+                (review.rating - old_rating) * review.weight, 0)
+            invalidate_series(series_instance.pk)
+        return Response(serializer.data, status=status.HTTP_200_OK)
 
     # 5. Delete
     def delete(self, request, series_pk, review_pk, *args, **kwargs):
@@ -342,22 +618,26 @@ class ReviewDetailApiView(APIView):
         Review must belong to series.
         Authentication: user must be the creator of the review.
         '''
-        review_instance = self.get_object(review_pk)
-        if not review_instance:
-            return Response(
-                {"res": "Review does not exist"},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        series_instance=self.review_belongs_to_series(review_instance, series_pk)
-        if not series_instance:
-            return Response(
-                {"res": "Review does not belong to series"},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        self.check_object_permissions(request, review_instance)
+        with transaction.atomic():
+            review_instance = self.get_object(review_pk, lock=True)
+            if not review_instance:
+                return Response(
+                    {"res": "Review does not exist"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            series_instance=self.review_belongs_to_series(review_instance, series_pk)
+            if not series_instance:
+                return Response(
+                    {"res": "Review does not belong to series"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            self.check_object_permissions(request, review_instance)
 
-        review_instance.delete()
-        series_instance.update()
+            weight = review_instance.weight
+            series_instance.apply_rating_delta(-review_instance.rating * weight, -weight, -1)
+            review_instance.delete()
+            invalidate_series(series_instance.pk)
+            record_activity(series_instance.pk, reviews=-1)
 
         return Response(
             {"res": "Review successfully deleted!"},
@@ -369,10 +649,11 @@ class ReviewLikeListApiView(APIView):
     permission_classes = [permissions.IsAuthenticated]
     def get_object(self, review_pk):
         '''
-        Helper method to get the object given a review_id
+        Helper method to get the object given a review_id, locked until the
+        end of the transaction so that likes of a review are serialized.
         '''
         try:
-            return Review.objects.get(pk=review_pk)
+            return Review.objects.select_for_update().get(pk=review_pk)
         except Review.DoesNotExist:
             return None
     def review_belongs_to_series(self, review_instance, series_pk):
@@ -381,42 +662,49 @@ class ReviewLikeListApiView(APIView):
         review object (instance). Returns the series object (instance) if True and None otherwise.
         '''
         series_instance=Series.objects.get(pk=series_pk)
-        if review_instance.series == series_instance:
+        if review_instance.series_id == series_instance.pk:
             return series_instance
         else:
             return None
+    def is_liked(self, review_instance, user):
+        '''
+        Indexed EXISTS on the likes table, instead of loading every liker.
+        '''
+        return Review.likes.through.objects.filter(
+            review=review_instance, user=user).exists()
     # 4. Update
     def put(self, request, series_pk,review_pk, format=None,*args, **kwargs,):
         '''
         Likes a review. Authentication is needed.
         Request body must be empty.
         '''
-        review_instance = self.get_object(review_pk)
-        if not review_instance:
-            return Response(
-                {"res": "Review does not exist"}, 
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        series_instance=self.review_belongs_to_series(review_instance, series_pk)
-        if not series_instance:
-            return Response(
-                {"res": "Review does not belong to series"},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        elif request.user in review_instance.likes.all():
-            return Response(
-                {"res": "You have already liked this review"}, 
-                status=status.HTTP_400_BAD_REQUEST
-            )
+        with transaction.atomic():
+            review_instance = self.get_object(review_pk)
+            if not review_instance:
+                return Response(
+                    {"res": "Review does not exist"}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            series_instance=self.review_belongs_to_series(review_instance, series_pk)
+            if not series_instance:
+                return Response(
+                    {"res": "Review does not belong to series"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            elif self.is_liked(review_instance, request.user):
+                return Response(
+                    {"res": "You have already liked this review"}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
 
-        review_instance.likes.add(request.user) 
-        series_instance.update()
-        serializer = ReviewSerializer(review_instance)
+            Review.likes.through.objects.create(review=review_instance, user=request.user)
+            Review.objects.filter(pk=review_instance.pk).update(
+                likes_count=F('likes_count') + 1, **Review.touched())
+            series_instance.apply_rating_delta(review_instance.rating, 1)
+            invalidate_series(series_instance.pk)
+            record_activity(series_instance.pk, likes=1)
         return Response(
-            {
-                "res": "Successfully liked this review!",
-                # "body": serializer.data
-            },
+            {"res": "Successfully liked this review!"},
             status=status.HTTP_200_OK)
 
 class ReviewUnlikeListApiView(APIView):
@@ -424,10 +712,11 @@ class ReviewUnlikeListApiView(APIView):
     permission_classes = [permissions.IsAuthenticated]
     def get_object(self, review_pk):
         '''
-        Helper method to get the object given a review_id
+        Helper method to get the object given a review_id, locked until the
+        end of the transaction so that likes of a review are serialized.
         '''
         try:
-            return Review.objects.get(pk=review_pk)
+            return Review.objects.select_for_update().get(pk=review_pk)
         except Review.DoesNotExist:
             return None
     def review_belongs_to_series(self, review_instance, series_pk):
@@ -436,112 +725,225 @@ class ReviewUnlikeListApiView(APIView):
         review object (instance). Returns the series object (instance) if True and None otherwise.
         '''
         series_instance=Series.objects.get(pk=series_pk)
-        if review_instance.series == series_instance:
+        if review_instance.series_id == series_instance.pk:
             return series_instance
         else:
             return None
+    def is_liked(self, review_instance, user):
+        '''
+        Indexed EXISTS on the likes table, instead of loading every liker.
+        '''
+        return Review.likes.through.objects.filter(
+            review=review_instance, user=user).exists()
     # 4. Update
     def put(self, request, series_pk,review_pk, format=None,*args, **kwargs,):
         '''
         Unlikes a review. Authentication is needed.
         Request body must be empty.
         '''
-        review_instance = self.get_object(review_pk)
-        if not review_instance:
+        with transaction.atomic():
+            review_instance = self.get_object(review_pk)
+            if not review_instance:
+                return Response(
+                    {"res": "Review does not exist"}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            series_instance=self.review_belongs_to_series(review_instance, series_pk)
+            if not series_instance:
+                return Response(
+                    {"res": "Review does not belong to series"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            elif not self.is_liked(review_instance, request.user):
+                return Response(
+                    {"res": "Review not in your liked list"}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+            Review.likes.through.objects.filter(review=review_instance, user=request.user).delete()
+            Review.objects.filter(pk=review_instance.pk).update(
+                likes_count=F('likes_count') - 1, **Review.touched())
+            series_instance.apply_rating_delta(-review_instance.rating, -1)
+            invalidate_series(series_instance.pk)
+            record_activity(series_instance.pk, likes=-1)
+        return Response(
+            {"res": "Successfully unliked this review!"},
+            status=status.HTTP_200_OK)
+
+class CacheStatsApiView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        '''
+        Retrieves the response cache counters of the worker serving the request.
+        Requires admin authentication.
+        '''
+        return Response(cache_stats(), status=status.HTTP_200_OK)
+
+
+class MetricsApiView(APIView):
+    permission_classes = [permissions.IsAdminUser | HasMetricsToken]
+
+    def get(self, request, *args, **kwargs):
+        '''
+        Retrieves the request histograms of the worker serving the request, in
+        the Prometheus text format. Requires admin authentication or the
+        METRICS_TOKEN as a bearer token.
+        '''
+        return HttpResponse(exposition(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+class ExportApiView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+    renderer_classes = [JSONLinesRenderer, CSVRenderer]
+    # Set by each export: the rows, their columns and the file name.
+    queryset = None
+    columns = None
+    name = None
+
+    def get_queryset(self):
+        # .all(): a fresh queryset per request, as DRF's generic views do.
+        return self.queryset.all()
+
+    def get(self, request, *args, **kwargs):
+        '''
+        Streams every row as JSONL (?format=jsonl, the default) or CSV
+        (?format=csv), or only the rows changed since a date (?since=).
+        Requires admin authentication.
+        '''
+        queryset = self.get_queryset()
+        since = request.query_params.get('since', None)
+        if since is not None:
+            since_date = parse_since(since)
+            if since_date is None:
+                return Response(
+                    {"res": f"/{since}/ is not a valid date"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            queryset = queryset.filter(updated_at__gte=since_date)
+        return export_response(request, queryset, self.columns, self.name)
+
+class SeriesExportApiView(ExportApiView):
+    queryset = Series.objects.all()
+    columns = SERIES_COLUMNS
+    name = 'series'
+
+class ReviewExportApiView(ExportApiView):
+    queryset = Review.objects.all()
+    columns = REVIEW_COLUMNS
+    name = 'reviews'
+
+    def get_queryset(self):
+        # ?series= narrows the export to the reviews of one series.
+        reviews = super().get_queryset()
+        series_pk = self.request.query_params.get('series', None)
+        if series_pk is not None:
+            reviews = reviews.filter(series_id=series_pk) if series_pk.isdigit() else reviews.none()
+        return reviews
+
+class LikedReviewListApiView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        '''
+        Retrieves reviews liked by authenticated user, one page at a time.
+        '''
+        try:
+            fields = ReviewSerializer.sparse_fields(request.query_params)
+        except ValueError as error:
             return Response(
-                {"res": "Review does not exist"}, 
+                {"res": f"/{error}/ is not a valid field"},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        series_instance=self.review_belongs_to_series(review_instance, series_pk)
-        if not series_instance:
+        user = request.user
+        series_list = ReviewSerializer.setup_eager_loading(
+            user.liked.all(), fields, required=('date',))
+        paginator = ReviewPagination()
+        page = paginator.paginate_queryset(series_list, request, view=self)
+        serializer = ReviewSerializer(page, many=True, fields=fields)
+        return paginator.get_paginated_response(serializer.data)
+
+    # Batch version of the "like"/"unlike" endpoints, for clients syncing
+    # many likes at once.
+    max_batch_size = 1000
+
+    def put(self, request, *args, **kwargs):
+        '''
+        Likes and unlikes many reviews at once. Authentication is needed.
+        Body: {"like": [review ids], "unlike": [review ids]}. Reviews already
+        (un)liked are left as they are; ids of reviews that don't exist are
+        returned under "not_found".
+        '''
+        if not isinstance(request.data, dict):
             return Response(
-                {"res": "Review does not belong to series"},
+                {"res": "Body must be an object with /like/ and /unlike/ lists"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        ids = {}
+        for key in ("like", "unlike"):
+            value = request.data.get(key, [])
+            if not isinstance(value, list) or not all(
+                    isinstance(pk, int) and not isinstance(pk, bool) for pk in value):
+                return Response(
+                    {"res": f"/{key}/ must be a list of review ids"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            ids[key] = set(value)
+        if not ids["like"] and not ids["unlike"]:
+            return Response(
+                {"res": "Body must have a /like/ or /unlike/ list"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if ids["like"] & ids["unlike"]:
+            return Response(
+                {"res": "A review cannot be liked and unliked at once"},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        elif request.user not in review_instance.likes.all():
+        if len(ids["like"]) + len(ids["unlike"]) > self.max_batch_size:
             return Response(
-                {"res": "Review not in your liked list"}, 
+                {"res": f"At most {self.max_batch_size} reviews per request"},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        review_instance.likes.remove(request.user) 
-        series_instance.update()
-        serializer = ReviewSerializer(review_instance)
+        Like = Review.likes.through
+        with transaction.atomic():
+            # Locking the reviews serializes concurrent batches touching them.
+            # Rows are locked in pk order, here and below for the series, so
+            # that two batches can't each hold a lock the other waits for.
+            reviews = {
+                pk: (series_pk, rating) for pk, series_pk, rating in
+                Review.objects.select_for_update().filter(pk__in=ids["like"] | ids["unlike"])
+                .order_by('pk').values_list('pk', 'series_id', 'rating')
+            }
+            liked = set(Like.objects.filter(
+                user=request.user, review__in=reviews).values_list('review_id', flat=True))
+            to_like = sorted((ids["like"] & reviews.keys()) - liked)
+            to_unlike = sorted(ids["unlike"] & liked)
+
+            Like.objects.bulk_create(
+                [Like(user=request.user, review_id=pk) for pk in to_like])
+            Like.objects.filter(user=request.user, review__in=to_unlike).delete()
+            Review.objects.filter(pk__in=to_like).update(
+                likes_count=F('likes_count') + 1, **Review.touched())
+            Review.objects.filter(pk__in=to_unlike).update(
+                likes_count=F('likes_count') - 1, **Review.touched())
+
+            # Each affected series gets its rating updated once.
+            deltas = {}
+            for sign, pks in ((1, to_like), (-1, to_unlike)):
+                for pk in pks:
+                    series_pk, rating = reviews[pk]
+                    rating_sum, rating_weight = deltas.get(series_pk, (0, 0))
+                    deltas[series_pk] = (rating_sum + sign * rating, rating_weight + sign)
+            for series_pk, (rating_sum, rating_weight) in sorted(deltas.items()):
+                Series(pk=series_pk).apply_rating_delta(rating_sum, rating_weight)
+                invalidate_series(series_pk)
+                record_activity(series_pk, likes=rating_weight)
+
         return Response(
             {
-                "res": "Successfully unliked this review!",
-                # "body": serializer.data
+                "res": "Successfully updated your likes!",
+                "liked": to_like,
+                "unliked": to_unlike,
+                "not_found": sorted((ids["like"] | ids["unlike"]) - reviews.keys()),
             },
             status=status.HTTP_200_OK)
-
-class LikedReviewListApiView(APIView):
-    permission_classes = [permissions.IsAuthenticated]
-
-    def get(self, request, *args, **kwargs):
-        '''
-        Retrieves reviews liked by authenticated user.
-        '''
-        user = request.user
-        series_list = user.liked
-        serializer = ReviewSerializer(series_list, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
-
-    # Aditional method that replicates the "like"/"Unlike" requests from another endpoint.
-
-    # # 2. Create
-    # def put(self, request, *args, **kwargs):
-    #     '''
-    #     Create the Todo with given todo data
-    #     '''
-        
-    #     if list(request.data.keys())[0] == "like":
-    #         review_instance=Review.objects.get(pk=request.data["like"])
-    #         if not review_instance:
-    #             return Response(
-    #                 {"res": "Reviewdoes not exist"}, 
-    #                 status=status.HTTP_400_BAD_REQUEST
-    #             )
-    #         if request.user in review_instance.likes.all():
-    #             return Response(
-    #                 {"res": "You have already liked this review"}, 
-    #                 status=status.HTTP_400_BAD_REQUEST
-    #             )
-    #         request.user.liked.add(review_instance)
-    #         series_instance = Series.objects.get(pk=review_instance.series.pk)
-    #         series_instance.update()
-
-    #         serializer = ReviewSerializer(review_instance)
-    #         return Response(
-    #         {
-    #             "res": "Successfully liked this review!",
-    #             "body": serializer.data
-    #         },
-    #         status=status.HTTP_200_OK)
-    #     elif list(request.data.keys())[0] == "unlike":
-    #         review_instance=Review.objects.get(pk=request.data["unlike"])
-    #         if not review_instance:
-    #             return Response(
-    #                 {"res": "Review pk does not exist"}, 
-    #                 status=status.HTTP_400_BAD_REQUEST
-    #             )
-    #         if request.user not in review_instance.likes.all():
-    #             return Response(
-    #                 {"res": "Review not in your liked list"}, 
-    #                 status=status.HTTP_400_BAD_REQUEST
-    #             )
-    #         request.user.liked.remove(review_instance)
-    #         series_instance = Series.objects.get(pk=review_instance.series.pk)
-    #         series_instance.update()
-
-    #         serializer = ReviewSerializer(review_instance)
-    #         return Response(
-    #         {
-    #             "res": "Successfully liked this review!",
-    #             "body": serializer.data
-    #         },
-    #         status=status.HTTP_200_OK)
-    #     else:
-    #         return Response(
-    #             {"res": "Body key must be either /like/ or /unlike/"}, 
-    #             status=status.HTTP_400_BAD_REQUEST
-    #         )